@@ -33,6 +33,7 @@ from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
 from instance.models.rabbitmq_server import RabbitMQServer
 from instance.models.server import OpenStackServer
+from instance.models.task_timing import PlaybookTaskTiming
 
 
 # ModelAdmins #################################################################
@@ -41,6 +42,11 @@ class LogEntryAdmin(admin.ModelAdmin): # pylint: disable=missing-docstring
     list_display = ('created', 'level', 'text', 'modified')
 
 
+class PlaybookTaskTimingAdmin(admin.ModelAdmin): # pylint: disable=missing-docstring
+    list_display = ('created', 'playbook', 'task', 'host', 'status', 'duration')
+    list_filter = ('playbook', 'status')
+
+
 class OpenStackServerAdmin(admin.ModelAdmin): # pylint: disable=missing-docstring
     list_display = ('openstack_id', 'status', 'created', 'modified')
     # TODO: Is there a way to link back to the owning AppServer? (efficiently)
@@ -112,6 +118,7 @@ class LoadBalancingServerAdmin(admin.ModelAdmin): # pylint: disable=missing-docs
 
 
 admin.site.register(LogEntry, LogEntryAdmin)
+admin.site.register(PlaybookTaskTiming, PlaybookTaskTimingAdmin)
 admin.site.register(OpenStackServer, OpenStackServerAdmin)
 admin.site.register(InstanceReference, InstanceReferenceAdmin)
 admin.site.register(InstanceTag, InstanceTagAdmin)
@@ -22,12 +22,18 @@ Ansible - Helper functions
 
 # Imports #####################################################################
 
-from contextlib import contextmanager
+from collections import deque
+from contextlib import contextmanager, ExitStack
+import fcntl
+import gzip
+import hashlib
+import json
 import logging
 import os
+from shlex import quote
 import shutil
 import subprocess
-from tempfile import mkdtemp, NamedTemporaryFile
+from tempfile import mkdtemp, NamedTemporaryFile, TemporaryFile
 import yaml
 
 from django.conf import settings
@@ -40,8 +46,36 @@ from instance.utils import poll_streams
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Directory of the Ansible callback plugins shipped with this project
+CALLBACK_PLUGINS_PATH = os.path.join(settings.SITE_ROOT, 'playbooks/callback_plugins')
+
+# Name of the callback plugin which writes the task timing events
+TASK_TIMING_CALLBACK = 'opencraft_task_timing'
+
+# Safe YAML loader, using the C-accelerated libyaml parser when PyYAML was built with it
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 # Functions ###################################################################
 
+def parse_yaml(string):
+    """
+    Return the data parsed from the given YAML string, or an empty dict if the string is empty
+    """
+    if not string:
+        return {}
+    return yaml.load(string, Loader=YAMLLoader) or {}
+
+
+def dump_yaml(data):
+    """
+    Return the YAML representation of the given data, in block style
+    """
+    return yaml.dump(data, Dumper=YAMLDumper, default_flow_style=False)
+
+
 def load_yaml(string):
     """
     Return the dict parsed from the given yaml string.
@@ -81,6 +115,23 @@ def dict_merge(dict1, dict2):
     return dict1
 
 
+def dict_diff(dict1, dict2, prefix=''):
+    """
+    Return the sorted list of the keys whose values differ between the two dicts, recursively
+
+    Nested keys are joined with dots, e.g. 'EDXAPP_LMS_ENV_EXTRA.FEATURES'.
+    """
+    changed_keys = []
+    for key in set(dict1) | set(dict2):
+        path = '{}{}'.format(prefix, key)
+        value1, value2 = dict1.get(key), dict2.get(key)
+        if key in dict1 and key in dict2 and isinstance(value1, dict) and isinstance(value2, dict):
+            changed_keys.extend(dict_diff(value1, value2, prefix=path + '.'))
+        elif key not in dict1 or key not in dict2 or value1 != value2:
+            changed_keys.append(path)
+    return sorted(changed_keys)
+
+
 def string_to_file_path(string, root_dir=None):
     """
     Store a string in a temporary file
@@ -106,24 +157,139 @@ def create_temp_dir():
             shutil.rmtree(temp_dir)
 
 
-def render_sandbox_creation_command(
-        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path):
+def get_venv_cache_path(requirements_path):
     """
-    Renders the shell command used to create the sandbox
+    Return the path of the cached virtualenv for the given requirements file, which depends on the
+    content of the file and on the Python interpreter used by Ansible
     """
+    digest = hashlib.sha256()
+    digest.update(settings.ANSIBLE_PYTHON_PATH.encode())
+    digest.update(b'\0')
+    with open(requirements_path, 'rb') as requirements_file:
+        digest.update(requirements_file.read())
+    return os.path.join(settings.ANSIBLE_VENV_CACHE_DIR, digest.hexdigest()[:32])
 
-    venv_python_path = os.path.join(venv_path, 'bin/python')
+
+def get_venv_lock_path(venv_path):
+    """
+    Return the path of the lock file of the given cached virtualenv - see prune_venv_cache()
+    """
+    return venv_path + '.lock'
+
+
+def prune_venv_cache():
+    """
+    Delete the least recently used cached virtualenvs, keeping the `ANSIBLE_VENV_CACHE_SIZE` most
+    recently used ones. Virtualenvs which are being built or used are kept too.
+
+    Each virtualenv has a lock file next to it, which is held in shared mode while the virtualenv is
+    used, and upgraded to exclusive mode while it's built. The lock file of a deleted virtualenv is
+    deleted along with it, so the processes locking a virtualenv check that their lock file is still
+    the current one - see render_cached_venv_build_command().
+    """
+    cache_dir = settings.ANSIBLE_VENV_CACHE_DIR
+    venvs = []
+    for name in os.listdir(cache_dir):
+        venv_path = os.path.join(cache_dir, name)
+        try:
+            if os.path.isdir(venv_path):
+                venvs.append((os.path.getmtime(venv_path), venv_path))
+        except FileNotFoundError:
+            continue  # Deleted by another process in the meantime
+    venvs.sort(reverse=True)
+    for dummy, venv_path in venvs[settings.ANSIBLE_VENV_CACHE_SIZE:]:
+        delete_cached_venv(venv_path)
+
+
+def delete_cached_venv(venv_path):
+    """
+    Delete the given cached virtualenv and its lock file, unless the virtualenv is locked
+    """
+    venv_lock_path = get_venv_lock_path(venv_path)
+    with open(venv_lock_path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The lock file might have been deleted by another process in the meantime
+            if not os.path.samestat(os.fstat(lock_file.fileno()), os.stat(venv_lock_path)):
+                return
+        except (BlockingIOError, FileNotFoundError):
+            return
+        logger.info('Deleting the cached virtualenv %s', venv_path)
+        shutil.rmtree(venv_path, ignore_errors=True)
+        os.remove(venv_lock_path)
+
+
+def render_venv_creation_commands(requirements_path, venv_path):
+    """
+    Renders the shell commands used to create a virtualenv and install the given requirements in it
+    """
     create_venv_cmd = 'virtualenv -p {python_path} {venv_path}'.format(
         python_path=settings.ANSIBLE_PYTHON_PATH,
         venv_path=venv_path,
     )
 
     install_requirements_cmd = '{python} -u {pip} install -r {requirements_path}'.format(
-        python=venv_python_path,
+        python=os.path.join(venv_path, 'bin/python'),
         pip=os.path.join(venv_path, 'bin/pip'),
         requirements_path=requirements_path,
     )
 
+    return [create_venv_cmd, install_requirements_cmd]
+
+
+def render_cached_venv_build_command(requirements_path, venv_path, venv_lock_fd):
+    """
+    Renders the shell command used to build the cached virtualenv `venv_path`, unless it's already
+    complete, and to lock it in shared mode for the following commands
+
+    `venv_lock_fd` is a file descriptor of the lock file of the virtualenv, open in the process
+    running the command. A single lock is held on it throughout: the shared lock is only upgraded
+    to an exclusive one while the virtualenv is built, and since flock() doesn't upgrade or
+    downgrade locks atomically, the virtualenv is checked again after each of them. The command
+    fails if the lock file was deleted by prune_venv_cache() in the meantime.
+    """
+    create_venv_cmd, install_requirements_cmd = render_venv_creation_commands(requirements_path, venv_path)
+    marker_path = os.path.join(venv_path, '.complete')
+    check_lock_cmd = 'test {lock_path} -ef /proc/self/fd/{fd}'.format(
+        lock_path=get_venv_lock_path(venv_path),
+        fd=venv_lock_fd,
+    )
+    shared_lock_cmd = 'flock -s {fd} && {check_lock}'.format(fd=venv_lock_fd, check_lock=check_lock_cmd)
+    build_venv_cmd = 'test -e {marker} || {{ rm -rf {venv_path} && {create} && {install} && touch {marker}; }}'.format(
+        marker=marker_path,
+        venv_path=venv_path,
+        create=create_venv_cmd,
+        install=install_requirements_cmd,
+    )
+    fail_cmd = '{{ echo {message} >&2; exit 1; }}'.format(
+        message=quote('Unable to lock or build the virtualenv {}'.format(venv_path)),
+    )
+    return (
+        '{shared_lock} || {fail}; '
+        'while ! test -e {marker}; do '
+        'flock {fd} && {check_lock} && {{ {build}; }} && {shared_lock} || {fail}; '
+        'done'
+    ).format(
+        fail=fail_cmd,
+        shared_lock=shared_lock_cmd,
+        marker=marker_path,
+        fd=venv_lock_fd,
+        check_lock=check_lock_cmd,
+        build=build_venv_cmd,
+    )
+
+
+def render_sandbox_creation_command(
+        requirements_path, inventory_path, vars_path, playbook_name, remote_username, venv_path, venv_lock_fd=None):
+    """
+    Renders the shell command used to create the sandbox
+
+    When `venv_lock_fd` is given, `venv_path` is a cached virtualenv, which is only built if it
+    isn't complete yet - see render_cached_venv_build_command() about the locking.
+    """
+
+    venv_python_path = os.path.join(venv_path, 'bin/python')
+
     run_playbook_cmd = '{python} -u {ansible} -i {inventory_path} -e @{vars_path} -u {user} {playbook}'.format(
         python=venv_python_path,
         ansible=os.path.join(venv_path, 'bin/ansible-playbook'),
@@ -133,91 +299,402 @@ def render_sandbox_creation_command(
         playbook=playbook_name,
     )
 
-    return ' && '.join([create_venv_cmd, install_requirements_cmd, run_playbook_cmd])
+    if venv_lock_fd is None:
+        return ' && '.join(render_venv_creation_commands(requirements_path, venv_path) + [run_playbook_cmd])
+
+    return '{build} && {run}'.format(
+        build=render_cached_venv_build_command(requirements_path, venv_path, venv_lock_fd),
+        run=run_playbook_cmd,
+    )
+
+
+def get_cached_venv(requirements_path):
+    """
+    Return the path of the cached virtualenv to use for the given requirements file, and the path
+    of its lock file, after marking it as recently used and pruning the cache
+    """
+    os.makedirs(settings.ANSIBLE_VENV_CACHE_DIR, exist_ok=True)
+    venv_path = get_venv_cache_path(requirements_path)
+    if os.path.exists(venv_path):
+        os.utime(venv_path)
+    prune_venv_cache()
+    return venv_path, get_venv_lock_path(venv_path)
+
+
+def prepare_virtualenv(requirements_path):
+    """
+    Build the cached virtualenv for the given requirements file ahead of time, so that a later
+    run_playbook() call with the same requirements doesn't have to
+
+    Does nothing when the virtualenv cache is disabled. Returns True if the virtualenv is ready;
+    failures are only logged, since run_playbook() retries to build incomplete virtualenvs.
+    """
+    if not settings.ANSIBLE_VENV_CACHE_DIR:
+        return False
+    venv_path, venv_lock_path = get_cached_venv(requirements_path)
+    with open(venv_lock_path, 'a') as venv_lock_file:
+        cmd = render_cached_venv_build_command(requirements_path, venv_path, venv_lock_file.fileno())
+        logger.info('Running: %s', cmd)
+        process = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(requirements_path),
+            shell=True,
+            pass_fds=(venv_lock_file.fileno(),),
+        )
+    if process.returncode != 0:
+        logger.warning(
+            'Unable to prepare the virtualenv %s (exit code %s):\n%s',
+            venv_path, process.returncode, process.stdout.decode('utf-8', errors='replace'),
+        )
+        return False
+    return True
+
+
+def get_ansible_config_environment(playbook_name, tmp_dir):
+    """
+    Return the environment variables used to configure Ansible for a run of the given playbook
+
+    Ansible settings are passed as environment variables rather than as a generated `ansible.cfg`
+    file, since those override the settings from the `ansible.cfg` file of the playbook repository
+    without replacing it. The SSH control sockets are kept in `tmp_dir`, and the variables from
+    `ANSIBLE_CONFIG_OVERRIDES[playbook_name]` take precedence over the default settings.
+    """
+    env = {
+        # Disable SSH host key checking by Ansible – since IP addresses are constantly reused,
+        # changing host keys are expected.
+        'ANSIBLE_HOST_KEY_CHECKING': 'false',
+        'ANSIBLE_PIPELINING': str(settings.ANSIBLE_PIPELINING).lower(),
+        'ANSIBLE_SSH_ARGS': settings.ANSIBLE_SSH_ARGS,
+        'ANSIBLE_SSH_CONTROL_PATH_DIR': os.path.join(tmp_dir, 'cp'),
+        'ANSIBLE_FORKS': str(settings.ANSIBLE_FORKS),
+    }
+    if settings.ANSIBLE_FACT_CACHE_DIR:
+        env.update({
+            'ANSIBLE_GATHERING': 'smart',
+            'ANSIBLE_CACHE_PLUGIN': 'jsonfile',
+            'ANSIBLE_CACHE_PLUGIN_CONNECTION': settings.ANSIBLE_FACT_CACHE_DIR,
+            'ANSIBLE_CACHE_PLUGIN_TIMEOUT': str(settings.ANSIBLE_FACT_CACHE_TIMEOUT),
+        })
+    overrides = settings.ANSIBLE_CONFIG_OVERRIDES.get(playbook_name, {})
+    env.update((name, str(value)) for name, value in overrides.items())
+    return env
 
 
 @contextmanager
-def run_playbook(requirements_path, inventory_str, vars_str, playbook_path, playbook_name, username='root'):
+def prepare_playbook(
+        requirements_path, inventory_str, vars_str, playbook_path, playbook_name, username='root', task_events_fd=None
+):
     """
-    Runs ansible-playbook in a dedicated venv
+    Prepares a run of ansible-playbook in a dedicated venv, and yields the shell command to run along
+    with the keyword arguments to start it with - see run_playbook()
 
     Ansible only supports Python 2 - so we have to run it as a separate command, in its own venv
+
+    When `task_events_fd` is given, the task timing callback plugin is enabled, and writes its events
+    to that file descriptor - see `capture_playbook_output()`.
     """
 
-    with create_temp_dir() as ansible_tmp_dir:
+    with create_temp_dir() as ansible_tmp_dir, ExitStack() as stack:
 
-        vars_path = string_to_file_path(vars_str, root_dir=ansible_tmp_dir)
-        inventory_path = string_to_file_path(inventory_str, root_dir=ansible_tmp_dir)
-        venv_path = os.path.join(ansible_tmp_dir, 'venv')
+        pass_fds = []
+        if settings.ANSIBLE_VENV_CACHE_DIR:
+            # Reuse the virtualenv built for the same requirements, if any. The playbook process
+            # locks it through a file descriptor of its lock file, kept open until the process exits.
+            venv_path, venv_lock_path = get_cached_venv(requirements_path)
+            venv_lock_fd = stack.enter_context(open(venv_lock_path, 'a')).fileno()
+            pass_fds.append(venv_lock_fd)
+        else:
+            venv_path = os.path.join(ansible_tmp_dir, 'venv')
+            venv_lock_fd = None
 
         cmd = render_sandbox_creation_command(
             requirements_path=requirements_path,
-            inventory_path=inventory_path,
-            vars_path=vars_path,
+            inventory_path=string_to_file_path(inventory_str, root_dir=ansible_tmp_dir),
+            vars_path=string_to_file_path(vars_str, root_dir=ansible_tmp_dir),
             playbook_name=playbook_name,
             remote_username=username,
-            venv_path=venv_path
+            venv_path=venv_path,
+            venv_lock_fd=venv_lock_fd,
         )
 
-        logger.info('Running: %s', cmd)
-
         # Override TMPDIR environmental variable so any temp files created by ansible (and anything else)
         # are created in a directory that we will safely delete after this command exits
         env = dict(os.environ)
         env['TMPDIR'] = ansible_tmp_dir
+        env.update(get_ansible_config_environment(playbook_name, ansible_tmp_dir))
 
-        # Disable SSH host key checking by Ansible – since IP addresses are constantly reused,
-        # changing host keys are expected.
-        env['ANSIBLE_HOST_KEY_CHECKING'] = 'false'
+        if task_events_fd is not None:
+            env['ANSIBLE_CALLBACK_PLUGINS'] = CALLBACK_PLUGINS_PATH
+            env['ANSIBLE_CALLBACK_WHITELIST'] = TASK_TIMING_CALLBACK
+            env['OPENCRAFT_TASK_EVENTS_FD'] = str(task_events_fd)
+            pass_fds.append(task_events_fd)
 
-        yield subprocess.Popen(
+        yield cmd, {'cwd': playbook_path, 'env': env, 'pass_fds': pass_fds}
+
+
+@contextmanager
+def run_playbook(*args, **kwargs):
+    """
+    Runs ansible-playbook in a dedicated venv - see prepare_playbook() about the arguments
+
+    Yields the `subprocess.Popen` object of the playbook process. The process is killed if it's still
+    running on exit, and its temporary files are deleted.
+    """
+    with prepare_playbook(*args, **kwargs) as (cmd, popen_kwargs):
+        logger.info('Running: %s', cmd)
+        process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             bufsize=1, # Buffer one line at a time
-            cwd=playbook_path,
             shell=True,
-            env=env,
+            **popen_kwargs
         )
+        try:
+            yield process
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+
+def handle_task_event(task_event_handler, line):
+    """
+    Pass the task event written by the task timing callback plugin on the given line to `task_event_handler`
+    """
+    try:
+        event = json.loads(line.decode('utf-8'))
+    except ValueError:
+        logger.warning('Invalid task event: %r', line)
+        return
+    task_event_handler(event)
 
 
 def capture_playbook_output(
-        requirements_path, inventory_str, vars_str, playbook_path, username='root', logger_=None, collect_logs=False
+        requirements_path, inventory_str, vars_str, playbook_path, username='root', **output_options
 ):
     """
     Convenience wrapper for run_playbook() that captures the output of the playbook run.
+
+    The output options - `logger_`, `collect_logs`, `log_collector` and `task_event_handler` - are
+    those of `PlaybookOutput`, which handles the output. The return code of the playbook is returned,
+    along with the collected lines of output when `collect_logs` is set - or with the log collector,
+    when one is given.
     """
-    with run_playbook(
-        requirements_path=requirements_path,
-        inventory_str=inventory_str,
-        vars_str=vars_str,
-        playbook_path=os.path.dirname(playbook_path),
-        playbook_name=os.path.basename(playbook_path),
-        username=username,
-    ) as process:
-        try:
-            log_line_generator = poll_streams(
-                process.stdout,
-                process.stderr,
-                line_timeout=settings.ANSIBLE_LINE_TIMEOUT,
-                global_timeout=settings.ANSIBLE_GLOBAL_TIMEOUT,
-            )
-            log_lines = []
-            for f, line in log_line_generator:
-                line = line.decode('utf-8').rstrip()
-                if logger_ is not None:
-                    if f == process.stdout:
-                        logger_.info(line)
-                    elif f == process.stderr:
-                        logger_.error(line)
-                if collect_logs:
-                    log_lines.append(line)
-        except TimeoutError:
-            if logger_ is not None:
-                logger_.error('Playbook run timed out.  Terminating the Ansible process.')
-            process.terminate()
-        process.wait()
-        if collect_logs:
-            return log_lines, process.returncode
-        else:
-            return process.returncode
+    with PlaybookOutput(**output_options) as output:
+        with run_playbook(
+            requirements_path=requirements_path,
+            inventory_str=inventory_str,
+            vars_str=vars_str,
+            playbook_path=os.path.dirname(playbook_path),
+            playbook_name=os.path.basename(playbook_path),
+            username=username,
+            task_events_fd=output.task_events_fd,
+        ) as process:
+            try:
+                output.read(process)
+            except TimeoutError:
+                output.log_error('Playbook run timed out.  Terminating the Ansible process.')
+                process.terminate()
+            process.wait()
+        return output.get_result(process.returncode)
+
+
+# Classes #####################################################################
+
+class PlaybookLogCollector:
+    """
+    Collects the output lines of playbook runs with a bounded memory use
+
+    Only the last `max_lines` lines (`ANSIBLE_LOG_COLLECT_LINES` by default) are kept in memory, and
+    iterating over the collector returns them. All the lines are also streamed to an anonymous
+    gzip-compressed temporary file, which is deleted once the collector is closed or garbage collected.
+    """
+    def __init__(self, max_lines=None):
+        if max_lines is None:
+            max_lines = settings.ANSIBLE_LOG_COLLECT_LINES
+        self.tail = deque(maxlen=max_lines)
+        self.line_count = 0
+        self._file = TemporaryFile()
+        self._gzip_file = gzip.GzipFile(fileobj=self._file, mode='wb', compresslevel=6)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.tail)
+
+    def __len__(self):
+        return len(self.tail)
+
+    def append(self, line):
+        """
+        Collect a line
+        """
+        self.tail.append(line)
+        self._gzip_file.write(line.encode('utf-8') + b'\n')
+        self.line_count += 1
+
+    def extend(self, lines):
+        """
+        Collect several lines
+        """
+        for line in lines:
+            self.append(line)
+
+    @property
+    def truncated(self):
+        """
+        Whether some of the collected lines are no longer kept in memory
+        """
+        return self.line_count > len(self.tail)
+
+    def get_compressed_size(self):
+        """
+        Return the size of the gzip-compressed log of all the collected lines
+
+        No more lines can be collected afterwards.
+        """
+        if not self._gzip_file.closed:
+            self._gzip_file.close()
+        self._file.seek(0, os.SEEK_END)
+        return self._file.tell()
+
+    def get_compressed_log(self):
+        """
+        Return the gzip-compressed log of all the collected lines, as bytes
+
+        No more lines can be collected afterwards.
+        """
+        self.get_compressed_size()
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        """
+        Delete the compressed log
+        """
+        self._gzip_file.close()
+        self._file.close()
+
+
+class PlaybookOutput:
+    """
+    Handles the output of a playbook process - see capture_playbook_output()
+
+    Each line of output is passed to `logger_`, which can be a logger or any object with `info()` and
+    `error()` methods, like `instance.logging.PlaybookOutputSink`. When `collect_logs` is set, the last
+    `ANSIBLE_LOG_COLLECT_LINES` lines are collected too. When `log_collector` is given, typically a
+    `PlaybookLogCollector`, the lines are collected there instead, e.g. to collect the output of several
+    playbook runs.
+
+    When `task_event_handler` is given, it's called with a dict for each task result - with the `task`
+    name, `host`, `status` and `duration` in seconds - which the task timing callback plugin sends
+    through a pipe. `task_events_fd` is the write end of that pipe, for the playbook process. The pipe
+    is closed on exit.
+    """
+    def __init__(self, logger_=None, collect_logs=False, log_collector=None, task_event_handler=None):
+        self.logger = logger_
+        self.collect_logs = collect_logs
+        self.log_collector = log_collector
+        if log_collector is None:
+            log_collector = deque(maxlen=settings.ANSIBLE_LOG_COLLECT_LINES)
+        self.log_lines = log_collector
+        self.task_event_handler = task_event_handler
+        self.task_events = None
+        self.task_events_fd = None
+        self.error_stream = None
+
+    def __enter__(self):
+        if self.task_event_handler is not None:
+            task_events_read_fd, self.task_events_fd = os.pipe()
+            self.task_events = open(task_events_read_fd, 'rb', buffering=0)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        if self.task_events is not None:
+            self.task_events.close()
+        self._close_task_events_fd()
+
+    def _close_task_events_fd(self):
+        """
+        Close the write end of the task events pipe
+        """
+        if self.task_events_fd is not None:
+            os.close(self.task_events_fd)
+            self.task_events_fd = None
+
+    def read(self, process):
+        """
+        Handle the output of the given playbook process until it ends
+
+        Raises TimeoutError when the process doesn't output anything for `ANSIBLE_LINE_TIMEOUT` seconds, or
+        when it's still running after `ANSIBLE_GLOBAL_TIMEOUT` seconds.
+        """
+        streams = [process.stdout, process.stderr]
+        self.error_stream = process.stderr
+        if self.task_events is not None:
+            # Only the playbook process keeps the write end open, so that we get EOF when it exits
+            self._close_task_events_fd()
+            streams.append(self.task_events)
+        lines = poll_streams(
+            *streams,
+            line_timeout=settings.ANSIBLE_LINE_TIMEOUT,
+            global_timeout=settings.ANSIBLE_GLOBAL_TIMEOUT
+        )
+        for stream, line in lines:
+            self.handle_line(stream, line)
+
+    def handle_line(self, stream, line):
+        """
+        Log, collect or handle a line read from the given stream of the playbook process
+        """
+        if stream is self.task_events:
+            handle_task_event(self.task_event_handler, line)
+            return
+        line = line.decode('utf-8').rstrip()
+        if stream is self.error_stream:
+            self.log_error(line)
+        elif self.logger is not None:
+            self.logger.info(line)
+        if self.collect_logs:
+            self.log_lines.append(line)
+
+    def log_error(self, message):
+        """
+        Log an error message, if there is a logger
+        """
+        if self.logger is not None:
+            self.logger.error(message)
+
+    def get_result(self, returncode):
+        """
+        Return the result of capture_playbook_output() for the given return code
+        """
+        if not self.collect_logs:
+            return returncode
+        if self.log_collector is not None:
+            # Copying the lines is pointless, since the caller already has the collector
+            return self.log_collector, returncode
+        return list(self.log_lines), returncode
+
+
+class YAMLDumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    """
+    Safe YAML dumper, using the C-accelerated libyaml emitter when PyYAML was built with it
+
+    Subclasses of the basic types, like Django's SafeText, are dumped like their base type.
+    """
+
+
+YAMLDumper.add_multi_representer(str, lambda dumper, data: dumper.represent_str(str(data)))
+YAMLDumper.add_multi_representer(dict, YAMLDumper.represent_dict)
+YAMLDumper.add_multi_representer(list, YAMLDumper.represent_list)
+YAMLDumper.add_multi_representer(tuple, YAMLDumper.represent_list)
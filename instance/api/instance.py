@@ -36,6 +36,7 @@ from instance.serializers.instance import (
 )
 
 from .filters import IsOrganizationOwnerFilterBackendInstance
+from .pagination import LogEntryPagination
 
 
 # Views - API #################################################################
@@ -108,8 +109,16 @@ class InstanceViewSet(viewsets.ReadOnlyModelViewSet):
     def logs(self, request, pk):
         """
         Get this Instance's log entries
+
+        The most recent log entries are returned; older ones can be fetched using the `limit`
+        and `before` query parameters, see LogEntryPagination.
         """
-        return Response(InstanceLogSerializer(self.get_object()).data)
+        paginator = LogEntryPagination()
+        log_entries = paginator.paginate_queryset(self.get_object().instance.get_log_entry_queryset(), request)
+        return Response(InstanceLogSerializer({
+            'log_entries': log_entries,
+            'previous_cursor': paginator.previous_cursor,
+        }).data)
 
     @detail_route(methods=['get'])
     def app_servers(self, request, pk):
@@ -22,12 +22,16 @@ Open edX AppServer API
 
 # Imports #####################################################################
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import detail_route
 from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from instance import log_tail
 from instance.models.instance import InstanceReference
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
@@ -40,6 +44,8 @@ from instance.serializers.openedx_appserver import (
 from instance.tasks import make_appserver_active, spawn_appserver
 
 from .filters import IsOrganizationOwnerFilterBackendAppServer, IsOrganizationOwnerFilterBackendInstance
+from .pagination import LogEntryPagination
+from .renderers import EventStreamRenderer
 
 # Views - API #################################################################
 
@@ -96,8 +102,57 @@ class OpenEdXAppServerViewSet(viewsets.ReadOnlyModelViewSet):
     def logs(self, request, pk):
         """
         Get this AppServer's log entries
+
+        The most recent log entries are returned; older ones can be fetched using the `limit`
+        and `before` query parameters, see LogEntryPagination. All error log entries are returned.
+        """
+        app_server = self.get_object()
+        # Get the tail cursor first, so that no log entry is missed between the two
+        tail_cursor = log_tail.get_cursor(self._get_log_tail_keys(app_server))
+        paginator = LogEntryPagination()
+        log_entries = paginator.paginate_queryset(app_server.get_log_entry_queryset(), request)
+        return Response(OpenEdXAppServerLogSerializer({
+            'log_entries': log_entries,
+            'log_error_entries': app_server.log_error_entries,
+            'previous_cursor': paginator.previous_cursor,
+            'tail_cursor': tail_cursor,
+        }).data)
+
+    @detail_route(methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def log_tail(self, request, pk):
+        """
+        Stream the new log entries of this AppServer and its server, as server-sent events.
+
+        Streaming starts after the `cursor` query parameter - the `tail_cursor` returned by the
+        `logs` action - or after the Last-Event-ID header when an EventSource client reconnects.
+        Otherwise, only log entries logged from now on are sent.
+        """
+        keys = self._get_log_tail_keys(self.get_object())
+        cursor = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('cursor')
+        if cursor:
+            try:
+                log_tail.parse_cursor(keys, cursor)
+            except ValueError:
+                raise NotFound('Invalid cursor')
+        else:
+            cursor = log_tail.get_cursor(keys)
+            if cursor is None:
+                raise NotFound('Log tail streams are unavailable')
+
+        response = StreamingHttpResponse(
+            log_tail.stream_events(keys, cursor, settings.LOG_TAIL_RESPONSE_DURATION),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable response buffering in nginx
+        return response
+
+    @staticmethod
+    def _get_log_tail_keys(app_server):
+        """
+        Get the keys of the log tail streams of the given AppServer and its server
         """
-        return Response(OpenEdXAppServerLogSerializer(self.get_object()).data)
+        return [log_tail.get_stream_key(app_server), log_tail.get_stream_key(app_server.server)]
 
     @detail_route(methods=['post'])
     def make_active(self, request, pk):
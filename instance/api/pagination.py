@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Pagination for the API
+"""
+
+# Imports #####################################################################
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+
+
+# Classes #####################################################################
+
+class LogEntryPagination:
+    """
+    Keyset pagination for log entries.
+
+    Pages go from the most recent log entries backwards. Each page is a list of log entries sorted
+    oldest first, like the `log_entries` properties of the models. `previous_cursor` is then set to
+    the cursor of the page of older log entries (or None if there are none), to pass back as the
+    `before` query parameter. The page size is given by the `limit` query parameter, and defaults to
+    (and can't exceed) `LOG_LIMIT`.
+
+    Pages are filtered on (created, id) rather than offset, so that each page is read directly from
+    the (content_type, object_id, created) index of the log entries.
+    """
+    cursor_query_param = 'before'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.previous_cursor = None
+
+    def get_page_size(self, request):
+        """
+        Get the page size requested by the client
+        """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.LOG_LIMIT
+        return max(1, min(page_size, settings.LOG_LIMIT))
+
+    def paginate_queryset(self, queryset, request):
+        """
+        Return the page of log entries requested by the client
+        """
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created', '-pk')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+
+        # Fetch one more log entry to find out if there is a previous page
+        log_entries = list(queryset[:page_size + 1])
+        if len(log_entries) > page_size:
+            log_entries = log_entries[:page_size]
+            self.previous_cursor = self.encode_cursor(log_entries[-1])
+        log_entries.reverse()
+        return log_entries
+
+    @staticmethod
+    def encode_cursor(log_entry):
+        """
+        Encode the position of the given log entry into an opaque cursor
+        """
+        position = '{},{}'.format(log_entry.created.isoformat(), log_entry.pk)
+        return urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        """
+        Decode the (created, pk) position of a log entry from a cursor
+        """
+        try:
+            created, pk = urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split(',')
+            created, pk = parse_datetime(created), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, pk
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Renderers for the API
+"""
+
+# Imports #####################################################################
+
+from rest_framework.renderers import JSONRenderer
+
+
+# Classes #####################################################################
+
+class EventStreamRenderer(JSONRenderer):
+    """
+    Renderer for views streaming server-sent events
+
+    The events are streamed by the views themselves, so this is only used to accept the
+    'text/event-stream' media type, and to render errors (as JSON).
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
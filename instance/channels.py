@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Websocket channels
+
+Events about a model object are published on the channel of that object - e.g. 'appserver.12' -
+rather than broadcast to every client. To subscribe to the channels of an object, clients send
+the subscription token they received along with the object from the API, which ensures they only
+receive the events of objects they are allowed to see.
+
+Notifications about model changes, which clients react to by reloading the object from the API,
+are only published once the transaction that made the change is committed, and repeated
+notifications about the same object are coalesced - see `NotificationCoalescer`.
+"""
+
+# Imports #####################################################################
+
+from collections import OrderedDict
+import atexit
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from swampdragon.pubsub_providers.data_publisher import publish_data
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+SUBSCRIPTION_TOKEN_SALT = 'instance.channels.subscription'
+
+# Maximum age of subscription tokens, in seconds
+SUBSCRIPTION_TOKEN_MAX_AGE = 24 * 60 * 60
+
+
+# Functions ###################################################################
+
+def get_event_channel(event_context):
+    """
+    Return the channel of the object described by the given event context (see the
+    `event_context` property of models), or None if the context doesn't describe an object
+    """
+    if event_context.get('appserver_id'):
+        return 'appserver.{}'.format(event_context['appserver_id'])
+    if event_context.get('server_id'):
+        return 'server.{}'.format(event_context['server_id'])
+    if event_context.get('instance_id'):
+        return 'instance.{}'.format(event_context['instance_id'])
+    return None
+
+
+def make_subscription_token(*channels):
+    """
+    Return a signed token allowing to subscribe to the given channels
+    """
+    return signing.dumps(list(channels), salt=SUBSCRIPTION_TOKEN_SALT)
+
+
+def get_subscription_channels(token):
+    """
+    Return the list of channels the given subscription token gives access to - none if the token
+    is missing, invalid or expired
+    """
+    if not token:
+        return []
+    try:
+        return signing.loads(token, salt=SUBSCRIPTION_TOKEN_SALT, max_age=SUBSCRIPTION_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return []
+
+
+def publish_notification(channel, event):
+    """
+    Publish a notification about a model change once the current transaction is committed,
+    coalescing it with identical notifications published within NOTIFICATION_COALESCE_WINDOW
+    """
+    notification_coalescer.publish(channel, event)
+
+
+# Classes #####################################################################
+
+class NotificationCoalescer:
+    """
+    Merges identical notifications published within a time window
+
+    The first notification about an object is published as soon as its transaction is committed.
+    Identical notifications published during the following `window` seconds are merged and
+    published once, when the window ends - so that a burst of saves of the same object, like
+    the status transitions of a server being provisioned, results in at most two notifications
+    per window rather than one per save.
+
+    Without an explicit `window`, the NOTIFICATION_COALESCE_WINDOW setting is read whenever a
+    notification is submitted.
+    """
+    def __init__(self, window=None):
+        self._window = window
+        self.lock = threading.RLock()
+        self.last_published = {}
+        self.pending = OrderedDict()
+        self._timer = None
+
+    @property
+    def window(self):
+        """
+        The time window in seconds during which identical notifications are merged
+        """
+        if self._window is None:
+            return settings.NOTIFICATION_COALESCE_WINDOW
+        return self._window
+
+    def publish(self, channel, event):
+        """
+        Submit the given notification once the current transaction is committed - right away if
+        there is no transaction in progress. Nothing is published if the transaction is rolled back.
+        """
+        transaction.on_commit(lambda: self.submit(channel, event))
+
+    def submit(self, channel, event):
+        """
+        Publish the given notification, unless an identical one was published less than `window`
+        seconds ago, in which case it is queued until the end of the window
+        """
+        window = self.window
+        if not window:
+            publish_data(channel, event)
+            return
+        key = (channel, json.dumps(event, sort_keys=True))
+        with self.lock:
+            if key in self.pending:
+                return
+            if time.time() - self.last_published.get(key, 0) < window:
+                self.pending[key] = (channel, event)
+            else:
+                self.last_published[key] = time.time()
+                publish_data(channel, event)
+            if self._timer is None:
+                self._timer = threading.Timer(window, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """
+        Publish all queued notifications
+        """
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self.pending = self.pending, OrderedDict()
+            now = time.time()
+            for key, (channel, event) in pending.items():
+                self.last_published[key] = now
+                publish_data(channel, event)
+            # Forget notifications published before the current window
+            self.last_published = {
+                key: published for key, published in self.last_published.items() if now - published < self.window
+            }
+
+    def _flush_from_timer(self):
+        """
+        Flush the queue from the timer thread, and keep the timer running while notifications
+        published during the last window might still be followed by identical ones
+        """
+        try:
+            with self.lock:
+                self._timer = None
+                self.flush()
+                if self.last_published:
+                    self._timer = threading.Timer(self.window, self._flush_from_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Unable to publish the queued notifications.')
+
+
+notification_coalescer = NotificationCoalescer()
+atexit.register(notification_coalescer.flush)
@@ -35,6 +35,15 @@ from django.core.cache import cache
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Cache key of the map of registered domain names to zone IDs, shared by all processes
+ZONE_ID_CACHE_KEY = 'gandi_zone_ids'
+
+# Code of the API faults about domains which aren't registered in the Gandi account
+DOMAIN_NOT_FOUND_FAULT_CODE = 510042
+
+
 # Classes #####################################################################
 
 class GandiAPI():
@@ -43,8 +52,6 @@ class GandiAPI():
     """
 
     def __init__(self, api_url='https://rpc.gandi.net/xmlrpc/', client=None):
-        # This is a map of domain_name => zone_id key-value pairs.
-        self._zone_id_cache = None
         if client:
             self.client = client
         else:
@@ -64,27 +71,57 @@ class GandiAPI():
         """
         return self.client.domain.zone
 
-    def _populate_zone_id_cache(self):
+    @staticmethod
+    def _get_cached_zone_ids():
+        """
+        Return the map of domain_name => zone_id key-value pairs of the domains looked up so far.
+        """
+        return cache.get(ZONE_ID_CACHE_KEY) or {}
+
+    @staticmethod
+    def clear_zone_id_cache():
         """
-        Populate the internal zone ID cache with all domains in the current Gandi account.
+        Forget the zone IDs looked up so far.
         """
-        self._zone_id_cache = {}
-        for domain_dict in self.client.domain.list(self.api_key):
-            domain = domain_dict['fqdn'].lower()
-            self._zone_id_cache[domain] = self.client.domain.info(self.api_key, domain)['zone_id']
+        cache.delete(ZONE_ID_CACHE_KEY)
+
+    def _lookup_zone_id(self, domain):
+        """
+        Get the zone ID of the given registered domain from the Gandi API, and add it to the cache.
+
+        Concurrent lookups can overwrite each other's cache entries, which only causes another lookup later.
+        """
+        zone_id = self.client.domain.info(self.api_key, domain)['zone_id']
+        zone_ids = self._get_cached_zone_ids()
+        zone_ids[domain] = zone_id
+        cache.set(ZONE_ID_CACHE_KEY, zone_ids, settings.GANDI_ZONE_ID_CACHE_TIMEOUT)
+        return zone_id
 
     def split_domain_name(self, domain):
         """
         Split the given domain name in the registered domain and the subdomain.
+
+        The suffixes of the domain name are tried starting from the shortest one. If none of them is a
+        registered domain already in the zone ID cache, they are looked up with the Gandi API in the
+        same order.
         """
-        if self._zone_id_cache is None:
-            self._populate_zone_id_cache()
         labels = domain.lower().split('.')
-        for split_index in range(len(labels) - 1):
+        split_indexes = list(reversed(range(len(labels) - 1)))
+        zone_ids = self._get_cached_zone_ids()
+        for split_index in split_indexes:
+            registered_domain = '.'.join(labels[split_index:])
+            if registered_domain in zone_ids:
+                return '.'.join(labels[:split_index]) or '@', registered_domain
+        for split_index in split_indexes:
             registered_domain = '.'.join(labels[split_index:])
-            if registered_domain in self._zone_id_cache:
-                subdomain = '.'.join(labels[:split_index]) or '@'
-                return subdomain, registered_domain
+            try:
+                self._lookup_zone_id(registered_domain)
+            except xmlrpc.client.Fault as exc:
+                if exc.faultCode != DOMAIN_NOT_FOUND_FAULT_CODE:
+                    raise
+                logger.debug('%s is not a registered domain: %s', registered_domain, exc)
+                continue
+            return '.'.join(labels[:split_index]) or '@', registered_domain
         raise ValueError(
             'The given domain name "{}" does not match any domain registered in the Gandi account.'.format(domain)
         )
@@ -92,10 +129,14 @@ class GandiAPI():
     def get_zone_id(self, domain):
         """
         Gandi zone ID used by domain
+
+        Zone IDs are cached for all processes, so the Gandi API is only called for the first lookup of
+        each domain.
         """
-        if self._zone_id_cache is None:
-            self._populate_zone_id_cache()
-        return self._zone_id_cache[domain]
+        zone_id = self._get_cached_zone_ids().get(domain)
+        if zone_id is None:
+            zone_id = self._lookup_zone_id(domain)
+        return zone_id
 
     def delete_dns_record(self, zone_id, zone_version_id, record_name):
         """
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+HAProxy runtime API - Helper functions
+"""
+
+# Imports #####################################################################
+
+from collections import OrderedDict, namedtuple
+from functools import partial
+import logging
+import shlex
+import socket
+import subprocess
+import time
+
+from instance.utils import poll_streams
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Responses of the runtime API to successful commands. Any other non-empty response is an error.
+SUCCESS_RESPONSE_PREFIXES = (
+    'New server registered',
+    'Server deleted',
+    'IP changed from',
+    'IP and port changed from',
+    'port changed from',
+    'no need to change',
+)
+
+# Response of the runtime API to `del server` while the server still has connections
+SERVER_IN_USE_RESPONSE_PREFIX = 'Server still has connections attached to it'
+
+# Number of times `del server` is retried while the server still has connections, and the delay in
+# seconds between the attempts
+DEL_SERVER_RETRIES = 5
+DEL_SERVER_RETRY_DELAY = 1
+
+# Printed by the remote shell after the response to each command sent over SSH
+RESPONSE_END_MARKER = '--- end of haproxy response ---'
+
+
+# Classes #####################################################################
+
+class RuntimeAPIError(Exception):
+    """
+    Exception indicating that commands couldn't be applied through the haproxy runtime API.
+    """
+
+
+Server = namedtuple('Server', ['address', 'weight', 'check', 'options'])
+
+
+class SSHCommandSession:
+    """
+    Sends commands to the haproxy admin socket of a remote server over a single SSH connection.
+
+    The remote shell passes each command it reads to the admin socket with socat, and prints
+    RESPONSE_END_MARKER after the response, so that each response can be checked before the next
+    command is sent. Use it as a context manager, which closes the connection on exit. The whole
+    session must complete within `timeout` seconds.
+    """
+    def __init__(self, ssh_target, socket_path, timeout):
+        self.ssh_target = ssh_target
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.process = None
+        self.result = None
+        self._lines = None
+
+    def __enter__(self):
+        remote_command = (
+            'while IFS= read -r command; do '
+            'printf "%s\\n" "$command" | socat stdio {socket}; echo {marker}; '
+            'done'
+        ).format(socket=shlex.quote('UNIX-CONNECT:' + self.socket_path), marker=shlex.quote(RESPONSE_END_MARKER))
+        try:
+            self.process = subprocess.Popen(
+                ['ssh', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout={}'.format(self.timeout), self.ssh_target,
+                 remote_command],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0, # Unbuffered, so that no response line is left in a buffer while polling the output
+            )
+        except OSError as exc:
+            raise RuntimeAPIError('Unable to run haproxy commands on {}: {}'.format(self.ssh_target, exc))
+        self._lines = poll_streams(self.process.stdout, global_timeout=self.timeout)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def send(self, command):
+        """
+        Send a command, and return its response.
+        """
+        response_lines = []
+        try:
+            self.process.stdin.write(command.encode('utf-8') + b'\n')
+            for dummy, line in self._lines:
+                line = line.decode('utf-8', errors='replace')
+                if line.rstrip('\n') == RESPONSE_END_MARKER:
+                    return ''.join(response_lines)
+                response_lines.append(line)
+        except BrokenPipeError:
+            pass  # The SSH command already exited
+        except TimeoutError:
+            self.process.kill()
+            raise RuntimeAPIError('Unable to run haproxy command "{}" on {}: timed out'.format(
+                command, self.ssh_target
+            ))
+        # The connection was closed before the end of the response
+        returncode, stderr = self.close()
+        raise RuntimeAPIError('Unable to run haproxy commands on {} (exit code {}): {}'.format(
+            self.ssh_target, returncode, stderr
+        ))
+
+    def close(self):
+        """
+        Close the connection, and return the exit code and the error output of the SSH command.
+        """
+        if self.result is None:
+            try:
+                dummy, stderr = self.process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                dummy, stderr = self.process.communicate()
+            self.result = self.process.returncode, stderr.decode('utf-8', errors='replace').strip()
+        return self.result
+
+
+# Functions ###################################################################
+
+def parse_server_line(line):
+    """
+    Parse a `server <name> <address> [options]` line of a backend, and return its name and Server.
+    """
+    tokens = line.split()
+    weight = None
+    check = False
+    options = []
+    option_tokens = iter(tokens[3:])
+    for token in option_tokens:
+        if token == 'check':
+            check = True
+        elif token == 'weight':
+            weight = next(option_tokens, None)
+        else:
+            options.append(token)
+    return tokens[1], Server(address=tokens[2], weight=weight, check=check, options=tuple(options))
+
+
+def parse_backends(backend_conf):
+    """
+    Parse haproxy backend sections into a dict mapping backend names to their settings and servers.
+
+    The settings are the list of lines which don't declare servers, and the servers are an OrderedDict
+    mapping server names to Server tuples. Blank lines are ignored.
+    """
+    backends = OrderedDict()
+    settings = servers = None
+    for line in backend_conf.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        keyword = line.split()[0]
+        if keyword == 'backend':
+            settings, servers = [], OrderedDict()
+            backends[line.split()[1]] = (settings, servers)
+        elif settings is None:
+            settings = []
+            servers = OrderedDict()
+            backends[None] = (settings, servers)
+            settings.append(line)
+        elif keyword == 'server' and len(line.split()) >= 3:
+            name, server = parse_server_line(line)
+            servers[name] = server
+        else:
+            settings.append(line)
+    return backends
+
+
+def _add_server_commands(target, server):
+    """
+    Return the runtime API commands adding the given server to a backend, as `backend/server` target.
+
+    Dynamic servers with health checks need haproxy 2.5 or later. They are added in maintenance mode,
+    so they are enabled once added.
+    """
+    commands = [' '.join(
+        ['add server', target, server.address] +
+        (['weight', server.weight] if server.weight is not None else []) +
+        (['check'] if server.check else []) +
+        list(server.options)
+    )]
+    commands.append('enable server {}'.format(target))
+    if server.check:
+        commands.append('enable health {}'.format(target))
+    return commands
+
+
+def _change_server_commands(target, old_server, new_server):
+    """
+    Return the runtime API commands changing a server from the old to the new settings, or None if
+    the changes can't be applied at runtime.
+
+    Health checks can only be enabled at runtime on servers declared with `check`, so adding them to
+    a server requires reloading the configuration. This happens when an instance goes from one to two
+    active appservers, since health checks are only enabled with several appservers.
+    """
+    if old_server.options != new_server.options or (new_server.check and not old_server.check):
+        return None
+    commands = []
+    if old_server.address != new_server.address:
+        address, dummy, port = new_server.address.rpartition(':')
+        if not address:
+            return None
+        commands.append('set server {} addr {} port {}'.format(target, address, port))
+    if old_server.weight != new_server.weight:
+        commands.append('set weight {} {}'.format(target, new_server.weight or 1))
+    if old_server.check and not new_server.check:
+        commands.append('disable health {}'.format(target))
+    return commands
+
+
+def get_runtime_commands(old_backend_conf, new_backend_conf):
+    """
+    Return the runtime API commands switching haproxy from the old to the new backend configuration.
+
+    Only the addition and removal of servers, and changes of their address, weight and health checks
+    can be applied at runtime. None is returned when any other part of the configuration changed.
+    """
+    old_backends = parse_backends(old_backend_conf)
+    new_backends = parse_backends(new_backend_conf)
+    if list(old_backends) != list(new_backends):
+        return None
+
+    commands = []
+    removal_commands = []
+    for backend_name, (new_settings, new_servers) in new_backends.items():
+        old_settings, old_servers = old_backends[backend_name]
+        if old_settings != new_settings:
+            return None
+        for server_name, new_server in new_servers.items():
+            target = '{}/{}'.format(backend_name, server_name)
+            if server_name not in old_servers:
+                commands.extend(_add_server_commands(target, new_server))
+                continue
+            server_commands = _change_server_commands(target, old_servers[server_name], new_server)
+            if server_commands is None:
+                return None
+            commands.extend(server_commands)
+        # Servers are removed once the new ones are ready to take over their traffic
+        for server_name in old_servers:
+            if server_name not in new_servers:
+                target = '{}/{}'.format(backend_name, server_name)
+                removal_commands.extend([
+                    'set server {} state maint'.format(target),
+                    'shutdown sessions server {}'.format(target),
+                    'del server {}'.format(target),
+                ])
+    return commands + removal_commands
+
+
+def check_response(command, response):
+    """
+    Raise RuntimeAPIError if the response of haproxy to the given command indicates an error.
+    """
+    response = response.strip()
+    if response and not response.startswith(SUCCESS_RESPONSE_PREFIXES):
+        raise RuntimeAPIError('Command "{}" failed: {}'.format(command, response))
+
+
+def send_local_command(socket_path, command, timeout):
+    """
+    Send a command to the haproxy admin socket at the given local path, and return the response.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as admin_socket:
+            admin_socket.settimeout(timeout)
+            admin_socket.connect(socket_path)
+            admin_socket.sendall(command.encode('utf-8') + b'\n')
+            chunks = []
+            chunk = admin_socket.recv(4096)
+            while chunk:
+                chunks.append(chunk)
+                chunk = admin_socket.recv(4096)
+    except OSError as exc:
+        raise RuntimeAPIError('Unable to reach the haproxy admin socket {}: {}'.format(socket_path, exc))
+    return b''.join(chunks).decode('utf-8', errors='replace')
+
+
+def run_commands(commands, socket_path, ssh_target=None, timeout=30):
+    """
+    Run the given commands through the haproxy runtime API, and return their responses.
+
+    The admin socket is reached over SSH on the given `user@host` target, or on the local machine
+    if no target is given. The commands are run one at a time: RuntimeAPIError is raised as soon as
+    one of them fails, and the following ones aren't run - so old servers are only removed once the
+    new ones were added.
+    """
+    if ssh_target is None:
+        send = partial(send_local_command, socket_path, timeout=timeout)
+        return [run_command(send, command) for command in commands]
+    with SSHCommandSession(ssh_target, socket_path, timeout) as session:
+        return [run_command(session.send, command) for command in commands]
+
+
+def run_command(send, command):
+    """
+    Send a command with the given `send(command)` function, and return its response once checked.
+
+    `del server` fails while the server still has connections, which `shutdown sessions` doesn't always
+    close right away, so it's retried DEL_SERVER_RETRIES times.
+    """
+    response = send(command)
+    retries = DEL_SERVER_RETRIES if command.startswith('del server ') else 0
+    while retries and response.strip().startswith(SERVER_IN_USE_RESPONSE_PREFIX):
+        time.sleep(DEL_SERVER_RETRY_DELAY)
+        response = send(command)
+        retries -= 1
+    logger.debug('haproxy command "%s": %s', command, response.strip())
+    check_response(command, response)
+    return response
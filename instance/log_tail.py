@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Log tail streams
+
+The log entries of each model object are also appended to a capped Redis stream (Redis 5.0+),
+so that clients can follow the log of a few objects, from a cursor, without receiving the log
+lines of all the other objects.
+
+A cursor is the comma-separated list of the last stream IDs read from each stream.
+
+Each open log tail response holds a web server thread and a blocking Redis connection, so the
+number of concurrent log tail responses of each process is capped by LOG_TAIL_MAX_STREAMS.
+"""
+
+# Imports #####################################################################
+
+import json
+import logging
+import re
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from instance.serializers.logentry import LogEntrySerializer
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Constants ###################################################################
+
+# Maximum time in seconds to wait for new log entries before sending a keep-alive comment
+KEEP_ALIVE_INTERVAL = 10
+
+# Time in milliseconds after which EventSource clients reconnect when the log tail response ends
+RETRY_INTERVAL = 1000
+
+# Time in milliseconds after which EventSource clients reconnect when too many log tails are open
+BUSY_RETRY_INTERVAL = 10000
+
+STREAM_ID_RE = re.compile(r'^\d+-\d+$')
+
+
+# Classes #####################################################################
+
+class StreamCounter:
+    """
+    Thread-safe count of the log tail responses streamed by this process
+    """
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Count a new log tail response, unless LOG_TAIL_MAX_STREAMS are already open
+
+        Returns whether the log tail response can be streamed.
+        """
+        with self._lock:
+            if self.count >= settings.LOG_TAIL_MAX_STREAMS:
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        """
+        Count a log tail response as closed
+        """
+        with self._lock:
+            self.count -= 1
+
+
+open_streams = StreamCounter()
+
+
+# Functions ###################################################################
+
+def get_stream_key(obj=None, content_type_id=None, object_id=None):
+    """
+    Return the key of the log tail stream of the given model object, or content type and object ID
+    """
+    if obj is not None:
+        content_type_id = apps.get_model('contenttypes', 'ContentType').objects.get_for_model(obj).pk
+        object_id = obj.pk
+    return 'log_tail:{}:{}'.format(content_type_id, object_id)
+
+
+def append_log_entries(log_entries):
+    """
+    Append the given (saved) log entries to the log tail streams of their objects
+
+    Log entries which aren't attached to an object are skipped. Redis errors are logged, but not
+    raised, so that the log entries are still recorded in the database if Redis is unavailable.
+    """
+    if not settings.LOG_TAIL_STREAM_LENGTH:
+        return
+    pipeline = get_redis_connection().pipeline(transaction=False)
+    keys = set()
+    for log_entry in log_entries:
+        if not log_entry.content_type_id:
+            continue
+        key = get_stream_key(content_type_id=log_entry.content_type_id, object_id=log_entry.object_id)
+        pipeline.execute_command(
+            'XADD', key, 'MAXLEN', '~', settings.LOG_TAIL_STREAM_LENGTH, '*',
+            'log_entry', json.dumps(LogEntrySerializer(log_entry).data),
+        )
+        keys.add(key)
+    if not keys:
+        return
+    for key in keys:
+        pipeline.expire(key, settings.LOG_TAIL_STREAM_TTL)
+    try:
+        pipeline.execute()
+    except RedisError:
+        logger.exception('Unable to append log entries to the log tail streams.')
+
+
+def get_cursor(keys):
+    """
+    Return a cursor pointing to the end of the given streams, or None if the log tail streams are
+    disabled or unavailable
+    """
+    if not settings.LOG_TAIL_STREAM_LENGTH:
+        return None
+    pipeline = get_redis_connection().pipeline(transaction=False)
+    for key in keys:
+        pipeline.execute_command('XREVRANGE', key, '+', '-', 'COUNT', 1)
+    try:
+        results = pipeline.execute()
+    except RedisError:
+        logger.exception('Unable to read the log tail streams.')
+        return None
+    return ','.join(messages[0][0].decode() if messages else '0-0' for messages in results)
+
+
+def parse_cursor(keys, cursor):
+    """
+    Return the list of stream IDs of the given cursor, or raise ValueError if it isn't a valid cursor
+    for the given streams
+    """
+    stream_ids = cursor.split(',')
+    if len(stream_ids) != len(keys) or not all(STREAM_ID_RE.match(stream_id) for stream_id in stream_ids):
+        raise ValueError('Invalid log tail cursor: {}'.format(cursor))
+    return stream_ids
+
+
+def read_log_entries(keys, cursor, block):
+    """
+    Return the serialized log entries appended to the given streams after the given cursor, sorted
+    by creation date, along with the cursor pointing after them
+
+    Waits for up to `block` seconds for new log entries. Raises ValueError if the cursor is invalid.
+    """
+    stream_ids = parse_cursor(keys, cursor)
+    response = get_redis_connection().execute_command(
+        'XREAD', 'BLOCK', max(1, int(block * 1000)), 'STREAMS', *(list(keys) + stream_ids)
+    )
+    log_entries = []
+    for key, messages in response or []:
+        for stream_id, fields in messages:
+            fields = dict(zip(fields[::2], fields[1::2]))
+            log_entries.append(json.loads(fields[b'log_entry'].decode()))
+            stream_ids[keys.index(key.decode())] = stream_id.decode()
+    log_entries.sort(key=lambda log_entry: log_entry['created'])
+    return log_entries, ','.join(stream_ids)
+
+
+def stream_events(keys, cursor, duration):
+    """
+    Generate server-sent events with the log entries appended to the given streams after the
+    given cursor, for `duration` seconds
+
+    Each event holds a batch of log entries, and has the cursor pointing after them as ID, so
+    that EventSource clients reconnect from there with the Last-Event-ID header once the response
+    ends. Keep-alive comments are sent while there are no new log entries.
+
+    The response ends early if Redis becomes unavailable, and right away if LOG_TAIL_MAX_STREAMS
+    log tail responses are already open - the client then reconnects later from the same cursor.
+    """
+    if not open_streams.acquire():
+        yield 'retry: {}\n\n'.format(BUSY_RETRY_INTERVAL)
+        return
+    try:
+        deadline = time.time() + duration
+        yield 'retry: {}\n\n'.format(RETRY_INTERVAL)
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                log_entries, cursor = read_log_entries(keys, cursor, block=min(remaining, KEEP_ALIVE_INTERVAL))
+            except RedisError:
+                logger.exception('Unable to read the log tail streams.')
+                return
+            if log_entries:
+                yield 'id: {}\ndata: {}\n\n'.format(cursor, json.dumps({'log_entries': log_entries}))
+            else:
+                yield ': keep-alive\n\n'
+    finally:
+        open_streams.release()
@@ -22,14 +22,19 @@ Instance app - Logging utils
 
 # Imports #####################################################################
 
+from collections import OrderedDict
 from functools import wraps
 import logging
+import threading
 import traceback
 
 from django.apps import apps
+from django.conf import settings
 from django.db import connection, models, ProgrammingError
 from swampdragon.pubsub_providers.data_publisher import publish_data
 
+from instance import log_tail
+from instance.channels import get_event_channel
 from instance.serializers.logentry import LogEntrySerializer
 
 
@@ -61,10 +66,10 @@ class DBHandler(logging.Handler):
     """
     Records log messages in database models
     """
-    def emit(self, record):
+    def get_log_entry(self, record):
         """
-        Handles an emitted log entry and stores it in the database, optionally linking it to the
-        model object `obj`
+        Build an (unsaved) log entry for the given record, optionally linking it to the model
+        object `obj`
         """
         obj = record.__dict__.get('obj', None)
 
@@ -74,27 +79,217 @@ class DBHandler(logging.Handler):
             content_type = apps.get_model('contenttypes', 'ContentType').objects.get_for_model(obj)
             object_id = obj.pk
 
+        return apps.get_model('instance', 'LogEntry')(
+            level=record.levelname, text=self.format(record), content_type=content_type, object_id=object_id
+        )
+
+    def emit(self, record):
+        """
+        Handles an emitted log entry and stores it in the database, optionally linking it to the
+        model object `obj`
+        """
+        obj = record.__dict__.get('obj', None)
+        log_entry = self.get_log_entry(record)
+
         try:
-            log_entry = apps.get_model('instance', 'LogEntry').objects.create(
-                level=record.levelname, text=self.format(record), content_type=content_type, object_id=object_id
-            )
+            log_entry.save(force_insert=True)
         except ProgrammingError:
             # This can occur if django tries to log something before migrations have created the log table.
             # Make sure that is actually what happened:
             assert 'instance_logentry' not in connection.introspection.table_names()
+            return
 
         # Send notice of entries related to any resource. Skip generic log entries that occur
         # in debug mode, like "GET /static/img/favicon/favicon-96x96.png":
-        if content_type:
+        if log_entry.content_type_id:
+            log_tail.append_log_entries([log_entry])
             log_event = {
                 'type': 'object_log_line',
                 'log_entry': LogEntrySerializer(log_entry).data
             }
             if hasattr(obj, 'event_context'):
                 log_event.update(obj.event_context)
-            # TODO: Filter out log entries for which the user doesn't have view rights
-            # TODO: More targetted events - only emit events for what the user is looking at
-            publish_data('log', log_event)
+            channel = get_event_channel(log_event)
+            if channel:
+                publish_data(channel, log_event)
+
+
+class BufferedDBHandler(DBHandler):
+    """
+    Records log messages in database models, in batches
+
+    Log entries are queued in memory and written with a single `bulk_create()` when `capacity`
+    entries are queued, when a record of level `flush_level` or above is emitted, when the oldest
+    queued entry is `flush_interval` seconds old, or when the handler is closed (which the logging
+    module does on process shutdown).
+
+    Unlike `DBHandler`, this skips the model validation of each log entry, and sends a single
+    'object_log_lines' event per object and batch instead of one 'object_log_line' event per line.
+    """
+    def __init__(self, capacity=500, flush_interval=2, flush_level=logging.ERROR, level=logging.NOTSET):
+        super().__init__(level)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer = []
+        self._timer = None
+
+    def emit(self, record):
+        """
+        Queue the log entry for the given record
+        """
+        self.enqueue(record.__dict__.get('obj', None), self.get_log_entry(record), record.levelno)
+
+    def enqueue(self, obj, log_entry, levelno):
+        """
+        Queue an (unsaved) log entry for the model object `obj`, and write the queue to the database
+        if a flush threshold is reached
+        """
+        self.acquire()
+        try:
+            self.buffer.append((obj, log_entry))
+            if len(self.buffer) >= self.capacity or levelno >= self.flush_level:
+                self.flush()
+            elif self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        finally:
+            self.release()
+
+    def flush(self):
+        """
+        Write all queued log entries to the database and notify clients about them
+        """
+        self.acquire()
+        try:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            # Swap the buffer before writing, so that anything logged while writing is queued again.
+            buffered, self.buffer = self.buffer, []
+            if buffered:
+                self._write(buffered)
+        finally:
+            self.release()
+
+    def close(self):
+        """
+        Flush the queued log entries before closing the handler
+        """
+        try:
+            self.flush()
+        finally:
+            super().close()
+
+    def _flush_from_timer(self):
+        """
+        Flush the queue from the timer thread, and close the database connection of that thread
+        """
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Unable to write the buffered log entries to the database.')
+        finally:
+            connection.close()
+
+    def _write(self, buffered):
+        """
+        Insert the given (obj, log_entry) pairs and publish them, grouped by object
+        """
+        try:
+            apps.get_model('instance', 'LogEntry').objects.bulk_create([log_entry for dummy, log_entry in buffered])
+        except ProgrammingError:
+            # See DBHandler.emit()
+            assert 'instance_logentry' not in connection.introspection.table_names()
+            return
+
+        log_tail.append_log_entries([log_entry for dummy, log_entry in buffered])
+        log_events = OrderedDict()
+        for obj, log_entry in buffered:
+            if not log_entry.content_type_id:
+                continue
+            key = (log_entry.content_type_id, log_entry.object_id)
+            if key not in log_events:
+                log_events[key] = {'type': 'object_log_lines', 'log_entries': []}
+                if hasattr(obj, 'event_context'):
+                    log_events[key].update(obj.event_context)
+            log_events[key]['log_entries'].append(LogEntrySerializer(log_entry).data)
+        for log_event in log_events.values():
+            channel = get_event_channel(log_event)
+            if channel:
+                publish_data(channel, log_event)
+
+
+class PlaybookOutputSink:
+    """
+    Records the output of a playbook run in the log entries of a model instance
+
+    Each line of output is turned directly into a log entry - bypassing the logging module - and
+    queued in a `BufferedDBHandler`, which writes the entries and publishes the websocket events
+    in batches. The log message annotation, content type and object ID, which `ModelLoggerAdapter`
+    and `DBHandler` recompute for each line, are computed once when the sink is created.
+
+    Use it as a context manager, or call `close()` at the end of the run to write the remaining lines.
+    """
+    def __init__(self, logger_adapter):
+        self.obj = logger_adapter.extra['obj']
+        self.content_type = apps.get_model('contenttypes', 'ContentType').objects.get_for_model(self.obj)
+        self.object_id = self.obj.pk
+
+        # Format the annotation like the 'db' handler would format a record of the adapter
+        annotation = self.obj.get_log_message_annotation()
+        formatter_config = settings.LOGGING['formatters']['db']
+        formatter = logging.Formatter(
+            formatter_config['format'], formatter_config.get('datefmt'), formatter_config.get('style', '%'),
+        )
+        record = logging.LogRecord(
+            logger_adapter.logger.name, logging.INFO, __file__, 0, '{} | '.format(annotation) if annotation else '',
+            None, None,
+        )
+        self.prefix = formatter.format(record)
+
+        self.handler = BufferedDBHandler(
+            capacity=settings.LOG_DB_BUFFER_CAPACITY,
+            flush_interval=settings.LOG_DB_BUFFER_FLUSH_INTERVAL,
+            flush_level=logging.CRITICAL,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def log(self, level, line):
+        """
+        Queue a log entry with the given level for a line of output
+        """
+        log_entry = apps.get_model('instance', 'LogEntry')(
+            level=logging.getLevelName(level),
+            text=self.prefix + line,
+            content_type=self.content_type,
+            object_id=self.object_id,
+        )
+        self.handler.enqueue(self.obj, log_entry, level)
+
+    def info(self, line):
+        """
+        Queue a line of standard output
+        """
+        self.log(logging.INFO, line)
+
+    def error(self, line):
+        """
+        Queue a line of error output
+        """
+        self.log(logging.ERROR, line)
+
+    def close(self):
+        """
+        Write the queued log entries
+        """
+        self.handler.close()
 
 
 class ModelLoggerAdapter(logging.LoggerAdapter):
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Configuration settings rendering benchmark management command
+"""
+
+# Imports #####################################################################
+
+from functools import partial
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+import yaml
+
+from instance import ansible
+from instance.models.openedx_appserver import OpenEdXAppConfiguration
+from instance.models.openedx_instance import OpenEdXInstance
+
+
+# Functions ###################################################################
+
+def render_legacy_configuration_settings(appserver, extra_variables):
+    """
+    Render the configuration settings of the given appserver the way they used to be: each group of
+    variables is serialized to YAML, then parsed back and merged, with the pure-Python YAML implementation
+    """
+    confvars = appserver._get_configuration_variables()  # pylint: disable=protected-access
+    for attr_name in appserver.CONFIGURATION_EXTRA_FIELDS:
+        if attr_name in extra_variables:
+            attr_variables = extra_variables[attr_name]
+            attr_value = yaml.dump(attr_variables, default_flow_style=False) if attr_variables else ''
+        else:
+            attr_value = getattr(appserver, attr_name)
+        confvars = ansible.dict_merge(confvars, yaml.load(attr_value) if attr_value else {})
+    return yaml.dump(confvars, default_flow_style=False)
+
+
+def render_configuration_settings(appserver, extra_variables):
+    """
+    Render the configuration settings of the given appserver by merging the dicts of variables
+    """
+    appserver.set_configuration_extra_variables(**extra_variables)
+    return appserver.create_configuration_settings()
+
+
+# Classes #####################################################################
+
+class Command(BaseCommand):
+    """
+    benchmark_configuration_settings management command class
+    """
+    help = (
+        'Measures the time taken to render the configuration settings of a new appserver of the given instance,'
+        ' with and without the YAML round-trip of each group of variables. Nothing is saved to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('instance_id', type=int, help='ID of the OpenEdXInstance to benchmark.')
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=100,
+            help='Number of times the configuration settings are rendered with each method.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            instance = OpenEdXInstance.objects.get(pk=options['instance_id'])
+        except OpenEdXInstance.DoesNotExist:
+            raise CommandError('Instance {} does not exist.'.format(options['instance_id']))
+        if options['iterations'] < 1:
+            raise CommandError('The number of iterations must be positive.')
+
+        config_fields = OpenEdXAppConfiguration.get_config_fields()
+        instance_config = {field_name: getattr(instance, field_name) for field_name in config_fields}
+        appserver = instance.appserver_set.model(owner=instance.ref, name='Benchmark', **instance_config)
+        # The instance variables are the same for both methods, so they are only fetched once
+        extra_variables = {
+            'configuration_database_settings': instance.get_database_variables(),
+            'configuration_storage_settings': instance.get_storage_variables(),
+            'configuration_theme_settings': instance.get_theme_variables(),
+            'configuration_secret_keys': instance.get_secret_key_variables(),
+        }
+
+        legacy_settings = render_legacy_configuration_settings(appserver, extra_variables)
+        new_settings = render_configuration_settings(appserver, extra_variables)
+        if ansible.parse_yaml(legacy_settings) != ansible.parse_yaml(new_settings):
+            raise CommandError('The configuration settings rendered by both methods differ.')
+
+        self.stdout.write('C-accelerated YAML: {}'.format(
+            'yes' if ansible.YAMLLoader is not yaml.SafeLoader else 'no'
+        ))
+        for label, render in (
+                ('YAML round-trip', render_legacy_configuration_settings),
+                ('Dict merge', render_configuration_settings),
+        ):
+            duration = timeit.timeit(partial(render, appserver, extra_variables), number=options['iterations'])
+            self.stdout.write('{}: {:.2f} ms per appserver'.format(label, duration * 1000 / options['iterations']))
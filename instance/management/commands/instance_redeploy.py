@@ -22,18 +22,47 @@ Instance app - Instance Redeployment management command
 
 # Imports #####################################################################
 
-import time
+from functools import partial
 import logging
+from multiprocessing import Pool
+import time
 
 from django.core.management.base import BaseCommand
+from django.db import connections
 
 from instance.ansible import load_yaml
 from instance.models.instance import InstanceTag
+from instance.models.mixins.secret_keys import generate_rsa_key
 from instance.models.openedx_instance import OpenEdXInstance
 from instance.tasks import spawn_appserver
 
 LOG = logging.getLogger(__name__)
 
+# Functions ###################################################################
+
+
+def get_configuration_changes(instance_id, update):
+    """
+    Return the ID and name of the given instance, with the list of configuration variables that a new appserver
+    would change once the given field updates are applied, or None if the instance has no active appserver.
+
+    The updates aren't saved. This is a module-level function so that it can run in a process pool.
+    """
+    instance = OpenEdXInstance.objects.get(pk=instance_id)
+    for field, value in update.items():
+        setattr(instance, field, value)
+    if not instance.secret_key_rsa_private:
+        # Rendering the JWT signing keys would otherwise generate an RSA key and save it, along with the updates.
+        # A spawn would generate a new key too, so the changes are the same with a key that isn't saved.
+        instance.secret_key_rsa_private = generate_rsa_key(2048)
+    try:
+        changes = instance.get_configuration_changes()
+    except Exception:  # pylint: disable=broad-except
+        LOG.exception("Unable to compute the configuration changes of %s [%s]", instance, instance.id)
+        changes = ['<error>']
+    return instance.id, str(instance), changes
+
+
 # Classes #####################################################################
 
 
@@ -123,6 +152,24 @@ class Command(BaseCommand):
             default=1,
             help='Number of times to try spawning an appserver for a given instance before calling it a failure.'
         )
+        parser.add_argument(
+            '--skip-unchanged',
+            action='store_true',
+            help="Don't provision new appservers for the instances whose active appserver was provisioned with the"
+                 ' same settings and playbook commits. These instances are marked as successfully redeployed.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Don't redeploy anything: list the instances whose configuration settings would change, with the"
+                 ' --update applied, compared to their active appserver.'
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help='Number of processes used to compute the configuration changes with --dry-run.'
+        )
 
     def handle(self, *args, **options):
         """
@@ -130,6 +177,10 @@ class Command(BaseCommand):
         """
         self.options = options
 
+        if self.options['dry_run']:
+            self._do_dry_run()
+            return
+
         # Log the status report, and some more information about the given options
         self._log_status()
         LOG.info("Batch size: %d", self.options['batch_size'])
@@ -282,6 +333,32 @@ class Command(BaseCommand):
                     cursor.execute(command)
                 cursor.close()
 
+    def _do_dry_run(self):
+        """
+        Log the instances whose configuration settings would change if they were redeployed.
+        """
+        instance_ids = list(self._pending_instances().values_list('id', flat=True))
+        compute_changes = partial(get_configuration_changes, update=self.options.get('update', {}))
+        LOG.info("** Computing the configuration changes of %d instances **", len(instance_ids))
+        if self.options['jobs'] > 1:
+            # The worker processes must open their own database connections
+            connections.close_all()
+            with Pool(self.options['jobs']) as pool:
+                results = sorted(pool.imap_unordered(compute_changes, instance_ids, chunksize=10))
+        else:
+            results = [compute_changes(instance_id) for instance_id in instance_ids]
+
+        changed_count = 0
+        for instance_id, instance_name, changes in results:
+            if changes is None:
+                LOG.info("NO ACTIVE APPSERVER: %s [%s]", instance_name, instance_id)
+            elif changes:
+                changed_count += 1
+                LOG.info("CHANGED: %s [%s]: %s", instance_name, instance_id, ', '.join(changes))
+            else:
+                LOG.info("UNCHANGED: %s [%s]", instance_name, instance_id)
+        LOG.info("Instances needing redeployment: %d", changed_count)
+
     def _do_redeployment(self):
         """
         Run the redeployment in batches, logging the status for each loop.
@@ -330,6 +407,7 @@ class Command(BaseCommand):
                     num_attempts=num_attempts,
                     mark_active_on_success=activate_on_success,
                     deactivate_old_appservers=activate_on_success,
+                    skip_unchanged=self.options['skip_unchanged'],
                 )
 
             # 3. Give a status update.
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - Log entries partitioning management command
+"""
+
+# Imports #####################################################################
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from instance.models.log_entry import LogEntry
+
+
+# Classes #####################################################################
+
+
+class Command(BaseCommand):
+    """
+    partition_log_entries management command class
+    """
+    help = (
+        'Create the daily partitions of the log entries table for the coming days. '
+        'With --convert, first convert the log entries table into a partitioned table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert the log entries table into a partitioned table, if it is not partitioned yet.'
+        )
+        parser.add_argument(
+            '--days-ahead',
+            type=int,
+            default=settings.LOG_PARTITION_DAYS_AHEAD,
+            help='Number of days for which to create partitions (default: %(default)s).'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+            raise CommandError('Partitioning the log entries table requires PostgreSQL 10 or later.')
+
+        if LogEntry.is_partitioned():
+            LogEntry.create_partitions(options['days_ahead'])
+        elif options['convert']:
+            # Migrations written for a regular table, like adding indexes, can fail on a partitioned table
+            executor = MigrationExecutor(connection)
+            if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                raise CommandError('Apply all migrations before partitioning the log entries table.')
+            LogEntry.partition_table(options['days_ahead'])
+            self.stdout.write(self.style.SUCCESS('Converted the log entries table into a partitioned table.'))
+        else:
+            raise CommandError('The log entries table is not partitioned. Use --convert to partition it.')
+
+        self.stdout.write('Partitions: {}'.format(', '.join(name for name, dummy in LogEntry.get_partitions())))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-01-14 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEX_TOGETHER = ('content_type', 'object_id', 'created')
+
+# The index replaced by INDEX_TOGETHER, added by migration 0083
+OLD_INDEX_TOGETHER = ('content_type', 'object_id')
+
+
+def get_partitions(schema_editor, table):
+    """
+    Return the names of the partitions of the given table, if it is partitioned (PostgreSQL 10+)
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [table],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def drop_old_partition_indexes(schema_editor, partition):
+    """
+    Drop the indexes of the given partition which only cover the object columns
+
+    Only the legacy partition, which used to be the log entries table, has such an index.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, partition)
+    for name, constraint in constraints.items():
+        if constraint['index'] and not constraint['primary_key'] and not constraint['unique'] and \
+                constraint['columns'] == ['content_type_id', 'object_id']:
+            schema_editor.execute('DROP INDEX {}'.format(name))
+
+
+def create_indexes(apps, schema_editor):
+    """
+    Index the log entries by object and creation date, replacing the index by object
+
+    Partitioned tables can't have indexes, so if the table was partitioned before this migration ran,
+    each partition is indexed instead - like the partitions created by LogEntry.create_partitions().
+    """
+    # The historical model still has the index_together of migration 0083 here
+    LogEntry = apps.get_model('instance', 'LogEntry')
+    table = LogEntry._meta.db_table
+    partitions = get_partitions(schema_editor, table)
+    if partitions is None:
+        schema_editor.alter_index_together(LogEntry, set(LogEntry._meta.index_together), {INDEX_TOGETHER})
+        schema_editor.execute(
+            "CREATE INDEX instance_logentry_error_entries ON instance_logentry (content_type_id, object_id, created) "
+            "WHERE level IN ('ERROR', 'CRITICAL')"
+        )
+        return
+    for partition in partitions:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {0}_content_type_id_object_id_created '
+            'ON {0} (content_type_id, object_id, created)'.format(partition)
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {0}_error_entries ON {0} (content_type_id, object_id, created) '
+            "WHERE level IN ('ERROR', 'CRITICAL')".format(partition)
+        )
+        drop_old_partition_indexes(schema_editor, partition)
+
+
+def drop_indexes(apps, schema_editor):
+    """
+    Restore the index by object replaced by create_indexes() on a table which isn't partitioned
+
+    The indexes of partitions are kept, since the partitions created afterwards have them too.
+    """
+    LogEntry = apps.get_model('instance', 'LogEntry')
+    if get_partitions(schema_editor, LogEntry._meta.db_table) is None:
+        schema_editor.alter_index_together(LogEntry, {INDEX_TOGETHER}, {OLD_INDEX_TOGETHER})
+        schema_editor.execute("DROP INDEX instance_logentry_error_entries")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0112_openedxinstance_secret_key_rsa_private'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                # Includes a partial index for the error log of AppServers
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='logentry',
+                    index_together=set([INDEX_TOGETHER]),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-02-04 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('instance', '0113_logentry_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaybookTaskTiming',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('run_id', models.UUIDField(db_index=True, help_text='Identifies the playbook run the task belongs to.')),
+                ('playbook', models.CharField(max_length=255)),
+                ('task', models.CharField(max_length=255)),
+                ('host', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('changed', 'Changed'), ('skipped', 'Skipped'), ('failed', 'Failed'), ('ignored', 'Failed (ignored)'), ('unreachable', 'Unreachable')], max_length=11)),
+                ('duration', models.FloatField(blank=True, help_text='Duration of the task, in seconds.', null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='playbooktasktiming',
+            index_together=set([('content_type', 'object_id', 'created')]),
+        ),
+    ]
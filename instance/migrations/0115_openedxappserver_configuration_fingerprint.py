@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-02-11 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0114_playbooktasktiming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openedxappserver',
+            name='configuration_fingerprint',
+            field=models.CharField(blank=True, help_text='A hash of the settings and playbook commits this AppServer was provisioned with, set once the playbooks succeed. See create_configuration_fingerprint().', max_length=64),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-02-18 09:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0115_openedxappserver_configuration_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancingserver',
+            name='deployed_configuration_hash',
+            field=models.CharField(blank=True, help_text="A hash of the configuration fragments currently deployed on the load balancer. Reconfigurations which wouldn't change them don't run the playbook. Clear it to force the next reconfiguration to deploy the configuration.", max_length=64),
+        ),
+        migrations.CreateModel(
+            name='LoadBalancerFragment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_ref_id', models.PositiveIntegerField(help_text='The ID of the InstanceReference of the instance.')),
+                ('backend_map', models.TextField(blank=True)),
+                ('backend_conf', models.TextField(blank=True)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('rendered_version', models.PositiveIntegerField(default=0, help_text='The configuration version of the load balancer when the fragment was rendered.')),
+                ('invalidated_version', models.PositiveIntegerField(default=0, help_text='The configuration versions up to which the fragment must be rendered again.')),
+                ('load_balancing_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragments', to='instance.LoadBalancingServer')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='loadbalancerfragment',
+            unique_together=set([('load_balancing_server', 'instance_ref_id')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-02-20 14:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0116_loadbalancerfragment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancingserver',
+            name='runtime_changes_pending',
+            field=models.BooleanField(default=False, help_text='Whether backend changes were applied through the haproxy runtime API, but not written to the configuration files yet. The files are updated by the next periodic reconfiguration.'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2019-02-22 11:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instance', '0117_loadbalancingserver_runtime_changes_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadbalancerfragment',
+            name='context_hash',
+            field=models.CharField(blank=True, help_text='A hash of the settings and templates the fragment was rendered with.', max_length=64),
+        ),
+    ]
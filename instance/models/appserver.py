@@ -251,13 +251,12 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         elif self.status == Status.WaitingForServer:
             self._status_to_error()
 
-    def _get_log_entries(self, level_list=None, limit=None):
+    def get_log_entry_queryset(self, level_list=None):
         """
-        Return the list of log entry instances for this AppServer and the server it manages,
-        optionally filtering by logging level. If a limit is given, only the latest records are
-        returned.
+        Return a queryset of the log entries for this AppServer and the server it manages,
+        optionally filtering by logging level.
 
-        Returns oldest entries first.
+        Returns most recent entries first.
         """
         # TODO: Filter out log entries for which the user doesn't have view rights
         appserver_type = ContentType.objects.get_for_model(self)
@@ -268,6 +267,17 @@ class AppServer(ValidateModelMixin, TimeStampedModel):
         )
         if level_list:
             entries = entries.filter(level__in=level_list)
+        return entries
+
+    def _get_log_entries(self, level_list=None, limit=None):
+        """
+        Return the list of log entry instances for this AppServer and the server it manages,
+        optionally filtering by logging level. If a limit is given, only the latest records are
+        returned.
+
+        Returns oldest entries first.
+        """
+        entries = self.get_log_entry_queryset(level_list=level_list)
         if limit:
             # Apply the limit at the SQL/DB level while sorted by descending date, then reverse.
             # Otherwise, we'd have to retrieve all rows and then apply the limit using python.
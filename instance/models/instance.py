@@ -30,10 +30,10 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils.functional import cached_property
 from django_extensions.db.models import TimeStampedModel
-from swampdragon.pubsub_providers.data_publisher import publish_data
 
 from userprofile.models import UserProfile, Organization
 
+from instance.channels import publish_notification
 from instance.models.log_entry import LogEntry
 from instance.models.utils import default_setting
 from instance.logging import ModelLoggerAdapter
@@ -99,7 +99,7 @@ class InstanceReference(TimeStampedModel):
         """
         super().save(*args, **kwargs)
         # Notify anyone monitoring for changes via swampdragon/websockets:
-        publish_data('notification', {
+        publish_notification('notification', {
             'type': 'instance_update',
             'instance_id': self.pk,
         })
@@ -248,6 +248,16 @@ class Instance(ValidateModelMixin, models.Model):
         """
         return 'instance={} ({!s:.15})'.format(self.ref.pk, self.ref.name)
 
+    def get_log_entry_queryset(self):
+        """
+        Return a queryset of the log entries for this Instance, most recent first.
+
+        Does NOT include log entries of associated AppServers or Servers (VMs)
+        """
+        instance_type = ContentType.objects.get_for_model(self)
+        # TODO: Filter out log entries for which the user doesn't have view rights
+        return LogEntry.objects.filter(content_type=instance_type, object_id=self.pk)
+
     @property
     def log_entries(self):
         """
@@ -256,11 +266,7 @@ class Instance(ValidateModelMixin, models.Model):
         Does NOT include log entries of associated AppServers or Servers (VMs)
         """
         limit = settings.LOG_LIMIT
-
-        instance_type = ContentType.objects.get_for_model(self)
-        entries = LogEntry.objects.filter(content_type=instance_type, object_id=self.pk)
-        # TODO: Filter out log entries for which the user doesn't have view rights
-        return reversed(list(entries[:limit]))
+        return reversed(list(self.get_log_entry_queryset()[:limit]))
 
     def archive(self):
         """
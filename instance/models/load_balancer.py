@@ -21,6 +21,7 @@ Definition of the Load balancing server model.
 """
 import contextlib
 import functools
+import hashlib
 import logging
 import pathlib
 import random
@@ -32,8 +33,8 @@ from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 from django_extensions.db.models import TimeStampedModel
 
-from instance import ansible
-from instance.logging import ModelLoggerAdapter
+from instance import ansible, haproxy
+from instance.logging import ModelLoggerAdapter, PlaybookOutputSink
 from instance.models.shared_server import SharedServerManager
 from instance.models.utils import ValidateModelMixin
 
@@ -142,6 +143,24 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         )
     )
 
+    deployed_configuration_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text=(
+            'A hash of the configuration fragments currently deployed on the load balancer. '
+            'Reconfigurations which wouldn\'t change them don\'t run the playbook. '
+            'Clear it to force the next reconfiguration to deploy the configuration.'
+        )
+    )
+
+    runtime_changes_pending = models.BooleanField(
+        default=False,
+        help_text=(
+            'Whether backend changes were applied through the haproxy runtime API, but not written to the '
+            'configuration files yet. The files are updated by the next periodic reconfiguration.'
+        )
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = ModelLoggerAdapter(logger, {'obj': self})
@@ -158,13 +177,19 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
     def get_instances(self):
         """
         Yield all instances configured to use this load balancer.
+
+        Each kind of instance prefetches what it needs to render its load balancer configuration,
+        so the number of queries doesn't depend on the number of instances.
         """
         # Local import due to avoid problems with circular dependencies.
         from instance.models.mixins.load_balanced import LoadBalancedInstance
 
         for field in self._meta.get_fields():
             if field.one_to_many and issubclass(field.related_model, LoadBalancedInstance):
-                yield from getattr(self, field.get_accessor_name()).iterator()
+                # Not using iterator() here, since it would disable prefetch_related()
+                yield from field.related_model.prefetch_load_balancer_configuration(
+                    getattr(self, field.get_accessor_name()).all()
+                )
 
     def get_configuration(self, triggering_instance_id=None):
         """
@@ -176,23 +201,109 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
 
         The triggering_instance_id indicates the id of the instance reference that initiated the
         reconfiguration of the load balancer.
+
+        The fragment of each instance is stored, and only rendered again once the instance
+        invalidates it - see invalidate_fragment() - or once the settings it depends on changed.
+        """
+        return self._join_fragments(self.get_fragments(triggering_instance_id))
+
+    def get_fragments(self, triggering_instance_id=None):
         """
-        backend_map = []
-        backend_conf = []
+        Return the up-to-date LoadBalancerFragment of each associated instance.
+
+        Outdated and missing fragments are rendered and stored, and the fragments of the instances which
+        don't use this load balancer anymore are deleted.
+        """
+        stored_fragments = {fragment.instance_ref_id: fragment for fragment in self.fragments.all()}
+        fragments = []
         for instance in self.get_instances():
-            triggered_by_instance = instance.ref.pk == triggering_instance_id
-            map_entries, conf_entries = instance.get_load_balancer_configuration(
-                triggered_by_instance
-            )
-            backend_map.extend(
-                " ".join([domain.lower(), backend + self.fragment_name_postfix])
-                for domain, backend in map_entries
-            )
-            backend_conf.extend(
-                "backend {}\n{}\n".format(backend + self.fragment_name_postfix, conf)
-                for backend, conf in conf_entries
-            )
-        return "\n".join(backend_map), "\n".join(backend_conf)
+            fragment = stored_fragments.pop(instance.ref.pk, None)
+            context_hash = self.get_fragment_context_hash(instance)
+            if fragment is None or fragment.is_outdated(context_hash):
+                # Stale fragments were invalidated by their instance, which triggered this reconfiguration
+                triggered_by_instance = (
+                    (fragment is not None and fragment.is_stale) or instance.ref.pk == triggering_instance_id
+                )
+                fragment = self._render_fragment(instance, context_hash, triggered_by_instance)
+            fragments.append(fragment)
+        if stored_fragments:
+            self.fragments.filter(pk__in=[fragment.pk for fragment in stored_fragments.values()]).delete()
+        return fragments
+
+    def has_outdated_fragments(self):
+        """
+        Return whether the stored fragments differ from the ones get_fragments() would return.
+
+        Nothing is rendered: this tells whether the settings a fragment depends on changed since it was
+        rendered, which doesn't mark the load balancer as dirty.
+        """
+        stored_fragments = {fragment.instance_ref_id: fragment for fragment in self.fragments.all()}
+        for instance in self.get_instances():
+            fragment = stored_fragments.pop(instance.ref.pk, None)
+            if fragment is None or fragment.is_outdated(self.get_fragment_context_hash(instance)):
+                return True
+        return bool(stored_fragments)
+
+    def get_fragment_context_hash(self, instance):
+        """
+        Return a hash of what the configuration fragment of the given instance depends on, besides the
+        changes its instance invalidates it for.
+        """
+        return hashlib.sha256("{}\n{}".format(
+            self.fragment_name_postfix, instance.get_load_balancer_configuration_context()
+        ).encode()).hexdigest()
+
+    def _render_fragment(self, instance, context_hash, triggered_by_instance):
+        """
+        Render the configuration fragment of the given instance, and store it.
+        """
+        map_entries, conf_entries = instance.get_load_balancer_configuration(triggered_by_instance)
+        backend_map = "\n".join(
+            " ".join([domain.lower(), backend + self.fragment_name_postfix])
+            for domain, backend in map_entries
+        )
+        backend_conf = "\n".join(
+            "backend {}\n{}\n".format(backend + self.fragment_name_postfix, conf)
+            for backend, conf in conf_entries
+        )
+        # The invalidated_version isn't updated, so that an invalidation which happens while this
+        # fragment is rendered still marks it as stale.
+        fragment, dummy = LoadBalancerFragment.objects.update_or_create(
+            load_balancing_server=self,
+            instance_ref_id=instance.ref.pk,
+            defaults=dict(
+                backend_map=backend_map,
+                backend_conf=backend_conf,
+                content_hash=hashlib.sha256("{}\n{}".format(backend_map, backend_conf).encode()).hexdigest(),
+                context_hash=context_hash,
+                rendered_version=self.configuration_version,
+            ),
+        )
+        return fragment
+
+    @staticmethod
+    def _join_fragments(fragments):
+        """
+        Return the backend map and configuration of the given fragments.
+        """
+        return (
+            "\n".join(fragment.backend_map for fragment in fragments if fragment.backend_map),
+            "\n".join(fragment.backend_conf for fragment in fragments if fragment.backend_conf),
+        )
+
+    def invalidate_fragment(self, instance_ref_id):
+        """
+        Mark the configuration fragment of the given instance as stale.
+
+        This must happen before configuration_version is increased: the fragment is rendered again
+        by the reconfigurations which start with a configuration version higher than the current one.
+        """
+        self.refresh_from_db(fields=['configuration_version'])
+        LoadBalancerFragment.objects.update_or_create(
+            load_balancing_server=self,
+            instance_ref_id=instance_ref_id,
+            defaults=dict(invalidated_version=self.configuration_version + 1),
+        )
 
     def get_ansible_vars(self, triggering_instance_id=None):
         """
@@ -202,6 +313,12 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         reconfiguration of the load balancer.
         """
         backend_map, backend_conf = self.get_configuration(triggering_instance_id)
+        return self._render_ansible_vars(backend_map, backend_conf)
+
+    def _render_ansible_vars(self, backend_map, backend_conf):
+        """
+        Render the ansible variables to deploy the given backend map and configuration.
+        """
         fragment_name = settings.LOAD_BALANCER_FRAGMENT_NAME_PREFIX + self.fragment_name_postfix
         return (
             "FRAGMENT_NAME: {fragment_name}\n"
@@ -222,19 +339,161 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         This is factored out into a separate method so it can be mocked out in the tests.
         """
         playbook_path = pathlib.Path(settings.SITE_ROOT) / "playbooks/load_balancer_conf/load_balancer_conf.yml"
-        returncode = ansible.capture_playbook_output(
-            requirements_path=str(playbook_path.parent / "requirements.txt"),
-            inventory_str=self.domain,
-            vars_str=ansible_vars,
-            playbook_path=str(playbook_path),
-            username=self.ssh_username,
-            logger_=self.logger,
-        )
+        with PlaybookOutputSink(self.logger) as log_sink:
+            returncode = ansible.capture_playbook_output(
+                requirements_path=str(playbook_path.parent / "requirements.txt"),
+                inventory_str=self.domain,
+                vars_str=ansible_vars,
+                playbook_path=str(playbook_path),
+                username=self.ssh_username,
+                logger_=log_sink,
+            )
         if returncode != 0:
             self.logger.error("Playbook to reconfigure load-balancing server %s failed.", self)
             raise ReconfigurationFailed
 
-    def reconfigure(self, triggering_instance_id=None, mark_dirty=True):
+    def run_runtime_commands(self, commands):
+        """
+        Run the given commands through the haproxy runtime API of the server.
+
+        This is factored out into a separate method so it can be mocked out in the tests.
+        """
+        haproxy.run_commands(
+            commands,
+            socket_path=settings.LOAD_BALANCER_RUNTIME_API_SOCKET,
+            ssh_target="{}@{}".format(self.ssh_username, self.domain),
+        )
+
+    def get_runtime_commands(self, previous_fragments, fragments):
+        """
+        Return the haproxy runtime API commands switching from the previous fragments to the new ones,
+        or None if the changes can't be applied at runtime.
+
+        This is only possible when the previous fragments are the deployed ones, and only servers of
+        the existing backends changed.
+        """
+        if not settings.LOAD_BALANCER_RUNTIME_API_SOCKET:
+            return None
+        previous_fragments = {fragment.instance_ref_id: fragment for fragment in previous_fragments}
+        if set(previous_fragments) != {fragment.instance_ref_id for fragment in fragments}:
+            return None
+        if self._hash_fragments(
+                previous_fragments[fragment.instance_ref_id] for fragment in fragments
+        ) != self.deployed_configuration_hash:
+            return None
+
+        commands = []
+        for fragment in fragments:
+            previous_fragment = previous_fragments[fragment.instance_ref_id]
+            if previous_fragment.backend_map != fragment.backend_map:
+                return None
+            fragment_commands = haproxy.get_runtime_commands(previous_fragment.backend_conf, fragment.backend_conf)
+            if fragment_commands is None:
+                return None
+            commands.extend(fragment_commands)
+        return commands
+
+    def apply_runtime_changes(self, previous_fragments, fragments):
+        """
+        Try to switch from the previous fragments to the new ones through the haproxy runtime API - see
+        get_runtime_commands(). Returns whether the changes were applied.
+        """
+        commands = self.get_runtime_commands(previous_fragments, fragments)
+        if commands is None:
+            return False
+        if not commands:
+            # Only the formatting of the configuration changed
+            return True
+
+        self.logger.info("Applying backend changes to load-balancing server %s at runtime", self.domain)
+        try:
+            self.run_runtime_commands(commands)
+        except haproxy.RuntimeAPIError as exc:
+            self.logger.warning("Unable to apply backend changes at runtime: %s", exc)
+            return False
+        return True
+
+    @staticmethod
+    def _hash_fragments(fragments):
+        """
+        Return a hash of the content of the given fragments.
+        """
+        return hashlib.sha256("\n".join(fragment.content_hash for fragment in fragments).encode()).hexdigest()
+
+    def mark_dirty(self, triggering_instance_id=None):
+        """
+        Mark the configuration of the load balancer as dirty.
+
+        The triggering_instance_id indicates the id of the instance reference whose configuration
+        changed, if any.
+        """
+        if triggering_instance_id is not None:
+            self.invalidate_fragment(triggering_instance_id)
+        # We need to use an F expression here.  The problem is not other processes trying to
+        # increase this counter concurrently – that wouldn't matter, since we don't care whether
+        # we increase this counter by one or by two, since both marks the LB as dirty.  However, if
+        # another process is making a completely unrelated change to the LB object we might lose
+        # the increment altogether.
+        LoadBalancingServer.objects.filter(pk=self.pk).update(
+            configuration_version=models.F("configuration_version") + 1
+        )
+
+    def request_reconfiguration(self, triggering_instance_id=None):
+        """
+        Mark the configuration of the load balancer as dirty, and schedule its reconfiguration.
+        """
+        self.mark_dirty(triggering_instance_id)
+        self.schedule_reconfiguration()
+
+    def schedule_reconfiguration(self, delay=None):
+        """
+        Schedule a reconfiguration of the load balancer, unless one is already scheduled.
+
+        The reconfiguration runs `delay` seconds later, or LOAD_BALANCER_RECONFIGURATION_DELAY seconds
+        by default, so the changes requested in the meantime are deployed together. The scheduled
+        reconfiguration clears the flag before it starts, so changes requested while it runs schedule
+        another one.
+        """
+        # Local import due to avoid problems with circular dependencies.
+        from instance.tasks import reconfigure_load_balancer
+
+        # The flag expires, in case the task gets lost
+        if cache.add(self._scheduled_reconfiguration_key, True, timeout=settings.REDIS_LOCK_TIMEOUT):
+            reconfigure_load_balancer.schedule(
+                args=(self.pk,),
+                delay=settings.LOAD_BALANCER_RECONFIGURATION_DELAY if delay is None else delay,
+            )
+
+    def schedule_configuration_files_update(self):
+        """
+        Schedule a reconfiguration writing the changes applied through the haproxy runtime API to the
+        configuration files, LOAD_BALANCER_CONFIGURATION_FILES_DELAY seconds later.
+
+        Reconfigurations which run in the meantime may apply more changes at runtime: each one schedules
+        another update, and the updates which find nothing left to write don't run the playbook.
+        """
+        # Local import due to avoid problems with circular dependencies.
+        from instance.tasks import update_load_balancer_configuration_files
+
+        update_load_balancer_configuration_files.schedule(
+            args=(self.pk,),
+            delay=settings.LOAD_BALANCER_CONFIGURATION_FILES_DELAY,
+        )
+
+    def clear_scheduled_reconfiguration(self):
+        """
+        Allow schedule_reconfiguration() to schedule a new reconfiguration.
+        """
+        cache.delete(self._scheduled_reconfiguration_key)
+
+    @property
+    def _scheduled_reconfiguration_key(self):
+        """
+        The cache key flagging that a reconfiguration of the load balancer is scheduled.
+        """
+        return "load_balancer_reconfiguration_scheduled:{}".format(self.pk)
+
+    def reconfigure(self, triggering_instance_id=None, mark_dirty=True, runtime_api=True, blocking=False):
         """
         Regenerate the configuration fragments on the load-balancing server.
 
@@ -245,30 +504,49 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
         this method is called because the configuration changed, the flag should be set to True (the
         default).  If this method is called because the LB was marked dirty earlier, the flag
         should be set to False.
+
+        When the configuration changed and the runtime_api flag is set, backend server changes are
+        applied through the haproxy runtime API if possible (see apply_runtime_changes()), and the
+        playbook writing them to the configuration files is scheduled to run later. Otherwise the
+        playbook is run, which also writes the changes applied at runtime to the configuration files.
+
+        With the blocking flag, this waits for other reconfigurations to finish instead of skipping
+        the reconfiguration.
         """
         if mark_dirty:
-            # We need to use an F expression here.  The problem is not other processes trying to
-            # increase this counter concurrently – that wouldn't matter, since we don't care whether
-            # we increase this counter by one or by two, since both marks the LB as dirty.  However, if
-            # another process is making a completely unrelated change to the LB object we might lose
-            # the increment altogether.
-            LoadBalancingServer.objects.filter(pk=self.pk).update(
-                configuration_version=models.F("configuration_version") + 1
-            )
+            self.mark_dirty(triggering_instance_id)
 
+        applied_at_runtime = False
         try:
-            with self._configuration_lock(blocking=False):
+            with self._configuration_lock(blocking=blocking):
                 # Memorize the configuration version, in case new threads change it.
                 self.refresh_from_db()
                 candidate_configuration_version = self.configuration_version
-                self.logger.info("Reconfiguring load-balancing server %s", self.domain)
-                self.run_playbook(self.get_ansible_vars(triggering_instance_id))
+                previous_fragments = list(self.fragments.all())
+                fragments = self.get_fragments(triggering_instance_id)
+                configuration_hash = self._hash_fragments(fragments)
+                runtime_changes_pending = self.runtime_changes_pending
+                if configuration_hash == self.deployed_configuration_hash and (
+                        runtime_api or not runtime_changes_pending
+                ):
+                    self.logger.info("Configuration of load-balancing server %s is unchanged", self.domain)
+                elif runtime_api and self.apply_runtime_changes(previous_fragments, fragments):
+                    runtime_changes_pending = applied_at_runtime = True
+                else:
+                    self.logger.info("Reconfiguring load-balancing server %s", self.domain)
+                    self.run_playbook(self._render_ansible_vars(*self._join_fragments(fragments)))
+                    runtime_changes_pending = False
                 LoadBalancingServer.objects.filter(pk=self.pk).update(
-                    deployed_configuration_version=candidate_configuration_version
+                    deployed_configuration_version=candidate_configuration_version,
+                    deployed_configuration_hash=configuration_hash,
+                    runtime_changes_pending=runtime_changes_pending,
                 )
                 self.refresh_from_db()
         except OtherReconfigurationInProgress:
             pass
+        if applied_at_runtime:
+            # Scheduled once the lock is released, since the task waits for it
+            self.schedule_configuration_files_update()
 
     def deconfigure(self):
         """
@@ -280,6 +558,12 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             self.run_playbook(
                 "FRAGMENT_NAME: {fragment_name}\nREMOVE_FRAGMENT: True".format(fragment_name=fragment_name)
             )
+            LoadBalancingServer.objects.filter(pk=self.pk).update(
+                deployed_configuration_hash='',
+                runtime_changes_pending=False,
+            )
+            self.deployed_configuration_hash = ''
+            self.runtime_changes_pending = False
 
     def delete(self, *args, **kwargs):
         """
@@ -303,3 +587,54 @@ class LoadBalancingServer(ValidateModelMixin, TimeStampedModel):
             yield lock
         finally:
             lock.release()
+
+
+class LoadBalancerFragment(models.Model):
+    """
+    The haproxy configuration fragment of an instance, as stored for a load-balancing server.
+
+    A fragment is stale - and rendered again by the next reconfiguration - once it has been
+    invalidated after it was rendered. Versions refer to the configuration_version of the
+    load-balancing server. It is also rendered again once the settings and templates it was
+    rendered with changed, which its context_hash tells.
+    """
+    load_balancing_server = models.ForeignKey(
+        LoadBalancingServer, on_delete=models.CASCADE, related_name='fragments',
+    )
+    # Not a foreign key, so that the fragments of deleted instances are only removed by the next reconfiguration
+    instance_ref_id = models.PositiveIntegerField(help_text='The ID of the InstanceReference of the instance.')
+    backend_map = models.TextField(blank=True)
+    backend_conf = models.TextField(blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    context_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='A hash of the settings and templates the fragment was rendered with.'
+    )
+    rendered_version = models.PositiveIntegerField(
+        default=0,
+        help_text='The configuration version of the load balancer when the fragment was rendered.'
+    )
+    invalidated_version = models.PositiveIntegerField(
+        default=0,
+        help_text='The configuration versions up to which the fragment must be rendered again.'
+    )
+
+    class Meta:
+        unique_together = ('load_balancing_server', 'instance_ref_id')
+
+    def __str__(self):
+        return 'Fragment of instance {} on {}'.format(self.instance_ref_id, self.load_balancing_server)
+
+    @property
+    def is_stale(self):
+        """
+        Whether this fragment was invalidated after it was rendered.
+        """
+        return self.rendered_version < self.invalidated_version
+
+    def is_outdated(self, context_hash):
+        """
+        Whether this fragment is stale, or was rendered with other settings than the given context hash.
+        """
+        return self.is_stale or self.context_hash != context_hash
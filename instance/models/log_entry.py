@@ -22,13 +22,17 @@ Instance app models - LogEntry
 
 # Imports #####################################################################
 
+from datetime import datetime, time, timedelta
 import logging
+import re
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_extensions.db.models import TimeStampedModel
 
 from .utils import ValidateModelMixin
@@ -62,7 +66,7 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
     class Meta:
         ordering = ('-created', )
         index_together = [
-            ['content_type', 'object_id'],
+            ['content_type', 'object_id', 'created'],
         ]
         permissions = (
             ("read_log_entry", "Can read LogEntry"),
@@ -77,6 +81,9 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
         Clean fields, including the 'object_id' field
         """
         super().clean_fields(**kwargs)
+        exclude = kwargs.get('exclude') or []
+        if 'content_type' in exclude and 'object_id' in exclude:
+            return
         # This check is here rather than in clean() because it must come after the built-in
         # validation of the content_type field, and we should only check object_id if
         # content_type has passed validation.
@@ -88,6 +95,143 @@ class LogEntry(ValidateModelMixin, TimeStampedModel):
             if not self.content_type.get_all_objects_for_this_type(pk=self.object_id).exists():
                 raise ValidationError({'object_id': 'Object attached to LogEntry has bad content_type or primary key'})
 
+    @classmethod
+    def is_partitioned(cls):
+        """
+        Return True if the log entries table is range-partitioned by creation date
+
+        This requires PostgreSQL 10 or later - see `partition_table()`.
+        """
+        if connection.vendor != 'postgresql' or connection.pg_version < 100000:
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+                [cls._meta.db_table],
+            )
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def get_partitions(cls):
+        """
+        Return a list of (name, upper bound) tuples for the partitions of the log entries table,
+        ordered by upper bound
+
+        Log entries of a partition were all created before its upper bound.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+                "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = %s::regclass",
+                [cls._meta.db_table],
+            )
+            partitions = []
+            for name, bound in cursor.fetchall():
+                match = re.search(r"TO \('([^']+)'\)", bound)
+                partitions.append((name, parse_datetime(match.group(1)) if match else None))
+        return sorted(partitions, key=lambda partition: (partition[1] is None, partition[1]))
+
+    @classmethod
+    def partition_table(cls, days_ahead):
+        """
+        Convert the log entries table into a table partitioned by day
+
+        The existing table is kept as is, without copying any data: it becomes the "legacy" partition,
+        which holds all log entries created until the end of the current day. A partition is then
+        created for each of the following `days_ahead` days. The legacy partition is dropped by
+        `drop_partitions()` once all of its log entries are old enough.
+
+        Migrations must all be applied first: those written for a regular table can fail on a
+        partitioned one.
+        """
+        table = cls._meta.db_table
+        legacy_partition = '{}_legacy'.format(table)
+        first_day = timezone.now().date() + timedelta(days=1)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence, = cursor.fetchone()
+            cursor.execute('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(table))
+            cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, legacy_partition))
+            cursor.execute(
+                'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                'PARTITION BY RANGE (created)'.format(table, legacy_partition)
+            )
+            # The ID sequence must outlive the legacy partition
+            cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, table))
+            cursor.execute(
+                'ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO (%s)'.format(
+                    table, legacy_partition
+                ),
+                [cls._get_day_start(first_day)],
+            )
+        cls.create_partitions(days_ahead)
+
+    @classmethod
+    def create_partitions(cls, days_ahead):
+        """
+        Create the missing daily partitions of the log entries table, up to `days_ahead` days from now
+        """
+        table = cls._meta.db_table
+        partitions = cls.get_partitions()
+        if partitions and partitions[-1][1] is not None:
+            day = partitions[-1][1].date()
+        else:
+            day = timezone.now().date()
+        last_day = timezone.now().date() + timedelta(days=days_ahead)
+        with connection.cursor() as cursor:
+            while day <= last_day:
+                partition = '{}_p{:%Y%m%d}'.format(table, day)
+                logger.info('Creating log entries partition %s', partition)
+                cursor.execute(
+                    'CREATE TABLE {partition} PARTITION OF {table} ('
+                    '    PRIMARY KEY (id),'
+                    '    FOREIGN KEY (content_type_id) REFERENCES {content_type_table} (id)'
+                    '        DEFERRABLE INITIALLY DEFERRED'
+                    ') FOR VALUES FROM (%s) TO (%s)'.format(
+                        partition=partition, table=table, content_type_table=ContentType._meta.db_table,
+                    ),
+                    [cls._get_day_start(day), cls._get_day_start(day + timedelta(days=1))],
+                )
+                # Partitioned tables can't have indexes, so each partition gets its own
+                cursor.execute(
+                    'CREATE INDEX {0}_content_type_id_object_id_created '
+                    'ON {0} (content_type_id, object_id, created)'.format(partition)
+                )
+                cursor.execute(
+                    'CREATE INDEX {0}_error_entries ON {0} (content_type_id, object_id, created) '
+                    "WHERE level IN ('ERROR', 'CRITICAL')".format(partition)
+                )
+                cursor.execute('CREATE INDEX {0}_level ON {0} (level)'.format(partition))
+                day += timedelta(days=1)
+
+    @classmethod
+    def drop_partitions(cls, cutoff):
+        """
+        Delete the log entries created before `cutoff`, by dropping the partitions that only contain
+        such log entries
+
+        Daily partitions are kept until the end of the day on which the cutoff falls, so log entries
+        can be kept up to a day longer than requested. Until it can be dropped, old log entries are
+        deleted from the legacy partition one by one.
+        """
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            for partition, upper_bound in cls.get_partitions():
+                if upper_bound is not None and upper_bound <= cutoff:
+                    logger.info('Dropping log entries partition %s', partition)
+                    cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(table, partition))
+                    cursor.execute('DROP TABLE {}'.format(partition))
+                elif partition == '{}_legacy'.format(table):
+                    cursor.execute('DELETE FROM {} WHERE created < %s'.format(partition), [cutoff])
+
+    @staticmethod
+    def _get_day_start(day):
+        """
+        Return the datetime at which the given day starts, in UTC
+        """
+        return datetime.combine(day, time.min).replace(tzinfo=timezone.utc)
+
     @staticmethod
     def on_post_delete(sender, instance, **kwargs):
         """
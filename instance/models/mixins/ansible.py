@@ -23,13 +23,17 @@ Instance app model mixins - Ansible
 # Imports #####################################################################
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import os
 import yaml
 
 from django.conf import settings
-from django.db import models
+from django.db import connection, models
 
 from instance import ansible
+from instance.logging import PlaybookOutputSink
+from instance.models.task_timing import PlaybookTaskTimingRecorder
 from instance.repo import open_repository
 
 
@@ -41,7 +45,10 @@ Playbook = namedtuple('Playbook', [
     'requirements_path',  # Relative path to a python requirements file to install before running the playbook
     'version',  # The git tag/commit hash/branch to use
     'variables',  # A YAML string containing extra variables to pass to ansible when running this playbook
+    'name',  # A name for this playbook, used in `depends_on` - defaults to playbook_path
+    'depends_on',  # The names of the playbooks which must succeed before this one runs - defaults to all previous ones
 ])
+Playbook.__new__.__defaults__ = (None, None)
 
 
 class AnsibleAppServerMixin(models.Model):
@@ -101,35 +108,110 @@ class AnsibleAppServerMixin(models.Model):
             '{group}'.format(group=self.INVENTORY_GROUP, server_ip=public_ip)
         )
 
-    def _run_playbook(self, working_dir, playbook):
+    def _run_playbook(self, working_dir, playbook, log_collector=None):
         """
         Run a playbook against the AppServer's VM
+
+        Returns the last lines of its output and its return code. The lines are collected in `log_collector`
+        instead when it's given, and the collector is returned.
         """
-        return ansible.capture_playbook_output(
-            requirements_path=os.path.join(working_dir, playbook.requirements_path),
-            inventory_str=self.inventory_str,
-            vars_str=playbook.variables,
-            playbook_path=os.path.join(working_dir, playbook.playbook_path),
-            username=settings.OPENSTACK_SANDBOX_SSH_USERNAME,
-            logger_=self.logger,
-            collect_logs=True,
-        )
+        with PlaybookOutputSink(self.logger) as log_sink, \
+                PlaybookTaskTimingRecorder(self, playbook.playbook_path) as timing_recorder:
+            return ansible.capture_playbook_output(
+                requirements_path=os.path.join(working_dir, playbook.requirements_path),
+                inventory_str=self.inventory_str,
+                vars_str=playbook.variables,
+                playbook_path=os.path.join(working_dir, playbook.playbook_path),
+                username=settings.OPENSTACK_SANDBOX_SSH_USERNAME,
+                logger_=log_sink,
+                collect_logs=True,
+                log_collector=log_collector,
+                task_event_handler=timing_recorder.record if settings.ANSIBLE_RECORD_TASK_TIMINGS else None,
+            )
+
+    @staticmethod
+    def _prepare_playbook(playbook):
+        """
+        Clone the repository of the given playbook and build its virtualenv, and return an `ExitStack`
+        which deletes the clone once closed, along with the cloned repository
 
-    def run_ansible_playbooks(self):
+        This runs in a background thread. The log entries of the repository and virtualenv helpers are
+        written to the database from that thread, so its database connection is closed once done.
+        """
+        try:
+            with ExitStack() as stack:
+                configuration_repo = stack.enter_context(open_repository(playbook.source_repo, ref=playbook.version))
+                ansible.prepare_virtualenv(os.path.join(configuration_repo.working_dir, playbook.requirements_path))
+                return stack.pop_all(), configuration_repo
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _cleanup_preparations(executor, preparations):
+        """
+        Cancel the pending playbook preparations, wait for the running one, and delete the cloned
+        repositories - see _prepare_playbook()
+        """
+        for preparation in preparations:
+            preparation.cancel()
+        executor.shutdown()
+        for preparation in preparations:
+            if not preparation.cancelled() and preparation.exception() is None:
+                repository_cleanup, dummy = preparation.result()
+                repository_cleanup.close()
+
+    def _run_prepared_playbooks(self, playbooks, preparations, log_collector, commits):
+        """
+        Run the given ordered playbooks once their preparation completes - see run_ansible_playbooks()
+
+        Returns the return code of the first failed playbook, if any, and the set of names of the failed
+        and skipped playbooks.
+        """
+        returncode = 0
+        failed = set()
+        for (playbook, dependencies), preparation in zip(playbooks, preparations):
+            name = get_playbook_name(playbook)
+            if dependencies & failed:
+                self.logger.info('Skipping playbook "%s", which depends on a failed playbook', name)
+                failed.add(name)
+                preparation.cancel()
+                continue
+            dummy, configuration_repo = preparation.result()
+            if commits is not None:
+                commits[(playbook.source_repo, playbook.version)] = configuration_repo.rev_parse('HEAD')
+            self.logger.info('Running playbook "%s" from "%s"', playbook.playbook_path, playbook.source_repo)
+            dummy, playbook_returncode = self._run_playbook(configuration_repo.working_dir, playbook, log_collector)
+            if playbook_returncode != 0:
+                self.logger.error('Playbook failed for AppServer %s', self)
+                failed.add(name)
+                returncode = returncode or playbook_returncode
+        return returncode, failed
+
+    def run_ansible_playbooks(self, commits=None):
         """
         Provision the server using ansible
+
+        Returns a `PlaybookLogCollector` with the output of the playbooks, and the return code of the
+        first failed playbook, if any. When a `commits` dict is given, the hash of the commit each playbook
+        ran from is stored in it, under the (source_repo, version) of the playbook.
+
+        The playbooks run one at a time, after the playbooks they depend on - the ones which depend on a
+        failed playbook are skipped. Meanwhile, the repositories and virtualenvs of the next playbooks
+        are prepared in the background, unless they're skipped.
         """
-        log = []
-        for playbook in self.get_playbooks():
-            with open_repository(playbook.source_repo, ref=playbook.version) as configuration_repo:
-                self.logger.info('Running playbook "%s" from "%s"', playbook.playbook_path, playbook.source_repo)
-                playbook_log, returncode = self._run_playbook(configuration_repo.working_dir, playbook)
-                log += playbook_log
-                if returncode != 0:
-                    self.logger.error('Playbook failed for AppServer %s', self)
-                    break
-        else:
-            self.logger.info('Playbooks completed for AppServer %s', self)
+        with ExitStack() as stack:
+            # The log collector is closed if the run fails, and handed over to the caller otherwise
+            log = stack.enter_context(ansible.PlaybookLogCollector())
+            playbooks = order_playbooks(self.get_playbooks())
+            executor = ThreadPoolExecutor(max_workers=1)
+            preparations = [executor.submit(self._prepare_playbook, playbook) for playbook, dummy in playbooks]
+            try:
+                returncode, failed = self._run_prepared_playbooks(playbooks, preparations, log, commits)
+            finally:
+                self._cleanup_preparations(executor, preparations)
+            if not failed:
+                self.logger.info('Playbooks completed for AppServer %s', self)
+            stack.pop_all()
         return (log, returncode)
 
     def save(self, *args, **kwargs):
@@ -137,3 +219,47 @@ class AnsibleAppServerMixin(models.Model):
         if not self.pk:
             self.common_configuration_settings = self.create_common_configuration_settings()
         super().save(*args, **kwargs)
+
+
+# Functions ###################################################################
+
+def get_playbook_name(playbook):
+    """
+    Return the name of the given playbook
+    """
+    return playbook.name or playbook.playbook_path
+
+
+def order_playbooks(playbooks):
+    """
+    Return a list of (playbook, dependency names) tuples, where each playbook comes after all its dependencies,
+    and the playbooks are otherwise kept in the given order
+
+    Raises ValueError when a dependency doesn't exist or when dependencies are circular.
+    """
+    names = [get_playbook_name(playbook) for playbook in playbooks]
+    dependencies = []
+    for index, playbook in enumerate(playbooks):
+        if playbook.depends_on is None:
+            dependencies.append(set(names[:index]))
+        else:
+            unknown = set(playbook.depends_on) - set(names)
+            if unknown:
+                raise ValueError('Unknown playbook dependencies for "{}": {}'.format(
+                    names[index], ', '.join(sorted(unknown))
+                ))
+            dependencies.append(set(playbook.depends_on))
+
+    ordered = []
+    done = set()
+    pending = list(range(len(playbooks)))
+    while pending:
+        for index in pending:
+            if dependencies[index] <= done:
+                break
+        else:
+            raise ValueError('Circular playbook dependencies: {}'.format(', '.join(names[i] for i in pending)))
+        pending.remove(index)
+        ordered.append((playbooks[index], dependencies[index]))
+        done.add(names[index])
+    return ordered
@@ -22,6 +22,8 @@ Instance app model mixins - load balancing
 
 # Imports #####################################################################
 
+import json
+
 from django.conf import settings
 from django.db import models
 
@@ -40,6 +42,23 @@ class LoadBalancedInstance(models.Model):
     class Meta:
         abstract = True
 
+    @classmethod
+    def prefetch_load_balancer_configuration(cls, queryset):
+        """
+        Return the given queryset of instances, prefetching what get_load_balancer_configuration() uses.
+        """
+        return queryset
+
+    def get_load_balancer_configuration_context(self):
+        """
+        Return a string of the settings get_load_balancer_configuration() depends on, besides the
+        active appservers.
+
+        The load balancers store the configuration of each instance, and render it again once this
+        changes. Changes of the active appservers are requested with reconfigure_load_balancer().
+        """
+        return json.dumps([list(self.get_load_balanced_domains()), settings.PRELIMINARY_PAGE_SERVER_IP])
+
     def get_load_balanced_domains(self):  # pylint: disable=no-self-use
         """
         Return an iterable of domains that should be handled by the load balancer.
@@ -77,7 +96,7 @@ class LoadBalancedInstance(models.Model):
             if load_balancing_server is None:
                 return
         self.logger.info("Triggering reconfiguration of the load balancing server...")
-        load_balancing_server.reconfigure(self.ref.pk)
+        load_balancing_server.request_reconfiguration(self.ref.pk)
 
     def get_preliminary_page_config(self, primary_key):
         """
@@ -21,8 +21,8 @@ Open edX instance database mixin
 """
 import hashlib
 import hmac
-import yaml
 
+from instance import ansible
 from instance.models.mixins.database import MySQLInstanceMixin, MongoDBInstanceMixin
 from instance.models.mixins.rabbitmq import RabbitMQInstanceMixin
 
@@ -422,9 +422,9 @@ class OpenEdXDatabaseMixin(MySQLInstanceMixin, MongoDBInstanceMixin, RabbitMQIns
             "EDXAPP_CELERY_BROKER_USE_SSL": True
         }
 
-    def get_database_settings(self):
+    def get_database_variables(self):
         """
-        Get configuration_database_settings to pass to a new AppServer
+        Get the database variables to pass to a new AppServer, as a dict
         """
         new_settings = {}
 
@@ -439,4 +439,10 @@ class OpenEdXDatabaseMixin(MySQLInstanceMixin, MongoDBInstanceMixin, RabbitMQIns
         # RabbitMQ:
         new_settings.update(self._get_rabbitmq_settings())
 
-        return yaml.dump(new_settings, default_flow_style=False)
+        return new_settings
+
+    def get_database_settings(self):
+        """
+        Get configuration_database_settings to pass to a new AppServer
+        """
+        return ansible.dump_yaml(self.get_database_variables())
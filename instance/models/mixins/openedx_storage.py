@@ -19,8 +19,7 @@
 """
 Open edX instance database mixin
 """
-import yaml
-
+from instance import ansible
 from .storage import SwiftContainerInstanceMixin, S3BucketInstanceMixin, StorageContainer
 
 
@@ -159,13 +158,20 @@ class OpenEdXStorageMixin(StorageContainer, SwiftContainerInstanceMixin, S3Bucke
             "SWIFT_LOG_SYNC_REGION_NAME": self.swift_openstack_region,
         }
 
-    def get_storage_settings(self):
+    def get_storage_variables(self):
         """
-        Get configuration_storage_settings to pass to a new AppServer
+        Get the storage variables to pass to a new AppServer, as a dict
         """
         if self.storage_type == self.S3_STORAGE and \
                 self.s3_access_key and self.s3_secret_access_key and self.s3_bucket_name:
-            return yaml.dump(self._get_s3_settings(), default_flow_style=False)
+            return self._get_s3_settings()
         elif self.storage_type == self.SWIFT_STORAGE:
-            return yaml.dump(self._get_swift_settings(), default_flow_style=False)
-        return ""
+            return self._get_swift_settings()
+        return {}
+
+    def get_storage_settings(self):
+        """
+        Get configuration_storage_settings to pass to a new AppServer
+        """
+        variables = self.get_storage_variables()
+        return ansible.dump_yaml(variables) if variables else ""
@@ -19,10 +19,10 @@
 """
 Open edX instance theme mixin, e.g. for simple_theme related settings
 """
-import yaml
-
 from django.db import models
 
+from instance import ansible
+
 
 # Classes #####################################################################
 
@@ -44,16 +44,16 @@ class OpenEdXThemeMixin(models.Model):
     class Meta:
         abstract = True
 
-    def get_theme_settings(self):
+    def get_theme_variables(self):
         """
-        Returns a text string with ansible variables for design fields (colors, logo, ...)
-        in YAML format, to be passed to configuration_theme_settings.
+        Returns a dict with ansible variables for design fields (colors, logo, ...),
+        or an empty dict if no theme should be deployed.
         """
 
         if not self.deploy_simpletheme:
             # This is the case e.g. of instances registered before the theme fields were available.
             # We don't change their colors and we don't use simple_theme
-            return ""
+            return {}
 
         # application can be None (for instances not created through the form) or a
         # BetaTestApplication object. first() returns None or object.
@@ -62,7 +62,7 @@ class OpenEdXThemeMixin(models.Model):
         if not application:
             # Instance wasn't created from application form, so no colors will be set or changed
             # and simple_theme won't be used (unless manually requested through other settings).
-            return ""
+            return {}
 
         # These settings set the values required by simple_theme
         settings = {
@@ -125,4 +125,12 @@ class OpenEdXThemeMixin(models.Model):
                              footer_bg=application.footer_bg_color)
         }
 
-        return yaml.dump(settings, default_flow_style=False)
+        return settings
+
+    def get_theme_settings(self):
+        """
+        Returns a text string with ansible variables for design fields (colors, logo, ...)
+        in YAML format, to be passed to configuration_theme_settings.
+        """
+        variables = self.get_theme_variables()
+        return ansible.dump_yaml(variables) if variables else ""
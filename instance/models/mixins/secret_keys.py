@@ -33,7 +33,8 @@ from Cryptodome.PublicKey import RSA
 from jwkest import jwk
 
 from django.db import models
-import yaml
+
+from instance import ansible
 
 # Functions ###################################################################
 
@@ -176,9 +177,9 @@ class SecretKeyInstanceMixin(models.Model):
 
         return jwk_key_pair
 
-    def get_secret_key_settings(self):
+    def get_secret_key_variables(self):
         """
-        Render the secret key settings as YAML and return it for use in the appserver.
+        Return the secret key settings as a dict, for use in the appserver.
         """
         if not self.secret_key_b64encoded:
             if not self.appserver_set.exists():
@@ -186,7 +187,7 @@ class SecretKeyInstanceMixin(models.Model):
                     'Attempted to create secret key for instance {}, but no master key present.'.format(self)
                 )
             self.logger.warning('Instance does not have a secret key; not prefilling variables.')
-            return ''
+            return {}
         keys = {var: self.get_secret_key_for_var(var) for var in OPENEDX_SECRET_KEYS}
         for to_var, from_var in OPENEDX_SHARED_KEYS.items():
             keys[to_var] = keys[from_var]
@@ -196,7 +197,14 @@ class SecretKeyInstanceMixin(models.Model):
         keys['COMMON_JWT_PUBLIC_SIGNING_JWK_SET'] = jwk_key_pair.public
         keys['EDXAPP_JWT_PRIVATE_SIGNING_JWK'] = jwk_key_pair.private
 
-        return yaml.dump(keys)
+        return keys
+
+    def get_secret_key_settings(self):
+        """
+        Render the secret key settings as YAML and return it for use in the appserver.
+        """
+        keys = self.get_secret_key_variables()
+        return ansible.dump_yaml(keys) if keys else ''
 
     @property
     def http_auth_user(self):
@@ -28,6 +28,8 @@ from django.conf import settings
 from django.core.mail.message import EmailMultiAlternatives
 from django.views.debug import ExceptionReporter
 
+from instance.ansible import PlaybookLogCollector
+
 
 # Classes #####################################################################
 
@@ -63,11 +65,19 @@ class EmailMixin:
     def provision_failed_email(self, reason, log=None):
         """
         Send email notifications when instance provisioning is failed
+
+        `log` is a list of log lines, or a `PlaybookLogCollector`. Only the last lines of a collector are
+        attached as text: the full log is attached gzip-compressed, unless it's too large.
         """
         attachments = []
         if log is not None:
             log_str = "\n".join(log)
             attachments.append(("provision.log", log_str, "text/plain"))
+            if isinstance(log, PlaybookLogCollector) and log.truncated:
+                if log.get_compressed_size() <= settings.ANSIBLE_LOG_ATTACHMENT_MAX_SIZE:
+                    attachments.append(("provision-full.log.gz", log.get_compressed_log(), "application/gzip"))
+                else:
+                    self.logger.info('The full provisioning log is too large to be attached to the email.')
 
         self._send_email(
             self.EmailSubject.PROVISION_FAILED.format(name=self.name, instance_name=self.instance.name),
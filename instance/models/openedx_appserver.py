@@ -19,9 +19,11 @@
 """
 Instance app models - Open EdX AppServer models
 """
-import yaml
+import hashlib
+import json
 
 import requests
+import yaml
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
@@ -29,9 +31,9 @@ from django.db import models
 from django.db.models import Q
 from django.utils.text import slugify
 from django.contrib.postgres.fields import JSONField
-from swampdragon.pubsub_providers.data_publisher import publish_data
 
 from instance import ansible
+from instance.channels import publish_notification
 from instance.logging import log_exception
 from instance.models.appserver import AppServer
 from instance.models.mixins.ansible import AnsibleAppServerMixin, Playbook
@@ -194,6 +196,10 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         'playbook when configuring this AppServer.'
     ))
     lms_user_settings = models.TextField(blank=True, help_text='YAML variables for LMS user creation.')
+    configuration_fingerprint = models.CharField(max_length=64, blank=True, help_text=(
+        'A hash of the settings and playbook commits this AppServer was provisioned with, '
+        'set once the playbooks succeed. See create_configuration_fingerprint().'
+    ))
 
     INVENTORY_GROUP = 'openedx-app'
     CONFIGURATION_PLAYBOOK = 'playbooks/edx_sandbox.yml'
@@ -207,10 +213,21 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         # The extra settings should stay at the end of this list to allow manual overrides of all settings.
         'configuration_extra_settings',
     ]
+    # Configuration variables which differ between the appservers of an instance even if its settings don't change:
+    APPSERVER_SPECIFIC_VARIABLES = [
+        'COMMON_HOSTNAME',
+        'EDXAPP_CLEARSESSIONS_CRON_HOURS',
+        'EDXAPP_CLEARSESSIONS_CRON_MINUTES',
+    ]
 
     class Meta(AppServer.Meta):
         verbose_name = 'Open edX App Server'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Dicts of variables of the CONFIGURATION_EXTRA_FIELDS, see set_configuration_extra_variables()
+        self._configuration_extra_variables = {}
+
     def make_active(self, active=True):
         """
         Activate or deactivate the current appserver.
@@ -238,6 +255,16 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         self.lms_user_settings = self.create_lms_user_settings()
         self.save()
 
+    def get_lms_users(self):
+        """
+        Return the LMS users of this AppServer
+
+        An AppServer which isn't saved yet gets the LMS users of its instance once it's created.
+        """
+        if self.pk is None:
+            return self.instance.lms_users.all()
+        return self.lms_users.all()
+
     def default_playbook(self):
         """
         Return a Playbook instance for the standard configuration playbook.
@@ -267,10 +294,33 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         Get the ansible playbooks used to provision this AppServer
         """
         playbooks = [self.default_playbook()]
-        if self.lms_users.count():
+        if self.get_lms_users().count():
             playbooks.append(self.lms_user_creation_playbook())
         return playbooks + super().get_playbooks()
 
+    def set_configuration_extra_variables(self, **variables):
+        """
+        Set the given CONFIGURATION_EXTRA_FIELDS from dicts of variables
+
+        The dicts are kept, so that create_configuration_settings() merges them directly instead
+        of parsing back the YAML they were just serialized to.
+        """
+        for attr_name, attr_variables in variables.items():
+            assert attr_name in self.CONFIGURATION_EXTRA_FIELDS
+            attr_value = ansible.dump_yaml(attr_variables) if attr_variables else ''
+            setattr(self, attr_name, attr_value)
+            self._configuration_extra_variables[attr_name] = (attr_value, attr_variables)
+
+    def get_configuration_extra_variables(self, attr_name):
+        """
+        Return the dict of variables of the given CONFIGURATION_EXTRA_FIELDS field
+        """
+        attr_value = getattr(self, attr_name)
+        cached_value, cached_variables = self._configuration_extra_variables.get(attr_name, (None, None))
+        if attr_value == cached_value:
+            return cached_variables
+        return ansible.parse_yaml(attr_value)
+
     def create_configuration_settings(self):
         """
         Generate the configuration settings.
@@ -280,13 +330,36 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
         """
         confvars = self._get_configuration_variables()
         for attr_name in self.CONFIGURATION_EXTRA_FIELDS:
-            additional_vars = getattr(self, attr_name)
-            additional_vars = yaml.load(additional_vars) if additional_vars else {}
-            confvars = ansible.dict_merge(confvars, additional_vars)
-        vars_str = yaml.dump(confvars, default_flow_style=False)
+            confvars = ansible.dict_merge(confvars, self.get_configuration_extra_variables(attr_name))
+        vars_str = ansible.dump_yaml(confvars)
         self.logger.debug('Vars.yml:\n%s', vars_str)
         return vars_str
 
+    def create_configuration_fingerprint(self, commits):
+        """
+        Return a hash of the settings of this AppServer and of the commits its playbooks run from,
+        or an empty string if the commit of a playbook is unknown.
+
+        `commits` maps the (source_repo, version) of each playbook to a commit hash. The appserver-specific
+        variables are left out, so that two AppServers provisioned the same way have the same fingerprint.
+        """
+        configuration_variables = ansible.parse_yaml(self.configuration_settings)
+        for name in self.APPSERVER_SPECIFIC_VARIABLES:
+            configuration_variables.pop(name, None)
+        playbooks = []
+        for playbook in self.get_playbooks():
+            commit = commits.get((playbook.source_repo, playbook.version))
+            if not commit:
+                return ''
+            playbooks.append([playbook.source_repo, playbook.playbook_path, playbook.requirements_path, commit])
+        fingerprint_data = {
+            'configuration_settings': configuration_variables,
+            'common_configuration_settings': ansible.parse_yaml(self.common_configuration_settings),
+            'lms_user_settings': ansible.parse_yaml(self.lms_user_settings),
+            'playbooks': playbooks,
+        }
+        return hashlib.sha256(json.dumps(fingerprint_data, sort_keys=True, default=str).encode()).hexdigest()
+
     def create_lms_user_settings(self):
         """
         Generate the settings for creating the initial LMS users.
@@ -302,7 +375,7 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
                         "staff": True,
                         "superuser": True
                     }
-                    for user in self.lms_users.all()
+                    for user in self.get_lms_users()
                 ],
                 "django_groups": [],
                 # We do not require users to be created successfully if we have
@@ -472,12 +545,19 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             # Provisioning (ansible)
             self.logger.info('Provisioning server...')
             self._status_to_configuring_server()
-            log, exit_code = self.run_ansible_playbooks()
-            if exit_code != 0:
-                self.logger.info('Provisioning failed')
-                self._status_to_configuration_failed()
-                self.provision_failed_email("AppServer deploy failed: Ansible play exited with non-zero exit code", log)
-                return False
+            commits = {}
+            log, exit_code = self.run_ansible_playbooks(commits=commits)
+            with log:
+                if exit_code != 0:
+                    self.logger.info('Provisioning failed')
+                    self._status_to_configuration_failed()
+                    self.provision_failed_email(
+                        "AppServer deploy failed: Ansible play exited with non-zero exit code", log
+                    )
+                    return False
+            # AppServers are immutable, so the fingerprint isn't set with save()
+            self.configuration_fingerprint = self.create_configuration_fingerprint(commits)
+            OpenEdXAppServer.objects.filter(pk=self.pk).update(configuration_fingerprint=self.configuration_fingerprint)
 
             # Reboot
             self.logger.info('Provisioning completed')
@@ -513,7 +593,7 @@ class OpenEdXAppServer(AppServer, OpenEdXAppConfiguration, AnsibleAppServerMixin
             self.configuration_settings = self.create_configuration_settings()
         super().save(*args, **kwargs)
         # Notify anyone monitoring for changes via swampdragon/websockets:
-        publish_data('notification', {
+        publish_notification('notification', {
             'type': 'openedx_appserver_update',
             'appserver_id': self.pk,
             'instance_id': self.owner.pk,  # This is the ID of the InstanceReference
@@ -19,16 +19,17 @@
 """
 Instance app models - Open edX Instance models
 """
+import json
 import string
 
 from django.conf import settings
 from django.db import models, transaction
 from django.db.backends.utils import truncate_name
-from django.db.models import F
+from django.db.models import F, Prefetch
 from django.template import loader
 from django.utils import timezone
 
-from instance import gandi
+from instance import ansible, gandi
 from instance.logging import log_exception
 from instance.signals import appserver_spawned
 from instance.models.appserver import Status as AppServerStatus
@@ -41,8 +42,9 @@ from instance.models.mixins.openedx_monitoring import OpenEdXMonitoringMixin
 from instance.models.mixins.openedx_storage import OpenEdXStorageMixin
 from instance.models.mixins.openedx_theme import OpenEdXThemeMixin
 from instance.models.mixins.secret_keys import SecretKeyInstanceMixin
-from instance.models.openedx_appserver import OpenEdXAppConfiguration
+from instance.models.openedx_appserver import OpenEdXAppConfiguration, OpenEdXAppServer
 from instance.models.utils import WrongStateException, ConsulAgent
+from instance.repo import get_commit_sha
 from instance.utils import sufficient_time_passed
 
 
@@ -115,6 +117,37 @@ class OpenEdXInstance(
         super().save(**kwargs)
         self.update_consul_metadata()
 
+    @classmethod
+    def prefetch_load_balancer_configuration(cls, queryset):
+        """
+        Prefetch the references, active appservers and servers of the given instances.
+
+        The active appservers are cached the same way as in get_active_appservers(), so rendering the
+        configuration of all the instances takes a fixed number of queries.
+        """
+        return queryset.prefetch_related(
+            'ref_set',
+            Prefetch(
+                'ref_set__openedxappserver_set',
+                queryset=OpenEdXAppServer.objects.filter(_is_active=True).select_related('server'),
+                to_attr='_cached_active_appservers',
+            ),
+        )
+
+    def get_load_balancer_configuration_context(self):
+        """
+        Return a string of the settings get_load_balancer_configuration() depends on, besides the
+        active appservers.
+        """
+        template = loader.get_template("instance/haproxy/openedx.conf")
+        return json.dumps([
+            super().get_load_balancer_configuration_context(),
+            self.domain_slug,
+            self.domain,
+            self.http_auth_info_base64().decode(),
+            template.template.source,
+        ])
+
     def get_load_balancer_configuration(self, triggered_by_instance=False):
         """
         Return the haproxy configuration fragment and backend map for this instance.
@@ -122,25 +155,25 @@ class OpenEdXInstance(
         The triggered_by_instance flag indicates whether the reconfiguration was initiated by this
         instance, in which case we log additional information.
         """
-        active_appservers = self.get_active_appservers()
-        if not active_appservers.exists():
+        # Evaluate the appservers once - they may already be cached by prefetch_load_balancer_configuration()
+        active_appservers = list(self.get_active_appservers())
+        if not active_appservers:
             return self.get_preliminary_page_config(self.ref.pk)
 
         # Create the haproxy backend configuration from the list of active appservers
         appserver_vars = []
         for appserver in active_appservers:
             server_name = "appserver-{}".format(appserver.pk)
-            if not appserver.server.public_ip:
+            # Only the stored public IP is used, so rendering the configuration doesn't call the OpenStack API
+            public_ip = appserver.server._public_ip  # pylint: disable=protected-access
+            if not public_ip:
                 self.logger.error(
-                    "Active appserver does not have a public IP address. This should not happen. "
-                    "Updating internal status to double check."
+                    "Active appserver %s does not have a public IP address. This should not happen.", appserver.name
                 )
-                appserver.server.update_status()
-                if not appserver.server.public_ip:
-                    raise WrongStateException("Public IP still not available for active appserver. "
-                                              "Canceling reconfiguration process.")
+                raise WrongStateException("Public IP not available for active appserver. "
+                                          "Canceling reconfiguration process.")
 
-            appserver_vars.append(dict(ip_address=appserver.server.public_ip, name=server_name))
+            appserver_vars.append(dict(ip_address=public_ip, name=server_name))
 
         if len(appserver_vars) == 0:
             self.logger.error(
@@ -301,23 +334,96 @@ class OpenEdXInstance(
         This method should never be used directly, except in tests.
         Use spawn_appserver() instead.
         """
-        config_fields = OpenEdXAppConfiguration.get_config_fields()
-        instance_config = {field_name: getattr(self, field_name) for field_name in config_fields}
-
         with transaction.atomic():
-            app_server = self.appserver_set.create(
-                # Name for the app server: this will usually generate a unique name (and won't cause any issues if not):
-                name="AppServer {}".format(self.appserver_set.count() + 1),
-                # Copy the current value of each setting into the AppServer, preserving it permanently:
-                configuration_database_settings=self.get_database_settings(),
-                configuration_storage_settings=self.get_storage_settings(),
-                configuration_theme_settings=self.get_theme_settings(),
-                configuration_secret_keys=self.get_secret_key_settings(),
-                **instance_config
-            )
+            # Name for the app server: this will usually generate a unique name (and won't cause any issues if not):
+            app_server = self._build_owned_appserver(name="AppServer {}".format(self.appserver_set.count() + 1))
+            app_server.save(force_insert=True)
             app_server.add_lms_users(self.lms_users.all())
         return app_server
 
+    def _build_owned_appserver(self, name):
+        """
+        Return a new, unsaved appserver with the given name and the current settings of this instance.
+        """
+        config_fields = OpenEdXAppConfiguration.get_config_fields()
+        instance_config = {field_name: getattr(self, field_name) for field_name in config_fields}
+        app_server = self.appserver_set.model(owner=self.ref, name=name, **instance_config)
+        # Copy the current value of each setting into the AppServer, preserving it permanently. The variables
+        # are passed as dicts, so that they are merged into the configuration settings without a YAML round-trip:
+        app_server.set_configuration_extra_variables(
+            configuration_database_settings=self.get_database_variables(),
+            configuration_storage_settings=self.get_storage_variables(),
+            configuration_theme_settings=self.get_theme_variables(),
+            configuration_secret_keys=self.get_secret_key_variables(),
+        )
+        return app_server
+
+    def get_unchanged_appserver(self):
+        """
+        Return a running active AppServer with the configuration fingerprint a new AppServer would have,
+        or None.
+
+        The new AppServer is built without saving anything, and its fingerprint uses the commits its
+        playbook versions currently point to.
+        """
+        active_appservers = [
+            appserver for appserver in self.get_active_appservers()
+            if appserver.status == AppServerStatus.Running and appserver.configuration_fingerprint
+        ]
+        if not active_appservers:
+            return None
+        app_server = self._build_owned_appserver(name="AppServer {}".format(self.appserver_set.count() + 1))
+        # These are set when the AppServer is saved
+        app_server.configuration_settings = app_server.create_configuration_settings()
+        app_server.lms_user_settings = app_server.create_lms_user_settings()
+        commits = {
+            (playbook.source_repo, playbook.version): get_commit_sha(playbook.source_repo, playbook.version)
+            for playbook in app_server.get_playbooks()
+        }
+        fingerprint = app_server.create_configuration_fingerprint(commits)
+        for appserver in active_appservers:
+            if fingerprint and appserver.configuration_fingerprint == fingerprint:
+                return appserver
+        return None
+
+    @log_exception
+    def skip_unchanged_appserver(self, success_tag=None, failure_tag=None):
+        """
+        Return the ID of a running active AppServer with the configuration fingerprint a new AppServer
+        would have, or None if a new AppServer needs to be provisioned.
+
+        When the AppServer is unchanged, the instance is tagged with 'success_tag' as if a new AppServer
+        had been spawned successfully.
+        """
+        unchanged_app_server = self.get_unchanged_appserver()
+        if not unchanged_app_server:
+            return None
+        self.logger.info('Configuration unchanged since %s was provisioned, not spawning a new AppServer',
+                         unchanged_app_server.name)
+        if failure_tag:
+            self.tags.remove(failure_tag)
+        if success_tag:
+            self.tags.add(success_tag)
+        return unchanged_app_server.pk
+
+    def get_configuration_changes(self):
+        """
+        Return the sorted list of the configuration variables that a new appserver would change, compared to
+        the configuration settings of the active appserver, or None if there is no active appserver.
+
+        Nothing is saved: this tells whether an instance needs to be redeployed to apply its current settings.
+        """
+        active_appservers = list(self.get_active_appservers())
+        if not active_appservers:
+            return None
+        active_appserver = active_appservers[0]
+        app_server = self._build_owned_appserver(name=active_appserver.name)
+        changes = ansible.dict_diff(
+            ansible.parse_yaml(active_appserver.configuration_settings),
+            ansible.parse_yaml(app_server.create_configuration_settings()),
+        )
+        return [key for key in changes if key not in app_server.APPSERVER_SPECIFIC_VARIABLES]
+
     def require_user_creation_success(self):
         """
         When provisioning users, we don't want to force incompatible changes (e.g., in email)
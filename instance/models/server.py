@@ -23,6 +23,7 @@ Instance app models - Server
 # Imports #####################################################################
 
 import logging
+import random
 import time
 
 from django.conf import settings
@@ -31,13 +32,14 @@ from django.db.models import Q
 from django_extensions.db.models import TimeStampedModel
 import novaclient
 import requests
-from swampdragon.pubsub_providers.data_publisher import publish_data
 
 from instance import openstack_utils
+from instance.channels import get_event_channel, publish_notification
 from instance.logging import ModelLoggerAdapter
 from instance.models.utils import (
     ValidateModelMixin, ResourceState, ModelResourceStateDescriptor, SteadyStateException, default_setting
 )
+from instance.server_watcher import server_watcher
 from instance.utils import is_port_open, to_json
 
 
@@ -46,6 +48,18 @@ from instance.utils import is_port_open, to_json
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+# Backoff of the status checks of Server.sleep_until(): the delay between two checks starts at
+# SLEEP_UNTIL_INITIAL_DELAY seconds, and is multiplied by SLEEP_UNTIL_BACKOFF_FACTOR after each check
+# (up to SLEEP_UNTIL_MAX_DELAY seconds) until the status changes. A random jitter of up to
+# SLEEP_UNTIL_JITTER times the delay is added, so that servers started together get checked apart.
+SLEEP_UNTIL_INITIAL_DELAY = 1
+SLEEP_UNTIL_BACKOFF_FACTOR = 1.5
+SLEEP_UNTIL_MAX_DELAY = 15
+SLEEP_UNTIL_JITTER = 0.25
+
+
 # States ######################################################################
 
 class ServerState(ResourceState):
@@ -208,7 +222,8 @@ class Server(ValidateModelMixin, TimeStampedModel):
         This can happen if the server is in a steady state (i.e., a state that is not expected to change)
         that does not fulfill the desired condition.
 
-        The default timeout is 1h.
+        The default timeout is 1h. The status is checked with an exponential backoff - see
+        SLEEP_UNTIL_INITIAL_DELAY.
 
         Use as follows:
 
@@ -223,7 +238,9 @@ class Server(ValidateModelMixin, TimeStampedModel):
 
         self.logger.info('Waiting to reach status from which we can proceed...')
 
+        delay = SLEEP_UNTIL_INITIAL_DELAY
         while timeout > 0:
+            previous_status_id = self.status.state_id
             self.update_status()
             if condition():
                 self.logger.info(
@@ -236,8 +253,12 @@ class Server(ValidateModelMixin, TimeStampedModel):
                         "The current status ({name}) does not fulfill the desired condition "
                         "and is not expected to change.".format(name=self.status.name)
                     )
-            time.sleep(1)
-            timeout -= 1
+            if self.status.state_id != previous_status_id:
+                delay = SLEEP_UNTIL_INITIAL_DELAY
+            timeout -= self._wait_for_status_change(
+                min(timeout, delay * random.uniform(1, 1 + SLEEP_UNTIL_JITTER))
+            )
+            delay = min(delay * SLEEP_UNTIL_BACKOFF_FACTOR, SLEEP_UNTIL_MAX_DELAY)
 
         # If we get here, this means we've reached the timeout
         raise TimeoutError(
@@ -245,12 +266,20 @@ class Server(ValidateModelMixin, TimeStampedModel):
             "Aborting with a status of {status}.".format(minutes=initial_timeout / 60, status=self.status.name)
         )
 
+    def _wait_for_status_change(self, delay):
+        """
+        Wait for up to `delay` seconds before the next status check of sleep_until(), and return
+        the time waited
+        """
+        time.sleep(delay)
+        return delay
+
     def save(self, *args, **kwargs):
         """
         Save this Server
         """
         super().save(*args, **kwargs)
-        publish_data('notification', {
+        publish_notification(get_event_channel(self.event_context), {
             'type': 'server_update',
             'server_pk': self.pk,
         })
@@ -279,7 +308,10 @@ class OpenStackServer(Server):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.nova = openstack_utils.get_nova_client(self.openstack_region)
+        self._nova = None
+        # Nova server received from the server watcher, and the last Nova status seen - see update_status()
+        self._watched_os_server = None
+        self._nova_status = None
 
     def __str__(self):
         if self.openstack_id:
@@ -287,6 +319,22 @@ class OpenStackServer(Server):
         else:
             return 'Pending OpenStack Server'
 
+    @property
+    def nova(self):
+        """
+        Nova client of the region of this server, shared with the other servers of the region
+        """
+        if self._nova is None:
+            self._nova = openstack_utils.get_nova_client(self.openstack_region)
+        return self._nova
+
+    @nova.setter
+    def nova(self, nova):
+        """
+        Use the given nova client for this server
+        """
+        self._nova = nova
+
     @property
     def os_server(self):
         """
@@ -314,7 +362,7 @@ class OpenStackServer(Server):
             if not public_addr:
                 return None
             self._public_ip = public_addr['addr']
-            self.save()
+            self.save(update_fields=['_public_ip', 'modified'])
         return self._public_ip
 
     @property
@@ -336,6 +384,7 @@ class OpenStackServer(Server):
         Update the status from the Nova Server object given in os_server.
         """
         self.logger.debug('Updating status from nova (currently %s):\n%s', self.status, to_json(os_server))
+        self._nova_status = os_server.status
         if self.status == Status.Unknown:
             if os_server.status in ('INITIALIZED', 'BUILDING'):
                 # OpenStack has multiple API versions; INITIALIZED is current; BUILDING was used in the past
@@ -356,8 +405,11 @@ class OpenStackServer(Server):
         # First check if it makes sense to update the current status.
         # This is not the case if we can not interact with the server:
         if self.status not in [Status.BuildFailed, Status.Terminated, Status.Pending]:
+            # Use the Nova server listed by the server watcher while sleeping until a status, if any
+            os_server, self._watched_os_server = self._watched_os_server, None
             try:
-                os_server = self.os_server
+                if os_server is None:
+                    os_server = self.os_server
             except novaclient.exceptions.NotFound:
                 # This exception is raised before the server is created, and after it has been
                 # terminated.  Because of the first "if", we can't get her in Pending state, so the
@@ -374,6 +426,19 @@ class OpenStackServer(Server):
                 self._update_status_from_nova(os_server)
         return self.status
 
+    def _wait_for_status_change(self, delay):
+        """
+        Wait for the status of the VM to change in Nova, for up to `delay` seconds - see
+        `instance.server_watcher`
+        """
+        if not settings.OPENSTACK_SERVER_WATCHER or not self.openstack_id:
+            return super()._wait_for_status_change(delay)
+        start_time = time.time()
+        self._watched_os_server = server_watcher.wait(
+            self.openstack_region, self.openstack_id, self._nova_status, delay
+        )
+        return time.time() - start_time
+
     @Server.status.only_for(Status.Pending)
     def start(self,
               flavor_selector=settings.OPENSTACK_SANDBOX_FLAVOR,
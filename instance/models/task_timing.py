@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app models - Playbook task timings
+"""
+
+# Imports #####################################################################
+
+import logging
+import uuid
+
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.db.models import Avg, Count, Max
+from django.db.models.signals import post_delete
+
+from .log_entry import LogEntry
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Models ######################################################################
+
+class PlaybookTaskTimingQuerySet(models.QuerySet):
+    """
+    Additional methods for PlaybookTaskTiming querysets
+    """
+    def slowest_tasks(self):
+        """
+        Return the tasks of each playbook by decreasing average duration, with their number of runs
+        and their maximum duration
+        """
+        return self.values('playbook', 'task').annotate(
+            runs=Count('id'),
+            average_duration=Avg('duration'),
+            max_duration=Max('duration'),
+        ).order_by('-average_duration')
+
+
+class PlaybookTaskTiming(models.Model):
+    """
+    The result of a task of a playbook run against a model object, with its duration
+
+    These are recorded from the events of the task timing callback plugin - see
+    `instance.ansible.capture_playbook_output()`.
+    """
+    STATUS_CHOICES = (
+        ('ok', 'OK'),
+        ('changed', 'Changed'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+        ('ignored', 'Failed (ignored)'),
+        ('unreachable', 'Unreachable'),
+    )
+
+    created = models.DateTimeField(auto_now_add=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    run_id = models.UUIDField(db_index=True, help_text='Identifies the playbook run the task belongs to.')
+    playbook = models.CharField(max_length=255)
+    task = models.CharField(max_length=255)
+    host = models.CharField(max_length=255)
+    status = models.CharField(max_length=11, choices=STATUS_CHOICES)
+    duration = models.FloatField(null=True, blank=True, help_text='Duration of the task, in seconds.')
+
+    objects = PlaybookTaskTimingQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ['content_type', 'object_id', 'created'],
+        ]
+
+    def __str__(self):
+        return '{0.playbook} | {0.task} | {0.host} | {0.status} | {0.duration}s'.format(self)
+
+    @classmethod
+    def delete_before(cls, cutoff):
+        """
+        Delete the task timings recorded before `cutoff`
+
+        Like old log entries, these are deleted with raw SQL rather than one by one.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE created < %s'.format(cls._meta.db_table), [cutoff])
+
+    @staticmethod
+    def on_post_delete(sender, instance, **kwargs):
+        """
+        Whenever an object is deleted, delete its task timings
+        """
+        if isinstance(instance, (PlaybookTaskTiming, LogEntry)) or instance._meta.app_label == 'migrations':
+            return  # Avoid pointless database queries when deleting objects which never have task timings
+        if not isinstance(instance.pk, int):
+            return  # Task timings require integer object IDs, so we know this object has none
+        content_type = ContentType.objects.get_for_model(instance)
+        # A single query, since a queryset deletion would send a post_delete signal for each task timing
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE content_type_id = %s AND object_id = %s'.format(
+                    PlaybookTaskTiming._meta.db_table
+                ),
+                [content_type.pk, instance.pk],
+            )
+            num_deleted = cursor.rowcount
+        if num_deleted > 0:
+            logger.info(
+                'Deleted %d task timings for deleted %s instance with ID %d',
+                num_deleted, content_type.name, instance.pk
+            )
+
+
+post_delete.connect(PlaybookTaskTiming.on_post_delete)
+
+
+# Classes #####################################################################
+
+class PlaybookTaskTimingRecorder:
+    """
+    Records the task timings of a playbook run against a model object
+
+    Use it as a context manager, and pass its `record()` method as the `task_event_handler` of
+    `instance.ansible.capture_playbook_output()`. The timings are saved in a single batch at the end
+    of the run.
+    """
+    def __init__(self, obj, playbook):
+        self.obj = obj
+        self.playbook = playbook
+        self.run_id = uuid.uuid4()
+        self.timings = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.save()
+
+    def record(self, event):
+        """
+        Record a task event
+        """
+        self.timings.append(PlaybookTaskTiming(
+            content_object=self.obj,
+            run_id=self.run_id,
+            playbook=self.playbook[:255],
+            task=str(event.get('task', ''))[:255],
+            host=str(event.get('host', ''))[:255],
+            status=event.get('status', ''),
+            duration=event.get('duration'),
+        ))
+
+    def save(self):
+        """
+        Save the recorded task timings
+        """
+        if self.timings:
+            PlaybookTaskTiming.objects.bulk_create(self.timings, batch_size=500)
+            self.timings = []
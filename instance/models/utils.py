@@ -26,6 +26,7 @@ from json import JSONDecodeError
 from weakref import WeakKeyDictionary
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 
 import consul
 
@@ -97,12 +98,43 @@ class ValidateModelMixin(object):
         https://code.djangoproject.com/ticket/13100
 
     https://gist.github.com/glarrain/5448253
+
+    Saves restricted to some fields with `update_fields`, like the status transitions of the
+    state machines, only validate those fields - see :meth:`clean_update_fields`.
     """
     def save(self, *args, **kwargs):
-        """Call :meth:`full_clean` before saving."""
-        self.full_clean()
+        """Call :meth:`full_clean` (or :meth:`clean_update_fields`) before saving."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.full_clean()
+        else:
+            self.clean_update_fields(update_fields)
         super(ValidateModelMixin, self).save(*args, **kwargs)
 
+    def clean_update_fields(self, update_fields):
+        """
+        Validate the given fields only, and the unique constraints involving them.
+
+        The other fields were validated when the whole object was last saved, and are not written
+        by the update. Model-wide checks implemented in :meth:`clean` are skipped, as they usually
+        depend on fields which aren't being updated.
+        """
+        exclude = [
+            field.name for field in self._meta.concrete_fields
+            if field.name not in update_fields and field.attname not in update_fields
+        ]
+        errors = {}
+        try:
+            self.clean_fields(exclude=exclude)
+        except ValidationError as exc:
+            errors = exc.update_error_dict(errors)
+        try:
+            self.validate_unique(exclude=exclude)
+        except ValidationError as exc:
+            errors = exc.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
 
 class ClassProperty(property):
     """ Same as built-in 'property' global but also works when accessed as a class attribute """
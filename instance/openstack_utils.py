@@ -22,6 +22,8 @@ OpenStack - Helper functions
 
 # Imports #####################################################################
 import logging
+import os
+import threading
 from collections import namedtuple, defaultdict
 
 from django.conf import settings
@@ -37,6 +39,54 @@ from instance.utils import get_requests_retry
 
 logger = logging.getLogger(__name__)
 
+# Clients #####################################################################
+
+
+class ClientCache:
+    """
+    OpenStack clients shared by all the threads of the process, and kept for its whole lifetime,
+    so that they reuse their authentication token and HTTP connections - see get_cached_client()
+
+    The HTTP connections of the clients can't be shared with forked processes, like the workers
+    of the web server, so the cache is emptied when it's used by another process than the one
+    which filled it.
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def check_pid(self):
+        """
+        Forget the clients and the lock inherited from the parent process after a fork
+        """
+        if self.pid != os.getpid():
+            self.__init__()
+
+    def get(self, key, create_client):
+        """
+        Return the client cached under the given key, creating it with `create_client()` if needed
+        """
+        self.check_pid()
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = self.clients[key] = create_client()
+        return client
+
+    def clear(self):
+        """
+        Forget all the cached clients
+        """
+        self.check_pid()
+        with self.lock:
+            self.clients.clear()
+
+
+_client_cache = ClientCache()
+
 # Data objects ################################################################
 
 FailedContainer = namedtuple(
@@ -61,7 +111,29 @@ SecurityGroupRuleDefinition = namedtuple('SecurityGroupRuleDefinition', [
 # Functions ###################################################################
 
 
+def get_cached_client(key, create_client):
+    """
+    Return the OpenStack client cached under the given key, creating it with `create_client()`
+    the first time it's requested
+    """
+    return _client_cache.get(key, create_client)
+
+
+def clear_client_cache():
+    """
+    Forget the cached OpenStack clients - new ones are created when they're next requested
+    """
+    _client_cache.clear()
+
+
 def get_openstack_connection(region_name):
+    """
+    Get the shared OpenStack Connection object of the given region - see create_openstack_connection()
+    """
+    return get_cached_client(('openstack', region_name), lambda: create_openstack_connection(region_name))
+
+
+def create_openstack_connection(region_name):
     """
     Get the OpenStack Connection object.
 
@@ -123,6 +195,15 @@ def sync_security_group_rules(security_group, rule_definitions, network):
 
 
 def get_nova_client(region_name, api_version=2):
+    """
+    Get the shared nova client of the given region - see create_nova_client()
+    """
+    return get_cached_client(
+        ('nova', region_name, api_version), lambda: create_nova_client(region_name, api_version)
+    )
+
+
+def create_nova_client(region_name, api_version=2):
     """
     Instantiate a python novaclient.Client() object with proper credentials
     """
@@ -23,10 +23,15 @@ Git repository - Helper functions
 # Imports #####################################################################
 
 from contextlib import contextmanager
+import fcntl
+import hashlib
 import logging
+import os
+import re
 import shutil
 import tempfile
 
+from django.conf import settings
 import git
 
 
@@ -35,6 +40,11 @@ import git
 logger = logging.getLogger(__name__)
 
 
+# Constants ###################################################################
+
+COMMIT_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
 # Functions ###################################################################
 
 @contextmanager
@@ -42,14 +52,97 @@ def open_repository(repo_url, ref='master'):
     """
     Get a `Git` object for a repository URL and switch it to the reference `ref`.
 
-    Note that this clones the repository locally.
+    Note that this clones the repository locally. When GIT_MIRROR_CACHE_DIR is set, the repository
+    is cloned from a local mirror of `repo_url` - see `update_mirror()` - rather than from `repo_url`.
+    The objects of the mirror are hard-linked, or copied if the mirror is on another filesystem, rather
+    than borrowed like a `--shared` clone does: fetching the mirror later prunes objects, which would
+    corrupt the clone.
     """
     repo_dir_path = tempfile.mkdtemp()
-    logger.info('Cloning repository %s (ref=%s) in %s...', repo_url, ref, repo_dir_path)
-
-    # We can technically clone into a branch directly, but that wouldn't work for arbitrary references.
-    repo = git.repo.base.Repo.clone_from(repo_url, repo_dir_path)
+    if settings.GIT_MIRROR_CACHE_DIR:
+        with update_mirror(repo_url, ref) as mirror_path:
+            logger.info('Cloning repository %s (ref=%s) in %s from %s...', repo_url, ref, repo_dir_path, mirror_path)
+            repo = git.repo.base.Repo.clone_from(mirror_path, repo_dir_path)
+        # Submodules with relative URLs are relative to the original repository
+        repo.git.remote('set-url', 'origin', repo_url)
+    else:
+        logger.info('Cloning repository %s (ref=%s) in %s...', repo_url, ref, repo_dir_path)
+        # We can technically clone into a branch directly, but that wouldn't work for arbitrary references.
+        repo = git.repo.base.Repo.clone_from(repo_url, repo_dir_path)
     repo.git.checkout(ref)
     repo.submodule_update()
     yield repo.git
     shutil.rmtree(repo_dir_path)
+
+
+def get_mirror_path(repo_url):
+    """
+    Return the path of the local mirror of the given repository
+    """
+    name = re.sub(r'[^\w.-]+', '-', repo_url.rstrip('/').rsplit('/', 1)[-1])
+    digest = hashlib.sha1(repo_url.encode()).hexdigest()[:12]
+    return os.path.join(settings.GIT_MIRROR_CACHE_DIR, '{}-{}'.format(digest, name))
+
+
+@contextmanager
+def update_mirror(repo_url, ref):
+    """
+    Make sure the local mirror of the given repository exists and contains `ref`, and yield its path
+
+    The mirror is created with `git clone --mirror` the first time, and then fetched before each
+    use - unless `ref` is a commit hash that it already contains. Mirrors are only created and
+    fetched while holding an exclusive lock on their lock file, so that concurrent processes don't
+    update the same mirror at the same time. The lock is then shared until the context exits, so
+    that the mirror can be cloned by several processes at once, but isn't fetched meanwhile.
+    """
+    mirror_path = get_mirror_path(repo_url)
+    os.makedirs(settings.GIT_MIRROR_CACHE_DIR, exist_ok=True)
+    with open(mirror_path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not os.path.isdir(mirror_path):
+            logger.info('Creating a mirror of repository %s in %s...', repo_url, mirror_path)
+            # Clone next to the mirror and then rename it, so that an interrupted clone isn't used
+            clone_path = mirror_path + '.tmp'
+            shutil.rmtree(clone_path, ignore_errors=True)
+            git.repo.base.Repo.clone_from(repo_url, clone_path, mirror=True)
+            os.rename(clone_path, mirror_path)
+        else:
+            mirror = git.repo.base.Repo(mirror_path)
+            if not (COMMIT_SHA_RE.match(ref) and has_commit(mirror, ref)):
+                logger.info('Fetching repository %s in %s...', repo_url, mirror_path)
+                mirror.git.fetch('--prune', 'origin')
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        yield mirror_path
+
+
+def has_commit(repo, commit_sha):
+    """
+    Return True if the given repository contains the given commit
+    """
+    try:
+        repo.git.cat_file('-e', '{}^{{commit}}'.format(commit_sha))
+    except git.exc.GitCommandError:
+        return False
+    return True
+
+
+def get_commit_sha(repo_url, ref):
+    """
+    Return the hash of the commit `ref` points to in the given repository, or None if it can't be resolved
+
+    Branches and tags are resolved with `git ls-remote`, without cloning the repository.
+    """
+    if COMMIT_SHA_RE.match(ref):
+        return ref
+    try:
+        output = git.cmd.Git().ls_remote(repo_url, ref, ref + '^{}')
+    except git.exc.GitCommandError:
+        logger.warning('Unable to resolve ref %s of repository %s.', ref, repo_url)
+        return None
+    commits = {name: commit_sha for commit_sha, name in (line.split('\t') for line in output.splitlines())}
+    # Annotated tags point to tag objects, but are followed by the commit they are "peeled" to
+    for name in ('refs/heads/{}', 'refs/tags/{}^{{}}', 'refs/tags/{}', '{}'):
+        commit_sha = commits.get(name.format(ref))
+        if commit_sha:
+            return commit_sha
+    return None
@@ -25,6 +25,8 @@ SwampDragon routers - Register channels available to the client-side (browser)
 from swampdragon import route_handler
 from swampdragon.route_handler import BaseRouter
 
+from instance import channels
+
 
 # Routers #####################################################################
 
@@ -32,9 +34,22 @@ class NotificationRouter(BaseRouter): #pylint: disable=abstract-method,missing-d
     route_name = 'notifier'
 
     def get_subscription_channels(self, **kwargs):
-        return ['notification', 'log']
+        return ['notification']
+
+
+class ObjectEventsRouter(BaseRouter): #pylint: disable=abstract-method
+    """
+    Channels of the events about specific objects, e.g. their log lines
+
+    Clients pass the subscription token of the objects they're viewing, as returned by the API.
+    """
+    route_name = 'object_events'
+
+    def get_subscription_channels(self, **kwargs):
+        return channels.get_subscription_channels(kwargs.get('token'))
 
 
 # Routers registration ########################################################
 
 route_handler.register(NotificationRouter)
+route_handler.register(ObjectEventsRouter)
@@ -24,6 +24,8 @@ Instance serializers (API representation)
 
 from rest_framework import serializers
 
+from instance.channels import get_event_channel, make_subscription_token
+
 from instance.models.instance import InstanceReference, Instance
 from instance.models.openedx_instance import OpenEdXInstance
 from instance.serializers.appserver import AppServerBasicSerializer
@@ -100,6 +102,9 @@ class InstanceReferenceBasicSerializer(InstanceReferenceMinimalSerializer):
         """
         output = super().to_representation(obj)
         output['instance_type'] = obj.instance_type.model
+        if not self.summary_only:
+            # Allows to subscribe to the events of this instance, like its log lines:
+            output['events_token'] = make_subscription_token(get_event_channel(obj.instance.event_context))
         details = self.serialize_details(obj.instance)
         # Merge instance details into the resulting dict, but never overwrite existing fields
         for key, val in details.items():
@@ -115,15 +120,12 @@ class InstanceReferenceDetailedSerializer(InstanceReferenceBasicSerializer):
     summary_only = False
 
 
-class InstanceLogSerializer(serializers.ModelSerializer):
+class InstanceLogSerializer(serializers.Serializer): #pylint: disable=abstract-method
     """
-    Provide the log entries for an Instance
+    Provide a page of log entries for an Instance - see LogEntryPagination
     """
     log_entries = LogEntrySerializer(many=True, read_only=True)
-
-    class Meta:
-        model = InstanceReference
-        fields = ('log_entries', )
+    previous_cursor = serializers.CharField(read_only=True)
 
 
 class InstanceAppServerSerializer(serializers.ModelSerializer):
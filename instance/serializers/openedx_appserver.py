@@ -24,6 +24,8 @@ Open edX AppServer serializers (API representation)
 
 from rest_framework import serializers
 
+from instance.channels import get_event_channel, make_subscription_token
+
 from instance.models.openedx_appserver import OpenEdXAppServer, OpenEdXAppConfiguration
 from instance.serializers.appserver import AppServerBasicSerializer
 from instance.serializers.instance import InstanceReferenceMinimalSerializer
@@ -39,6 +41,7 @@ class OpenEdXAppServerSerializer(serializers.ModelSerializer):
     """
     instance = InstanceReferenceMinimalSerializer(source='owner')
     server = OpenStackServerSerializer()
+    events_token = serializers.SerializerMethodField()
 
     class Meta:
         model = OpenEdXAppServer
@@ -50,6 +53,16 @@ class OpenEdXAppServerSerializer(serializers.ModelSerializer):
             'configuration_settings',
             'instance',
             'server',
+            'events_token',
+        )
+
+    def get_events_token(self, obj):
+        """
+        Token allowing to subscribe to the events of this AppServer and of its server
+        """
+        return make_subscription_token(
+            get_event_channel(obj.event_context),
+            get_event_channel(obj.server.event_context),
         )
 
     def to_representation(self, obj):
@@ -61,16 +74,15 @@ class OpenEdXAppServerSerializer(serializers.ModelSerializer):
         return output
 
 
-class OpenEdXAppServerLogSerializer(serializers.ModelSerializer):
+class OpenEdXAppServerLogSerializer(serializers.Serializer): #pylint: disable=abstract-method
     """
-    Provide the log entries for an OpenEdXAppServer
+    Provide a page of log entries for an OpenEdXAppServer - see LogEntryPagination - along with
+    all of its error log entries, and the cursor to follow its log from - see the `log_tail` action
     """
     log_entries = LogEntrySerializer(many=True, read_only=True)
     log_error_entries = LogEntrySerializer(many=True, read_only=True)
-
-    class Meta:
-        model = OpenEdXAppServer
-        fields = ('log_entries', 'log_error_entries')
+    previous_cursor = serializers.CharField(read_only=True)
+    tail_cursor = serializers.CharField(read_only=True)
 
 
 # create/update intentionally omitted, pylint: disable=abstract-method
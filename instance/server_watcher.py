@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance app - OpenStack server watcher
+
+Servers waiting for their VM to change status (see `Server.sleep_until()`) register with the
+watcher of their process, which lists all the servers of each OpenStack region with a single
+`nova.servers.list()` call every few seconds, and wakes up the waiting servers whose VM status
+changed. The number of Nova API calls then depends on the time spent waiting, rather than on
+the number of servers being provisioned.
+"""
+
+# Imports #####################################################################
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+import novaclient
+import requests
+
+from instance import openstack_utils
+
+
+# Logging #####################################################################
+
+logger = logging.getLogger(__name__)
+
+
+# Classes #####################################################################
+
+class ServerWatcher:
+    """
+    Polls the status of the OpenStack servers being waited for, in a background thread which runs
+    while there are servers to watch
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (region, openstack_id) => {threading.Event => Nova status known by the waiting thread}
+        self.waiters = {}
+        # (region, openstack_id) => the Nova server from the last poll, or None if it wasn't listed
+        self.os_servers = {}
+        self._thread = None
+
+    def wait(self, region, openstack_id, known_status, timeout):
+        """
+        Wait for up to `timeout` seconds for the Nova status of the given server to differ from
+        `known_status`, and return the Nova server from the last poll - or None if it hasn't been
+        polled yet, or wasn't listed
+        """
+        key = (region, openstack_id)
+        event = threading.Event()
+        with self.lock:
+            self.waiters.setdefault(key, {})[event] = known_status
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='server-watcher', daemon=True)
+                self._thread.start()
+        try:
+            event.wait(timeout)
+        finally:
+            with self.lock:
+                os_server = self.os_servers.get(key)
+                del self.waiters[key][event]
+                if not self.waiters[key]:
+                    del self.waiters[key]
+                    self.os_servers.pop(key, None)
+        return os_server
+
+    def poll(self):
+        """
+        List the servers of each region with waiters, and wake up the waiters of the servers whose
+        status differs from the one they know. Return False once there is nothing left to watch.
+        """
+        with self.lock:
+            regions = {region for region, dummy in self.waiters}
+        if not regions:
+            return False
+        for region in regions:
+            try:
+                listed_servers = {
+                    os_server.id: os_server
+                    for os_server in openstack_utils.get_nova_client(region).servers.list()
+                }
+            except (requests.RequestException,
+                    novaclient.exceptions.ClientException,
+                    novaclient.exceptions.EndpointNotFound) as exc:
+                logger.warning('Unable to list the servers of region %s: %s', region, exc)
+                continue
+            with self.lock:
+                for key, events in self.waiters.items():
+                    if key[0] != region:
+                        continue
+                    os_server = listed_servers.get(key[1])
+                    self.os_servers[key] = os_server
+                    for event, known_status in events.items():
+                        if get_status(os_server) != known_status:
+                            event.set()
+        return True
+
+    def _run(self):
+        """
+        Poll the servers every `interval` seconds while there are waiters
+        """
+        while True:
+            try:
+                watching = self.poll()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Unable to poll the status of the watched servers.')
+                watching = True
+            with self.lock:
+                if not watching and not self.waiters:
+                    self._thread = None
+                    return
+            time.sleep(self.interval)
+
+
+# Functions ###################################################################
+
+def get_status(os_server):
+    """
+    Return the status of the given Nova server, or None if there is no server
+    """
+    return os_server.status if os_server is not None else None
+
+
+# Watcher of the current process ##############################################
+
+server_watcher = ServerWatcher(settings.OPENSTACK_SERVER_WATCHER_INTERVAL)
@@ -87,11 +87,33 @@ app.controller("Index", ['$scope', '$state', 'OpenCraftAPI', '$timeout',
             swampdragon.onChannelMessage(function (channels, message) {
                 // Broadcast sends a message to this scope and all child scopes:
                 console.log('Received websocket message: ', message.data.type, message.data);
+                if (message.data.type === 'object_log_lines') {
+                    // Log lines written in batches are handled like individual log lines:
+                    angular.forEach(message.data.log_entries, function(log_entry) {
+                        var data = angular.extend({}, message.data, {type: 'object_log_line', log_entry: log_entry});
+                        delete data.log_entries;
+                        $scope.$broadcast('swampdragon:object_log_line', data);
+                    });
+                    return;
+                }
                 $scope.$broadcast('swampdragon:' + message.data.type, message.data);
             });
             swampdragon.ready(function() {
                 swampdragon.subscribe('notifier', 'notification', null);
-                swampdragon.subscribe('notifier', 'log', null);
+            });
+        };
+
+        // Subscribe to the events of the objects the given token was issued for (see the `events_token` field
+        // returned by the API), under the given local channel name:
+        $scope.subscribeToEvents = function(localChannel, token) {
+            swampdragon.ready(function() {
+                swampdragon.subscribe('object_events', localChannel, {token: token});
+            });
+        };
+
+        $scope.unsubscribeFromEvents = function(localChannel, token) {
+            swampdragon.ready(function() {
+                swampdragon.unsubscribe('object_events', localChannel, {token: token});
             });
         };
 
@@ -138,6 +160,8 @@ app.controller("Index", ['$scope', '$state', 'OpenCraftAPI', '$timeout',
 app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
     function ($scope, $state, $stateParams, OpenCraftAPI) {
 
+        var LOG_PAGE_SIZE = 500; // Number of log entries to load at a time
+
         $scope.init = function() {
             $scope.is_spawning_appserver = false;
             $scope.is_updating_from_pr = false;
@@ -146,6 +170,7 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
 
             $scope.instanceLogs = false;
             $scope.isFetchingLogs = false;
+            $scope.eventsToken = null; // Token used to subscribe to the events of this instance
 
             $scope.refresh();
         };
@@ -176,7 +201,9 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
                 return;
             }
             $scope.isFetchingLogs = true;
-            OpenCraftAPI.one("instance", $scope.instance.id).customGET("logs").then(function(logs) {
+            OpenCraftAPI.one("instance", $scope.instance.id).customGET("logs", {
+                limit: LOG_PAGE_SIZE
+            }).then(function(logs) {
                 if (typeof logs.log_error_entries === "undefined") {
                     logs.log_error_entries = [];  // This field is not always present.
                 }
@@ -188,6 +215,24 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
             });
         };
 
+        $scope.fetchOlderLogs = function() {
+            if (!$scope.instanceLogs || !$scope.instanceLogs.previous_cursor || $scope.isFetchingLogs) {
+                return;
+            }
+            $scope.isFetchingLogs = true;
+            OpenCraftAPI.one("instance", $scope.instance.id).customGET("logs", {
+                limit: LOG_PAGE_SIZE,
+                before: $scope.instanceLogs.previous_cursor
+            }).then(function(logs) {
+                $scope.instanceLogs.log_entries = logs.log_entries.concat($scope.instanceLogs.log_entries);
+                $scope.instanceLogs.previous_cursor = logs.previous_cursor;
+                $scope.isFetchingLogs = false;
+            }, function() {
+                $scope.notify("Unable to load the logs for this instance.");
+                $scope.isFetchingLogs = false;
+            });
+        };
+
         $scope.$watch('instance_active_tabs.log_tab', function(tab_open){
             if (tab_open) {
                 $scope.fetchLogs();
@@ -212,9 +257,19 @@ app.controller("Details", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
                     $scope.is_spawning_appserver = false;
                 }
                 $scope.old_appserver_count = instance.appserver_count;
+                if (!$scope.eventsToken) {
+                    $scope.eventsToken = instance.events_token;
+                    $scope.subscribeToEvents('instance', $scope.eventsToken);
+                }
             });
         };
 
+        $scope.$on('$destroy', function() {
+            if ($scope.eventsToken) {
+                $scope.unsubscribeFromEvents('instance', $scope.eventsToken);
+            }
+        });
+
         $scope.spawn_appserver = function() {
             console.log('Spawning new AppServer');
             $scope.is_spawning_appserver = true; // Disable the button
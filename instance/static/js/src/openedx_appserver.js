@@ -34,11 +34,15 @@ app.config(function($stateProvider) {
 app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', 'OpenCraftAPI',
     function ($scope, $state, $stateParams, OpenCraftAPI) {
 
+        var LOG_PAGE_SIZE = 500; // Number of log entries to load at a time
+
         $scope.init = function() {
             $scope.appserver = null;
             $scope.appserverLogs = null; // Logs. Once loaded, this is {log_entries: [], log_error_entries: []}
             $scope.isFetchingLogs = false; // Are we currently loading the logs?
             $scope.logsPanelOpen = false; // Is the logs panel visible?
+            $scope.logTail = null; // EventSource following the logs, once loaded
+            $scope.eventsToken = null; // Token used to subscribe to the events of this App Server, if not streamed
             $scope.refresh();
         };
 
@@ -59,12 +63,70 @@ app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', '
                 return;
             }
             $scope.isFetchingLogs = true;
-            OpenCraftAPI.one("openedx_appserver", $stateParams.appserverId).customGET("logs").then(function(logs) {
+            OpenCraftAPI.one("openedx_appserver", $stateParams.appserverId).customGET("logs", {
+                limit: LOG_PAGE_SIZE
+            }).then(function(logs) {
                 if (typeof logs.log_error_entries === "undefined") {
                     logs.log_error_entries = [];  // This field is not always present.
                 }
                 $scope.appserverLogs = logs;
                 $scope.isFetchingLogs = false;
+                $scope.followLogs(logs.tail_cursor);
+            }, function() {
+                $scope.notify("Unable to load the logs for this appserver.");
+                $scope.isFetchingLogs = false;
+            });
+        };
+
+        $scope.followLogs = function(cursor) {
+            // Stream the new log lines of this App Server from the given cursor. When streaming isn't available,
+            // new log lines are received through the websocket instead.
+            if (!cursor || typeof EventSource === "undefined") {
+                if (!$scope.eventsToken) {
+                    $scope.eventsToken = $scope.appserver.events_token;
+                    $scope.subscribeToEvents('appserver', $scope.eventsToken);
+                }
+                return;
+            }
+            $scope.logTail = new EventSource(
+                '/api/v1/openedx_appserver/' + $stateParams.appserverId + '/log_tail/?cursor=' + encodeURIComponent(cursor)
+            );
+            $scope.logTail.onmessage = function(event) {
+                var data = JSON.parse(event.data);
+                $scope.$apply(function() {
+                    angular.forEach(data.log_entries, $scope.addLogEntry);
+                });
+            };
+        };
+
+        $scope.addLogEntry = function(log_entry) {
+            if (log_entry.level == 'ERROR' || log_entry.level == 'CRITICAL') {
+                $scope.appserverLogs.log_error_entries.push(log_entry);
+            }
+            $scope.appserverLogs.log_entries.push(log_entry);
+        };
+
+        $scope.$on('$destroy', function() {
+            if ($scope.logTail) {
+                $scope.logTail.close();
+            }
+            if ($scope.eventsToken) {
+                $scope.unsubscribeFromEvents('appserver', $scope.eventsToken);
+            }
+        });
+
+        $scope.fetchOlderLogs = function() {
+            if (!$scope.appserverLogs || !$scope.appserverLogs.previous_cursor || $scope.isFetchingLogs) {
+                return;
+            }
+            $scope.isFetchingLogs = true;
+            OpenCraftAPI.one("openedx_appserver", $stateParams.appserverId).customGET("logs", {
+                limit: LOG_PAGE_SIZE,
+                before: $scope.appserverLogs.previous_cursor
+            }).then(function(logs) {
+                $scope.appserverLogs.log_entries = logs.log_entries.concat($scope.appserverLogs.log_entries);
+                $scope.appserverLogs.previous_cursor = logs.previous_cursor;
+                $scope.isFetchingLogs = false;
             }, function() {
                 $scope.notify("Unable to load the logs for this appserver.");
                 $scope.isFetchingLogs = false;
@@ -96,14 +158,11 @@ app.controller("OpenEdXAppServerDetails", ['$scope', '$state', '$stateParams', '
         };
 
         $scope.$on("swampdragon:object_log_line", function (event, data) {
-            if (!$scope.appserverLogs) {
-                return; // The App Server logs are not loaded yet, so no need to watch for log lines
+            if (!$scope.appserverLogs || $scope.logTail) {
+                return; // The App Server logs are not loaded yet, or new log lines are streamed
             }
             if (data.appserver_id == $scope.appserver.id || ($scope.appserver.server && data.server_id == $scope.appserver.server.id)) {
-                if (data.log_entry.level == 'ERROR' || data.log_entry.level == 'CRITICAL') {
-                    $scope.appserverLogs.log_error_entries.push(data.log_entry);
-                }
-                $scope.appserverLogs.log_entries.push(data.log_entry);
+                $scope.addLogEntry(data.log_entry);
                 $scope.$apply();
             }
         });
@@ -27,7 +27,7 @@ import logging
 
 from django.conf import settings
 from django.db import connection
-from django.db.models import F
+from django.db.models import F, Q
 from django.utils import timezone
 from huey.contrib.djhuey import crontab, db_task, db_periodic_task
 
@@ -35,6 +35,7 @@ from instance.models.load_balancer import LoadBalancingServer
 from instance.models.log_entry import LogEntry
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
+from instance.models.task_timing import PlaybookTaskTiming
 from instance.utils import sufficient_time_passed
 from pr_watch import github
 
@@ -53,7 +54,8 @@ def spawn_appserver(
         deactivate_old_appservers=False,
         num_attempts=1,
         success_tag=None,
-        failure_tag=None):
+        failure_tag=None,
+        skip_unchanged=False):
     """
     Create a new AppServer for an existing instance.
 
@@ -64,10 +66,17 @@ def spawn_appserver(
     Optionally retry up to 'num_attempts' times.
     Optionally tag the instance with 'success_tag' when the deployment succeeds,
     or failure_tag if it fails.
+    Optionally skip the provisioning when a running active AppServer has the same configuration fingerprint:
+    its ID is returned instead, and it's left as it is.
     """
     logger.info('Retrieving instance: ID=%s', instance_ref_id)
     instance = OpenEdXInstance.objects.get(ref_set__pk=instance_ref_id)
 
+    if skip_unchanged:
+        unchanged_appserver = instance.skip_unchanged_appserver(success_tag=success_tag, failure_tag=failure_tag)
+        if unchanged_appserver:
+            return unchanged_appserver
+
     appserver = instance.spawn_appserver(
         num_attempts=num_attempts,
         success_tag=success_tag,
@@ -147,30 +156,107 @@ def clean_up():
     terminate_obsolete_appservers_all_instances()
 
 
-@db_periodic_task(crontab())
+@db_task()
+def reconfigure_load_balancer(load_balancer_id):
+    """
+    Reconfigure a load balancer, as scheduled by LoadBalancingServer.schedule_reconfiguration().
+
+    When the reconfiguration fails, it is scheduled again LOAD_BALANCER_RECONFIGURATION_RETRY_DELAY
+    seconds later, unless another one was scheduled in the meantime.
+    """
+    try:
+        load_balancer = LoadBalancingServer.objects.get(pk=load_balancer_id)
+    except LoadBalancingServer.DoesNotExist:
+        logger.info('Not reconfiguring deleted load balancer: ID=%s', load_balancer_id)
+        return
+    # Changes requested from now on need another reconfiguration
+    load_balancer.clear_scheduled_reconfiguration()
+    try:
+        load_balancer.reconfigure(mark_dirty=False, blocking=True)
+    except Exception:
+        logger.exception('Reconfiguring load balancer %s failed, retrying later', load_balancer.domain)
+        load_balancer.schedule_reconfiguration(delay=settings.LOAD_BALANCER_RECONFIGURATION_RETRY_DELAY)
+        raise
+
+
+@db_task()
+def update_load_balancer_configuration_files(load_balancer_id):
+    """
+    Write the backend changes applied through the haproxy runtime API to the configuration files of a load
+    balancer, as scheduled by LoadBalancingServer.schedule_configuration_files_update().
+    """
+    try:
+        load_balancer = LoadBalancingServer.objects.get(pk=load_balancer_id)
+    except LoadBalancingServer.DoesNotExist:
+        logger.info('Not updating the configuration files of deleted load balancer: ID=%s', load_balancer_id)
+        return
+    load_balancer.reconfigure(mark_dirty=False, runtime_api=False, blocking=True)
+
+
+@db_periodic_task(crontab(minute='*/15'))
 def reconfigure_dirty_load_balancers():
     """
     Any load balancers that are dirty need to be reconfigured.
 
-    This task runs every minute.
+    Reconfigurations are normally scheduled when the configuration changes, so this only catches
+    the ones which failed or got lost. This includes writing the configuration files of the load
+    balancers whose backend changes were only applied through the haproxy runtime API, when the
+    scheduled update of the files failed, and rendering the configuration fragments again once the
+    settings or templates they depend on changed.
+
+    This task runs every 15 minutes.
     """
     logger.info('Reconfiguring all dirty load balancers')
-    for load_balancer in LoadBalancingServer.objects.filter(
-            configuration_version__gt=F('deployed_configuration_version')
-    ):
-        load_balancer.reconfigure(mark_dirty=False)
+    dirty = Q(configuration_version__gt=F('deployed_configuration_version')) | Q(runtime_changes_pending=True)
+    for load_balancer in LoadBalancingServer.objects.filter(dirty):
+        load_balancer.reconfigure(mark_dirty=False, runtime_api=False)
+    for load_balancer in LoadBalancingServer.objects.exclude(dirty):
+        if load_balancer.has_outdated_fragments():
+            load_balancer.reconfigure(mark_dirty=False, runtime_api=False)
+
+
+@db_periodic_task(crontab(minute='30'))
+def create_log_partitions():
+    """
+    Create the partitions of the log entries table for the coming days, if the table is partitioned.
+
+    PostgreSQL 10 has no default partition, so log entries can't be written at all once the last
+    partition ends. An error is logged when fewer than LOG_PARTITION_MIN_DAYS_AHEAD days are left,
+    for instance because the partitions can't be created.
+
+    This task runs every hour.
+    """
+    if not LogEntry.is_partitioned():
+        return
+    try:
+        LogEntry.create_partitions(settings.LOG_PARTITION_DAYS_AHEAD)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to create the partitions of the log entries table.')
+    partitions_end = LogEntry.get_partitions()[-1][1]
+    days_left = (partitions_end - timezone.now()) / timezone.timedelta(days=1)
+    if days_left < settings.LOG_PARTITION_MIN_DAYS_AHEAD:
+        logger.error(
+            'The partitions of the log entries table end in %.1f days, on %s. '
+            'Log entries created afterwards will fail to be written.',
+            days_left, partitions_end,
+        )
 
 
 @db_periodic_task(crontab(day='*/1', hour='0', minute='0'))
 def delete_old_logs():
     """
-    Delete old log entries.
+    Delete old log entries and playbook task timings.
 
-    For performance reasons, we execute raw SQL against the LogEntry model's table.
+    For performance reasons, we execute raw SQL against the LogEntry model's table, or drop whole
+    partitions if the table is partitioned (see the `partition_log_entries` management command).
 
     This task runs every day.
     """
     cutoff = timezone.now() - timezone.timedelta(days=settings.LOG_DELETION_DAYS)
+    PlaybookTaskTiming.delete_before(cutoff)
+    if LogEntry.is_partitioned():
+        LogEntry.drop_partitions(cutoff)
+        return
     query = (
         "DELETE FROM {table} "
         "WHERE {table}.created < '{cutoff}'::timestamptz".format(
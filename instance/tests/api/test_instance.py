@@ -27,6 +27,7 @@ from rest_framework import status
 
 from django.conf import settings
 from django.test.utils import override_settings
+from instance.channels import get_subscription_channels
 from instance.tests.api.base import APITestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
@@ -139,6 +140,10 @@ class InstanceAPITestCase(APITestCase):
         response = self.api_client.get('/api/v1/instance/{pk}/'.format(pk=instance.ref.pk))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.check_serialized_instance(response.data, instance)
+        self.assertEqual(
+            get_subscription_channels(response.data['events_token']),
+            ['instance.{}'.format(instance.ref.pk)]
+        )
 
     def test_not_all_appservers_are_loaded_by_default(self):
         """
@@ -184,6 +189,30 @@ class InstanceAPITestCase(APITestCase):
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
             self.assertEqual(expected_entry['text'].format(inst_id=instance.ref.pk), log_entry['text'])
 
+    def test_get_log_entries_paginated(self):
+        """
+        GET - Log entries, a page at a time from the most recent ones
+        """
+        self.api_client.login(username='user3', password='pass')
+        instance = OpenEdXInstanceFactory(name="Test!")
+        for i in range(5):
+            instance.logger.info("line {}".format(i))
+        url = '/api/v1/instance/{pk}/logs/'.format(pk=instance.ref.pk)
+
+        response = self.api_client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['text'][-6:] for entry in response.data['log_entries']], ['line 3', 'line 4'])
+
+        response = self.api_client.get(url, {'limit': 2, 'before': response.data['previous_cursor']})
+        self.assertEqual([entry['text'][-6:] for entry in response.data['log_entries']], ['line 1', 'line 2'])
+
+        response = self.api_client.get(url, {'limit': 2, 'before': response.data['previous_cursor']})
+        self.assertEqual([entry['text'][-6:] for entry in response.data['log_entries']], ['line 0'])
+        self.assertIsNone(response.data['previous_cursor'])
+
+        response = self.api_client.get(url, {'before': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     @ddt.data(
         (None, 'Authentication credentials were not provided.'),
         ('user1', 'You do not have permission to perform this action.'),
@@ -27,6 +27,8 @@ from unittest.mock import patch
 import ddt
 from rest_framework import status
 from django.conf import settings
+from django.test import override_settings
+from instance.channels import get_subscription_channels
 from instance.tasks import spawn_appserver
 
 from instance.tests.api.base import APITestCase
@@ -167,6 +169,11 @@ class OpenEdXAppServerAPIAcessTestCase(APITestCase):
         # The API call will try to start the server, which will fail, since we're
         # not actually talking to an OpenStack instance when unit tests are running
         self.assertIn(('status', 'failed'), server_data)
+        # Token to subscribe to the events of the appserver and its server:
+        self.assertEqual(
+            get_subscription_channels(data['events_token']),
+            ['appserver.{}'.format(app_server.pk), 'server.{}'.format(app_server.server.pk)]
+        )
         self.assertIn('log_entries', data)
         self.assertIn('log_error_entries', data)
 
@@ -610,6 +617,43 @@ class OpenEdXAppServerAPILogsTestCase(APITestCase):
             inst_id=instance.ref.id, as_id=app_server.pk, server_id=server.pk, server_name=server.name,
         )
 
+    @override_settings(LOG_TAIL_RESPONSE_DURATION=1)
+    def test_get_log_tail(self):
+        """
+        GET - Stream new log entries of the appserver and its server
+        """
+        self.api_client.login(username='user3', password='pass')
+        app_server = make_test_appserver(OpenEdXInstanceFactory())
+        app_server.logger.info("old line")
+        tail_cursor = self.api_client.get(
+            '/api/v1/openedx_appserver/{pk}/logs/'.format(pk=app_server.pk)
+        ).data['tail_cursor']
+        app_server.logger.info("new line")
+        app_server.server.logger.info("new server line")
+
+        response = self.api_client.get(
+            '/api/v1/openedx_appserver/{pk}/log_tail/'.format(pk=app_server.pk), {'cursor': tail_cursor},
+            HTTP_ACCEPT='text/event-stream',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode()
+        self.assertNotIn('old line', content)
+        self.assertIn('new line', content)
+        self.assertIn('new server line', content)
+
+    def test_get_log_tail_invalid_cursor(self):
+        """
+        GET - Streaming log entries from an invalid cursor fails
+        """
+        self.api_client.login(username='user3', password='pass')
+        app_server = make_test_appserver(OpenEdXInstanceFactory())
+        response = self.api_client.get(
+            '/api/v1/openedx_appserver/{pk}/log_tail/'.format(pk=app_server.pk), {'cursor': 'invalid'},
+            HTTP_ACCEPT='text/event-stream',
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     @ddt.data(
         (None, 'Authentication credentials were not provided.'),
         ('user1', 'You do not have permission to perform this action.'),
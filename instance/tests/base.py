@@ -30,6 +30,7 @@ from django.contrib.auth.models import User, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase as DjangoTestCase
 
+from instance import openstack_utils
 from userprofile.models import UserProfile, Organization
 from ..models.instance import InstanceReference
 
@@ -106,6 +107,8 @@ class TestCase(DjangoTestCase):
     def setUp(self):
         super().setUp()
         self.maxDiff = None #pylint: disable=invalid-name
+        # Don't reuse the OpenStack clients - or mocks - cached by other tests
+        openstack_utils.clear_client_cache()
 
 
 class WithUserTestCase(DjangoTestCase):
@@ -52,7 +52,9 @@ describe('Instance app', function () {
                 };
             }),
             sendChannelMessage: undefined,
-            ready: jasmine.createSpy()
+            ready: jasmine.createSpy().and.callFake(function(callback) { callback(); }),
+            subscribe: jasmine.createSpy(),
+            unsubscribe: jasmine.createSpy()
         };
 
         // Models
@@ -95,6 +97,10 @@ describe('Instance app', function () {
                 swampdragon.sendChannelMessage({type: "test_event", otherVal: 42});
                 expect(handler).toHaveBeenCalledWith(jasmine.any(Object), {type: "test_event", otherVal: 42});
             });
+
+            it('only subscribes to the global notification channel', function() {
+                expect(swampdragon.subscribe.calls.allArgs()).toEqual([['notifier', 'notification', null]]);
+            });
         });
 
         describe('$scope.updateInstanceList', function() {
@@ -160,6 +166,20 @@ describe('Instance app', function () {
             it('loads the instance details from the API on init', function() {
                 expect(jasmine.sanitizeRestangularOne($scope.instance)).toEqual(instanceDetail);
             });
+
+            it('subscribes to the events of the instance until the view is destroyed', function() {
+                expect(swampdragon.subscribe).toHaveBeenCalledWith(
+                    'object_events', 'instance', {token: instanceDetail.events_token}
+                );
+                $scope.refresh();
+                flushHttpBackend();
+                expect(swampdragon.subscribe.calls.count()).toEqual(2); // Only subscribed once
+
+                $scope.$destroy();
+                expect(swampdragon.unsubscribe).toHaveBeenCalledWith(
+                    'object_events', 'instance', {token: instanceDetail.events_token}
+                );
+            });
         });
 
         describe('swampdragon event handlers', function() {
@@ -190,6 +210,17 @@ describe('Instance app', function () {
                 expect($scope.refresh).not.toHaveBeenCalled();
                 expect($scope.instance.log_entries.push).toHaveBeenCalledWith(logEntry);
             });
+            it("update the instance's log entries for batches of log lines", function() {
+                const logEntry1 = {created: new Date(), level: "INFO", text: "A long time ago"};
+                const logEntry2 = {created: new Date(), level: "INFO", text: "in a galaxy far, far away"};
+                swampdragon.sendChannelMessage({
+                    type: "object_log_lines",
+                    instance_id: instanceDetail.id,
+                    log_entries: [logEntry1, logEntry2],
+                });
+                expect($scope.refresh).not.toHaveBeenCalled();
+                expect($scope.instance.log_entries.push.calls.allArgs()).toEqual([[logEntry1], [logEntry2]]);
+            });
             it("do not update the instance's log entries for other instance logs", function() {
                 swampdragon.sendChannelMessage({
                     type: "object_log_line",
@@ -340,7 +371,7 @@ describe('Instance app', function () {
                     "text": "instance.models.appserver | instance=50 (PR#12338: WIP S),app_server=8 (AppServer 2) | Starting provisioning",
                     "created": "2016-05-19T03:33:25.272824Z"
                 };
-                httpBackend.whenGET('/api/v1/openedx_appserver/8/logs/').respond({
+                httpBackend.whenGET('/api/v1/openedx_appserver/8/logs/?limit=500').respond({
                     "log_entries": [logEntry]
                 });
 
@@ -348,6 +379,59 @@ describe('Instance app', function () {
                 $scope.logsPanelOpen = true;
                 flushHttpBackend();
                 expect($scope.appserverLogs.log_entries[0]).toEqual(logEntry);
+
+                // Without a tail cursor, new log lines are received through the websocket:
+                expect(swampdragon.subscribe).toHaveBeenCalledWith(
+                    'object_events', 'appserver', {token: appServerDetail.events_token}
+                );
+                $scope.$destroy();
+                expect(swampdragon.unsubscribe).toHaveBeenCalledWith(
+                    'object_events', 'appserver', {token: appServerDetail.events_token}
+                );
+            });
+
+            it('follows the AppServer logs from the tail cursor', function() {
+                var originalEventSource = window.EventSource,
+                    logTail = null,
+                    logEntry = {"level": "ERROR", "text": "Streamed log entry", "created": "2016-05-19T03:33:26Z"};
+                window.EventSource = function(url) {
+                    this.url = url;
+                    this.close = jasmine.createSpy('close');
+                    logTail = this;
+                };
+                httpBackend.whenGET('/api/v1/openedx_appserver/8/logs/?limit=500').respond({
+                    "log_entries": [],
+                    "log_error_entries": [],
+                    "tail_cursor": "1-0,2-0"
+                });
+
+                $scope.logsPanelOpen = true;
+                flushHttpBackend();
+                window.EventSource = originalEventSource;
+                expect(logTail.url).toEqual('/api/v1/openedx_appserver/8/log_tail/?cursor=1-0%2C2-0');
+
+                logTail.onmessage({data: JSON.stringify({log_entries: [logEntry]})});
+                expect($scope.appserverLogs.log_entries).toEqual([logEntry]);
+                expect($scope.appserverLogs.log_error_entries).toEqual([logEntry]);
+
+                $scope.$destroy();
+                expect(logTail.close).toHaveBeenCalled();
+                expect(swampdragon.unsubscribe).not.toHaveBeenCalled();
+            });
+
+            it('loads older AppServer logs from the previous cursor', function() {
+                var logEntry = {"level": "INFO", "text": "Newer log entry", "created": "2016-05-19T03:33:25.272824Z"},
+                    olderLogEntry = {"level": "INFO", "text": "Older log entry", "created": "2016-05-19T03:33:24Z"};
+                $scope.appserverLogs = {log_entries: [logEntry], log_error_entries: [], previous_cursor: 'abc'};
+                httpBackend.whenGET('/api/v1/openedx_appserver/8/logs/?before=abc&limit=500').respond({
+                    "log_entries": [olderLogEntry],
+                    "previous_cursor": null
+                });
+
+                $scope.fetchOlderLogs();
+                flushHttpBackend();
+                expect($scope.appserverLogs.log_entries).toEqual([olderLogEntry, logEntry]);
+                expect($scope.appserverLogs.previous_cursor).toBe(null);
             });
         });
 
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - Configuration settings rendering benchmark command unit tests
+"""
+# Imports #####################################################################
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
+
+
+# Tests #######################################################################
+
+class BenchmarkConfigurationSettingsTestCase(TestCase):
+    """
+    Test cases for the `benchmark_configuration_settings` management command.
+    """
+    def test_benchmark(self):
+        """
+        Both rendering methods are timed, without creating any appserver.
+        """
+        instance = OpenEdXInstanceFactory(configuration_extra_settings='EDXAPP_PLATFORM_NAME: "Overridden!"')
+        out = StringIO()
+        call_command('benchmark_configuration_settings', str(instance.pk), '--iterations', '2', stdout=out)
+        self.assertIn('YAML round-trip:', out.getvalue())
+        self.assertIn('Dict merge:', out.getvalue())
+        self.assertFalse(OpenEdXAppServer.objects.exists())
+
+    def test_unknown_instance(self):
+        """
+        An error is raised for unknown instances.
+        """
+        with self.assertRaises(CommandError):
+            call_command('benchmark_configuration_settings', '0', stdout=StringIO())
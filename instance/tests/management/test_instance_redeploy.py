@@ -29,6 +29,7 @@ from django.utils.six import StringIO
 from django.test import TestCase
 
 from instance.models.instance import InstanceTag
+from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 
@@ -181,7 +182,8 @@ class InstanceRedeployTestCase(TestCase):
                 deactivate_old_appservers=False,
                 num_attempts=1,
                 success_tag=None,
-                failure_tag=None):
+                failure_tag=None,
+                skip_unchanged=False):
             """
             Mock the instance.tasks.spawn_appserver method to
             instantly mark appserver as successfully spawned.
@@ -264,7 +266,8 @@ class InstanceRedeployTestCase(TestCase):
                 deactivate_old_appservers=False,
                 num_attempts=1,
                 success_tag=None,
-                failure_tag=None):
+                failure_tag=None,
+                skip_unchanged=False):
             """
             Mock the instance.tasks.spawn_appserver method to
             instantly mark appserver as failed.
@@ -337,3 +340,63 @@ class InstanceRedeployTestCase(TestCase):
             )
             # Verify the logs
             captured_logs.check(*expected_logs)
+
+    @patch('instance.management.commands.instance_redeploy.spawn_appserver')
+    def test_dry_run(self, mock_spawn_appserver):
+        """
+        Test that a dry run lists the instances whose configuration would change, without redeploying them
+        """
+        instances = []
+        for label in 'AB':
+            instance = OpenEdXInstance.objects.create(sub_domain=label, successfully_provisioned=True)
+            appserver = make_test_appserver(instance)
+            OpenEdXAppServer.objects.filter(pk=appserver.pk).update(_is_active=True)
+            instances.append(instance)
+        no_appserver_instance = OpenEdXInstance.objects.create(sub_domain='C', successfully_provisioned=True)
+
+        expected_logs = ((self.cmd_module, self.log_level, msg) for msg in (
+            '** Computing the configuration changes of 3 instances **',
+            'CHANGED: {0} [{0.id}]: EDXAPP_PLATFORM_NAME'.format(instances[0]),
+            'CHANGED: {0} [{0.id}]: EDXAPP_PLATFORM_NAME'.format(instances[1]),
+            'NO ACTIVE APPSERVER: {0} [{0.id}]'.format(no_appserver_instance),
+            'Instances needing redeployment: 2',
+        ))
+        with LogCapture(self.cmd_module) as captured_logs:
+            call_command(
+                'instance_redeploy',
+                '--tag=test-tag',
+                '--dry-run',
+                '--update={"configuration_extra_settings": "EDXAPP_PLATFORM_NAME: Changed"}',
+                stdout=StringIO(),
+            )
+            captured_logs.check(*expected_logs)
+        self.assertFalse(mock_spawn_appserver.called)
+        self.assertEqual(OpenEdXInstance.objects.get(pk=instances[0].pk).configuration_extra_settings, '')
+
+        # Instances without an RSA key aren't saved either
+        OpenEdXInstance.objects.filter(pk=instances[1].pk).update(secret_key_rsa_private='')
+        with LogCapture(self.cmd_module) as captured_logs:
+            call_command(
+                'instance_redeploy',
+                '--tag=test-tag',
+                '--dry-run',
+                '--filter={"sub_domain": "B"}',
+                '--update={"configuration_extra_settings": "EDXAPP_PLATFORM_NAME: Changed"}',
+            )
+            captured_logs.check(*((self.cmd_module, self.log_level, msg) for msg in (
+                '** Computing the configuration changes of 1 instances **',
+                'CHANGED: {0} [{0.id}]: COMMON_JWT_PUBLIC_SIGNING_JWK_SET, EDXAPP_JWT_PRIVATE_SIGNING_JWK, '
+                'EDXAPP_PLATFORM_NAME'.format(instances[1]),
+                'Instances needing redeployment: 1',
+            )))
+        instance = OpenEdXInstance.objects.get(pk=instances[1].pk)
+        self.assertEqual(instance.secret_key_rsa_private, '')
+        self.assertEqual(instance.configuration_extra_settings, '')
+
+        with LogCapture(self.cmd_module) as captured_logs:
+            call_command('instance_redeploy', '--tag=test-tag', '--dry-run', '--filter={"sub_domain": "A"}')
+            captured_logs.check(*((self.cmd_module, self.log_level, msg) for msg in (
+                '** Computing the configuration changes of 1 instances **',
+                'UNCHANGED: {0} [{0.id}]'.format(instances[0]),
+                'Instances needing redeployment: 0',
+            )))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Instance - Partition log entries command unit tests
+"""
+# Imports #####################################################################
+
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.utils.six import StringIO
+from freezegun import freeze_time
+
+from instance.models.log_entry import LogEntry
+
+
+# Tests #######################################################################
+
+@skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+class PartitionLogEntriesTestCase(TestCase):
+    """
+    Test cases for the `partition_log_entries` management command.
+    """
+    def test_not_partitioned(self):
+        """
+        The table is only converted when requested explicitly.
+        """
+        with self.assertRaises(CommandError):
+            call_command('partition_log_entries', stdout=StringIO())
+        self.assertFalse(LogEntry.is_partitioned())
+
+    @patch('instance.management.commands.partition_log_entries.MigrationExecutor')
+    def test_unapplied_migrations(self, mock_executor):
+        """
+        The table is only converted once all migrations are applied.
+        """
+        mock_executor.return_value.migration_plan.return_value = [('migration', False)]
+        with self.assertRaisesRegex(CommandError, 'Apply all migrations'):
+            call_command('partition_log_entries', '--convert', stdout=StringIO())
+        self.assertFalse(LogEntry.is_partitioned())
+
+    @freeze_time('2018-12-30 12:00:00')
+    def test_convert(self):
+        """
+        Existing log entries are kept in the legacy partition, and partitions are created for the coming days.
+        """
+        log_entry = LogEntry.objects.create(text='Existing log entry')
+        out = StringIO()
+        call_command('partition_log_entries', '--convert', '--days-ahead', '2', stdout=out)
+
+        self.assertTrue(LogEntry.is_partitioned())
+        self.assertEqual(
+            [name for name, dummy in LogEntry.get_partitions()],
+            ['instance_logentry_legacy', 'instance_logentry_p20181231', 'instance_logentry_p20190101'],
+        )
+        self.assertIn('Converted the log entries table into a partitioned table.', out.getvalue())
+        self.assertEqual(LogEntry.objects.get(pk=log_entry.pk).text, 'Existing log entry')
+
+        # New log entries get IDs from the same sequence
+        self.assertGreater(LogEntry.objects.create(text='New log entry').pk, log_entry.pk)
+
+        # Running the command again creates the missing partitions
+        call_command('partition_log_entries', '--days-ahead', '3', stdout=StringIO())
+        self.assertEqual(LogEntry.get_partitions()[-1][0], 'instance_logentry_p20190102')
@@ -22,30 +22,41 @@ LoadBalancingServer model - tests
 import re
 from unittest.mock import Mock, patch
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from instance.haproxy import RuntimeAPIError
 from instance.models.load_balancer import LoadBalancingServer, ReconfigurationFailed
+from instance.models.openedx_appserver import OpenEdXAppServer
+from instance.models.server import OpenStackServer, Status as ServerStatus
 from instance.tests.base import TestCase
 from instance.tests.models.factories.load_balancer import LoadBalancingServerFactory
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+from instance.tests.models.factories.openedx_instance import OpenEdXInstanceFactory
 
 
 def mock_instances():
     """
     Patch out the get_instances() method.
     """
-    def make_mock_instance(domains, ip_address, backend_name):
+    def make_mock_instance(ref_id, domains, ip_address, backend_name):
         """
         Create a mock instance meant for load balancer testing.
         """
         instance = Mock()
+        instance.ref.pk = ref_id
         map_entries = [(domain, backend_name) for domain in domains]
         conf_entries = [(backend_name, "    server test-server {}:80".format(ip_address))]
         instance.get_load_balancer_configuration.return_value = map_entries, conf_entries
+        instance.get_load_balancer_configuration_context.return_value = " ".join(domains)
         return instance
 
     return [
         make_mock_instance(
+            1,
             # We include an upper-case domain name here to be able to test it gets properly
             # converted to lower-case when the configuration is sent to the load balancer.
             ["test1.lb.opencraft.hosting", "TEST2.lb.opencraft.hosting"],
@@ -53,6 +64,7 @@ def mock_instances():
             "first-backend",
         ),
         make_mock_instance(
+            2,
             ["test3.lb.opencraft.hosting"],
             "5.6.7.8",
             "second-backend",
@@ -88,6 +100,41 @@ class LoadBalancingServerTest(TestCase):
             "second-backend" + self.load_balancer.fragment_name_postfix,
         ])
 
+    def _add_instance(self, active_appservers=1):
+        """
+        Create an instance using the load balancer, with the given number of active appservers.
+        """
+        instance = OpenEdXInstanceFactory(load_balancing_server=self.load_balancer)
+        for dummy in range(active_appservers):
+            appserver = make_test_appserver(instance)
+            OpenEdXAppServer.objects.filter(pk=appserver.pk).update(_is_active=True)
+            OpenStackServer.objects.filter(pk=appserver.server.pk).update(
+                _status=ServerStatus.Ready.state_id,
+                _public_ip='10.0.0.{}'.format(appserver.pk),
+            )
+
+    def _count_configuration_queries(self):
+        """
+        Return the number of queries needed to render the configuration of all instances.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            for instance in self.load_balancer.get_instances():
+                instance.get_load_balancer_configuration()
+        return len(queries)
+
+    def test_get_instances_query_count(self):
+        """
+        Test that the number of queries to render the configuration doesn't depend on the number of instances.
+        """
+        self._add_instance()
+        self._add_instance(active_appservers=0)
+        query_count = self._count_configuration_queries()
+
+        self._add_instance()
+        self._add_instance(active_appservers=2)
+        self._add_instance(active_appservers=0)
+        self.assertEqual(self._count_configuration_queries(), query_count)
+
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
     @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
@@ -103,6 +150,172 @@ class LoadBalancingServerTest(TestCase):
         self.load_balancer.delete()
         self.assertEqual(mock_run_playbook.call_count, 2)
 
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances')
+    def test_get_configuration_fragments(self, mock_get_instances):
+        """
+        Test that only the fragments of the invalidated instances are rendered again.
+        """
+        instances = mock_instances()
+        mock_get_instances.return_value = instances
+        configuration = self.load_balancer.get_configuration()
+        self.assertEqual(self.load_balancer.fragments.count(), 2)
+
+        # Fragments are reused until their instance invalidates them
+        self.assertEqual(self.load_balancer.get_configuration(), configuration)
+        for instance in instances:
+            self.assertEqual(instance.get_load_balancer_configuration.call_count, 1)
+
+        self.load_balancer.invalidate_fragment(instances[1].ref.pk)
+        self.load_balancer.configuration_version += 1
+        instances[1].get_load_balancer_configuration.return_value = [], []
+        backend_map, backend_conf = self.load_balancer.get_configuration(instances[1].ref.pk)
+        self.assertEqual(instances[0].get_load_balancer_configuration.call_count, 1)
+        instances[1].get_load_balancer_configuration.assert_called_with(True)
+        self.assertNotIn("second-backend", backend_map)
+        self.assertNotIn("second-backend", backend_conf)
+
+        # The fragments of instances which don't use the load balancer anymore are deleted
+        mock_get_instances.return_value = instances[:1]
+        self.assertTrue(self.load_balancer.has_outdated_fragments())
+        self.load_balancer.get_configuration()
+        self.assertEqual(
+            list(self.load_balancer.fragments.values_list('instance_ref_id', flat=True)),
+            [instances[0].ref.pk],
+        )
+        self.assertFalse(self.load_balancer.has_outdated_fragments())
+
+        # Fragments are rendered again once the settings they depend on changed
+        instances[0].get_load_balancer_configuration_context.return_value = "other.lb.opencraft.hosting"
+        self.assertTrue(self.load_balancer.has_outdated_fragments())
+        self.load_balancer.get_configuration()
+        self.assertEqual(instances[0].get_load_balancer_configuration.call_count, 2)
+        instances[0].get_load_balancer_configuration.assert_called_with(False)
+        self.assertFalse(self.load_balancer.has_outdated_fragments())
+
+    def test_get_load_balancer_configuration_context(self):
+        """
+        Test that the configuration context of an instance changes with the settings its fragment depends on.
+        """
+        instance = OpenEdXInstanceFactory(load_balancing_server=self.load_balancer)
+        context = instance.get_load_balancer_configuration_context()
+        self.assertEqual(instance.get_load_balancer_configuration_context(), context)
+
+        instance.http_auth_pass = 'changed'
+        self.assertNotEqual(instance.get_load_balancer_configuration_context(), context)
+        instance.refresh_from_db()
+        with override_settings(PRELIMINARY_PAGE_SERVER_IP='10.0.0.1'):
+            self.assertNotEqual(instance.get_load_balancer_configuration_context(), context)
+        instance.external_lms_domain = 'changed.example.com'
+        self.assertNotEqual(instance.get_load_balancer_configuration_context(), context)
+
+    @patch("instance.ansible.poll_streams")
+    @patch("instance.ansible.run_playbook")
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    def test_reconfigure_unchanged(self, mock_get_instances, mock_run_playbook, mock_poll_streams):
+        """
+        Test that the playbook only runs when the configuration fragments changed.
+        """
+        mock_run_playbook.return_value.__enter__.return_value.returncode = 0
+        self.load_balancer.reconfigure()
+        self.load_balancer.reconfigure(triggering_instance_id=1)
+        self.assertEqual(mock_run_playbook.call_count, 1)
+        self.assertEqual(self.load_balancer.deployed_configuration_version, 3)
+
+        mock_get_instances.return_value[0].get_load_balancer_configuration.return_value = [], []
+        self.load_balancer.reconfigure(triggering_instance_id=1)
+        self.assertEqual(mock_run_playbook.call_count, 2)
+
+        self.load_balancer.deconfigure()
+        self.assertEqual(self.load_balancer.deployed_configuration_hash, '')
+
+    @override_settings(LOAD_BALANCER_RUNTIME_API_SOCKET='/run/haproxy/admin.sock')
+    @patch('instance.tasks.update_load_balancer_configuration_files.schedule')
+    @patch('instance.models.load_balancer.LoadBalancingServer.run_runtime_commands')
+    @patch("instance.ansible.poll_streams")
+    @patch("instance.ansible.run_playbook")
+    @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
+    def test_reconfigure_runtime_api(
+            self, mock_get_instances, mock_run_playbook, mock_poll_streams, mock_run_runtime_commands,
+            mock_schedule_files_update
+    ):
+        """
+        Test that server changes are applied through the runtime API, and other changes by the playbook.
+        """
+        mock_run_playbook.return_value.__enter__.return_value.returncode = 0
+        instances = mock_get_instances.return_value
+        self.load_balancer.reconfigure()
+        self.assertEqual(mock_run_playbook.call_count, 1)
+
+        def set_server_ip(instance, ip_address, options=""):
+            """
+            Change the IP address and options of the server of the given mock instance.
+            """
+            map_entries, conf_entries = instance.get_load_balancer_configuration.return_value
+            instance.get_load_balancer_configuration.return_value = map_entries, [
+                (backend, "    server test-server {}:80{}".format(ip_address, options))
+                for backend, dummy in conf_entries
+            ]
+
+        set_server_ip(instances[0], "1.2.3.5")
+        self.load_balancer.reconfigure(triggering_instance_id=1)
+        mock_run_runtime_commands.assert_called_once_with([
+            "set server first-backend{}/test-server addr 1.2.3.5 port 80".format(
+                self.load_balancer.fragment_name_postfix
+            ),
+        ])
+        self.assertEqual(mock_run_playbook.call_count, 1)
+        self.assertTrue(self.load_balancer.runtime_changes_pending)
+        mock_schedule_files_update.assert_called_once_with(
+            args=(self.load_balancer.pk,), delay=settings.LOAD_BALANCER_CONFIGURATION_FILES_DELAY,
+        )
+
+        # The scheduled update writes the changes to the configuration files
+        self.load_balancer.reconfigure(mark_dirty=False, runtime_api=False)
+        self.assertEqual(mock_run_playbook.call_count, 2)
+        self.assertFalse(self.load_balancer.runtime_changes_pending)
+
+        # Removing a backend requires the playbook
+        instances[1].get_load_balancer_configuration.return_value = [], []
+        self.load_balancer.reconfigure(triggering_instance_id=2)
+        self.assertEqual(mock_run_playbook.call_count, 3)
+        self.assertEqual(mock_run_runtime_commands.call_count, 1)
+
+        # The playbook runs when the runtime API fails
+        mock_run_runtime_commands.side_effect = RuntimeAPIError
+        set_server_ip(instances[0], "1.2.3.6")
+        self.load_balancer.reconfigure(triggering_instance_id=1)
+        self.assertEqual(mock_run_runtime_commands.call_count, 2)
+        self.assertEqual(mock_run_playbook.call_count, 4)
+        self.assertFalse(self.load_balancer.runtime_changes_pending)
+        self.assertEqual(mock_schedule_files_update.call_count, 1)
+
+        # Health checks can't be enabled at runtime on an existing server
+        mock_run_runtime_commands.side_effect = None
+        set_server_ip(instances[0], "1.2.3.6", " check")
+        self.load_balancer.reconfigure(triggering_instance_id=1)
+        self.assertEqual(mock_run_runtime_commands.call_count, 2)
+        self.assertEqual(mock_run_playbook.call_count, 5)
+
+    @patch('instance.tasks.reconfigure_load_balancer.schedule')
+    def test_request_reconfiguration(self, mock_schedule):
+        """
+        Test that the reconfigurations requested before the scheduled one starts are deployed together.
+        """
+        self.load_balancer.clear_scheduled_reconfiguration()
+        self.addCleanup(self.load_balancer.clear_scheduled_reconfiguration)
+        for dummy in range(3):
+            self.load_balancer.request_reconfiguration()
+        mock_schedule.assert_called_once_with(
+            args=(self.load_balancer.pk,), delay=settings.LOAD_BALANCER_RECONFIGURATION_DELAY,
+        )
+        self.load_balancer.refresh_from_db()
+        self.assertEqual(self.load_balancer.configuration_version, 4)
+
+        # Once the scheduled reconfiguration started, changes schedule another one
+        self.load_balancer.clear_scheduled_reconfiguration()
+        self.load_balancer.request_reconfiguration()
+        self.assertEqual(mock_schedule.call_count, 2)
+
     @patch("instance.ansible.poll_streams")
     @patch("instance.ansible.run_playbook")
     @patch('instance.models.load_balancer.LoadBalancingServer.get_instances', return_value=mock_instances())
@@ -22,6 +22,7 @@ Logger models & mixins - Tests
 
 # Imports #####################################################################
 
+import logging
 from unittest.mock import patch
 
 from django.contrib.contenttypes.models import ContentType
@@ -29,6 +30,7 @@ from django.core.exceptions import ValidationError
 from django.test import override_settings
 from freezegun import freeze_time
 
+from instance.logging import BufferedDBHandler, PlaybookOutputSink
 from instance.models.log_entry import LogEntry
 from instance.tests.base import TestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
@@ -120,6 +122,29 @@ class LoggingTestCase(TestCase):
         with override_settings(LOG_LIMIT=2):
             self.check_log_entries(self.app_server.log_entries, expected[-2:])
 
+    @patch('instance.logging.publish_data')
+    def test_playbook_output_sink(self, mock_publish_data):
+        """
+        Playbook output is recorded like the lines logged through the model logger, in a single batch
+        """
+        with freeze_time("2015-08-05 18:07:00"):
+            with PlaybookOutputSink(self.app_server.logger) as log_sink:
+                log_sink.info('TASK [Gathering Facts]')
+                log_sink.error('fatal: [127.0.0.1]: UNREACHABLE!')
+                self.assertEqual(LogEntry.objects.count(), 0)
+
+        expected = [
+            ("2015-08-05 18:07:00", 'INFO', self.appserver_prefix + 'TASK [Gathering Facts]'),
+            ("2015-08-05 18:07:00", 'ERROR', self.appserver_prefix + 'fatal: [127.0.0.1]: UNREACHABLE!'),
+        ]
+        self.check_log_entries(self.app_server.log_entries, expected)
+        self.assertEqual(mock_publish_data.call_count, 1)
+        (channel, event), dummy = mock_publish_data.call_args
+        self.assertEqual(channel, 'appserver.{}'.format(self.app_server.pk))
+        self.assertEqual(event['type'], 'object_log_lines')
+        self.assertEqual(event['appserver_id'], self.app_server.pk)
+        self.assertEqual(len(event['log_entries']), 2)
+
     @patch('instance.logging.publish_data')
     def test_log_publish(self, mock_publish_data):
         """
@@ -128,7 +153,7 @@ class LoggingTestCase(TestCase):
         with freeze_time("2015-09-21 21:07:00"):
             self.instance.logger.info('Text the client should see')
 
-        mock_publish_data.assert_called_with('log', {
+        mock_publish_data.assert_called_with('instance.{}'.format(self.instance.ref.pk), {
             'log_entry': {
                 'created': '2015-09-21T21:07:00Z',
                 'level': 'INFO',
@@ -146,7 +171,7 @@ class LoggingTestCase(TestCase):
         with freeze_time("2015-09-21 21:07:01"):
             self.server.logger.info('Text the client should also see, with unicode «ταБЬℓσ»')
 
-        mock_publish_data.assert_called_with('log', {
+        mock_publish_data.assert_called_with('server.{}'.format(self.server.pk), {
             'log_entry': {
                 'created': '2015-09-21T21:07:01Z',
                 'level': 'INFO',
@@ -307,3 +332,80 @@ class LoggingTestCase(TestCase):
         self.assertEqual(entries[2].level, "CRITICAL")
         self.assertEqual(entries[2].created.strftime("%Y-%m-%d %H:%M:%S"), "2015-08-05 18:07:06")
         self.assertEqual(entries[2].text, self.appserver_prefix + "Line #7, exception")
+
+
+class BufferedDBHandlerTestCase(TestCase):
+    """
+    Test cases for the buffered database log handler
+    """
+    def setUp(self):
+        super().setUp()
+        self.server = OpenStackServerFactory(openstack_id='vm1_id')
+        self.other_server = OpenStackServerFactory(openstack_id='vm2_id')
+        # Disable the flush timer, so that the tests control when entries get written:
+        self.handler = BufferedDBHandler(capacity=3, flush_interval=0)
+        self.addCleanup(self.handler.close)
+        LogEntry.objects.all().delete()
+
+    @staticmethod
+    def make_record(msg, obj, level=logging.INFO):
+        """
+        Create a log record for the given message and object
+        """
+        return logging.getLogger(__name__).makeRecord(
+            __name__, level, __file__, 0, msg, (), None, extra={'obj': obj}
+        )
+
+    @patch('instance.logging.publish_data')
+    def test_flush_on_capacity(self, mock_publish_data):
+        """
+        Log entries are only written once the buffer is full, with a single query
+        """
+        self.handler.handle(self.make_record('Line #1', self.server))
+        self.handler.handle(self.make_record('Line #2', self.other_server))
+        self.assertEqual(LogEntry.objects.count(), 0)
+        mock_publish_data.assert_not_called()
+
+        with self.assertNumQueries(1):
+            self.handler.handle(self.make_record('Line #3', self.server))
+        self.assertEqual(list(LogEntry.objects.order_by('pk').values_list('text', flat=True)),
+                         ['Line #1', 'Line #2', 'Line #3'])
+        self.assertEqual(self.handler.buffer, [])
+
+        # One event is published per object
+        self.assertEqual(mock_publish_data.call_count, 2)
+        (channel, event), dummy = mock_publish_data.call_args_list[0]
+        self.assertEqual(channel, 'server.{}'.format(self.server.pk))
+        self.assertEqual(event['type'], 'object_log_lines')
+        self.assertEqual(event['server_id'], self.server.pk)
+        self.assertEqual([entry['text'] for entry in event['log_entries']], ['Line #1', 'Line #3'])
+        (channel, event), dummy = mock_publish_data.call_args_list[1]
+        self.assertEqual(channel, 'server.{}'.format(self.other_server.pk))
+        self.assertEqual(event['server_id'], self.other_server.pk)
+        self.assertEqual([entry['text'] for entry in event['log_entries']], ['Line #2'])
+
+    @patch('instance.logging.publish_data')
+    def test_flush_on_error(self, mock_publish_data):
+        """
+        Errors are written immediately
+        """
+        self.handler.handle(self.make_record('Line #1', self.server))
+        self.handler.handle(self.make_record('Something went wrong', self.server, level=logging.ERROR))
+        self.assertEqual(
+            list(LogEntry.objects.order_by('pk').values_list('level', flat=True)),
+            ['INFO', 'ERROR'],
+        )
+        self.assertEqual(mock_publish_data.call_count, 1)
+
+    @patch('instance.logging.publish_data')
+    def test_flush_on_close(self, mock_publish_data):
+        """
+        Queued log entries are written when the handler is closed
+        """
+        self.handler.handle(self.make_record('Line #1', self.server))
+        self.handler.handle(self.make_record('Line #2', None))
+        self.assertEqual(LogEntry.objects.count(), 0)
+        self.handler.close()
+        self.assertEqual(LogEntry.objects.count(), 2)
+        # Log entries without an object are not published
+        self.assertEqual(mock_publish_data.call_count, 1)
@@ -23,11 +23,11 @@ OpenEdXAppServer Ansible Mixin - Tests
 # Imports #####################################################################
 
 import os
-from unittest.mock import patch, call, Mock
+from unittest.mock import ANY, patch, call, Mock
 
 import ddt
 
-from instance.models.mixins.ansible import Playbook
+from instance.models.mixins.ansible import order_playbooks, Playbook
 from instance.tests.base import TestCase
 from instance.tests.models.factories.openedx_appserver import make_test_appserver
 from instance.tests.utils import patch_services
@@ -72,18 +72,28 @@ class AnsibleAppServerTestCase(TestCase):
     @ddt.data(0, 1)
     @patch('instance.ansible.poll_streams')
     @patch('instance.ansible.run_playbook')
+    @patch('instance.ansible.prepare_virtualenv')
     @patch('instance.models.openedx_appserver.OpenEdXAppServer.inventory_str')
     @patch('instance.models.mixins.ansible.open_repository')
     def test_provisioning(
-            self, playbook_returncode, mock_open_repo, mock_inventory, mock_run_playbook, mock_poll_streams
+            self, playbook_returncode, mock_open_repo, mock_inventory, mock_prepare_virtualenv, mock_run_playbook,
+            mock_poll_streams
     ):
         """The appserver gets provisioned with the appropriate playbooks. Failure causes later playbooks to not run."""
         appserver = make_test_appserver()
         working_dir = '/cloned/configuration-repo/path'
         mock_open_repo.return_value.__enter__.return_value.working_dir = working_dir
+        mock_open_repo.return_value.__enter__.return_value.rev_parse.return_value = 'a' * 40
         mock_run_playbook.return_value.__enter__.return_value.returncode = playbook_returncode
 
-        appserver.run_ansible_playbooks()
+        commits = {}
+        dummy, returncode = appserver.run_ansible_playbooks(commits=commits)
+        self.assertEqual(returncode, playbook_returncode)
+        self.assertEqual(commits[(appserver.configuration_source_repo_url, appserver.configuration_version)], 'a' * 40)
+        # The repositories and virtualenvs of the playbooks are prepared, and the clones are deleted
+        self.assertGreaterEqual(mock_open_repo.call_count, 1)
+        self.assertEqual(mock_open_repo.return_value.__exit__.call_count, mock_open_repo.call_count)
+        mock_prepare_virtualenv.assert_called_with('{}/requirements.txt'.format(working_dir))
 
         self.assertIn(call(
             requirements_path='{}/requirements.txt'.format(working_dir),
@@ -92,6 +102,7 @@ class AnsibleAppServerTestCase(TestCase):
             playbook_path='{}/playbooks'.format(working_dir),
             playbook_name='edx_sandbox.yml',
             username='ubuntu',
+            task_events_fd=ANY,
         ), mock_run_playbook.mock_calls)
 
         assert_func = self.assertIn if playbook_returncode == 0 else self.assertNotIn
@@ -102,6 +113,7 @@ class AnsibleAppServerTestCase(TestCase):
             playbook_path='{}/playbooks'.format(working_dir),
             playbook_name='appserver.yml',
             username='ubuntu',
+            task_events_fd=ANY,
         ), mock_run_playbook.mock_calls)
 
     @patch('instance.models.mixins.ansible.ansible.run_playbook')
@@ -126,3 +138,88 @@ class AnsibleAppServerTestCase(TestCase):
             log, returncode = appserver._run_playbook("/tmp/test/working/dir/", playbook)
             self.assertCountEqual(log, ['Hello', 'Hi'])
             self.assertEqual(returncode, 0)
+
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin._run_playbook')
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin._prepare_playbook')
+    def test_provisioning_dependencies(self, mock_prepare_playbook, mock_run_playbook):
+        """
+        Playbooks which depend on a failed playbook are skipped, but the other ones still run
+        """
+        mock_prepare_playbook.return_value = (Mock(), Mock(working_dir='/cloned/repo'))
+
+        def run_playbook(working_dir, playbook, log_collector):
+            """
+            Collect a line of output, and fail for failing.yml
+            """
+            log_collector.append('Ran {}'.format(playbook.playbook_path))
+            return list(log_collector), 2 if playbook.playbook_path == 'failing.yml' else 0
+
+        mock_run_playbook.side_effect = run_playbook
+        playbooks = [
+            Playbook(source_repo='repo', playbook_path='failing.yml', requirements_path='requirements.txt',
+                     version='master', variables=''),
+            Playbook(source_repo='repo', playbook_path='dependent.yml', requirements_path='requirements.txt',
+                     version='master', variables=''),
+            Playbook(source_repo='repo', playbook_path='independent.yml', requirements_path='requirements.txt',
+                     version='master', variables='', depends_on=()),
+        ]
+        appserver = make_test_appserver()
+        with patch.object(appserver, 'get_playbooks', return_value=playbooks):
+            log, returncode = appserver.run_ansible_playbooks()
+        self.assertEqual(list(log), ['Ran failing.yml', 'Ran independent.yml'])
+        self.assertEqual(returncode, 2)
+        # The clones are deleted, unless their preparation was cancelled when dependent.yml was skipped
+        self.assertEqual(mock_prepare_playbook.return_value[0].close.call_count, mock_prepare_playbook.call_count)
+
+    @patch('instance.models.mixins.ansible.ansible.PlaybookLogCollector')
+    @patch('instance.models.mixins.ansible.AnsibleAppServerMixin._prepare_playbook')
+    def test_provisioning_preparation_fails(self, mock_prepare_playbook, mock_log_collector):
+        """
+        The log collector is closed when a playbook can't be prepared
+        """
+        mock_prepare_playbook.side_effect = RuntimeError('Unable to clone the repository')
+        appserver = make_test_appserver()
+        with self.assertRaises(RuntimeError):
+            appserver.run_ansible_playbooks()
+        self.assertEqual(mock_log_collector.return_value.__exit__.call_count, 1)
+
+
+@ddt.ddt
+class OrderPlaybooksTestCase(TestCase):
+    """
+    Test cases for the ordering of playbooks based on their dependencies
+    """
+    @staticmethod
+    def make_playbook(name, depends_on=None):
+        """
+        Return a playbook with the given name and dependencies
+        """
+        return Playbook(source_repo='repo', playbook_path='{}.yml'.format(name), requirements_path='requirements.txt',
+                        version='master', variables='', name=name, depends_on=depends_on)
+
+    def test_default_order(self):
+        """
+        By default, each playbook depends on all the previous ones
+        """
+        playbooks = [self.make_playbook('a'), self.make_playbook('b'), self.make_playbook('c')]
+        self.assertEqual(order_playbooks(playbooks), [
+            (playbooks[0], set()),
+            (playbooks[1], {'a'}),
+            (playbooks[2], {'a', 'b'}),
+        ])
+
+    def test_declared_order(self):
+        """
+        Playbooks run after the playbooks they declare as dependencies
+        """
+        playbooks = [self.make_playbook('a', depends_on=['c']), self.make_playbook('b'), self.make_playbook('c', ())]
+        self.assertEqual([playbook.name for playbook, dummy in order_playbooks(playbooks)], ['c', 'a', 'b'])
+
+    @ddt.data(['unknown'], ['b'])
+    def test_invalid_dependencies(self, depends_on):
+        """
+        Unknown and circular dependencies are rejected
+        """
+        playbooks = [self.make_playbook('a', depends_on=depends_on), self.make_playbook('b')]
+        with self.assertRaises(ValueError):
+            order_playbooks(playbooks)
@@ -22,6 +22,7 @@ OpenEdXAppServer model - Tests
 
 # Imports #####################################################################
 
+import gzip
 from unittest.mock import patch, Mock
 
 import novaclient
@@ -36,6 +37,8 @@ from django.test import override_settings
 from freezegun import freeze_time
 from pytz import utc
 
+from instance import ansible
+from instance.ansible import PlaybookLogCollector
 from instance.models.appserver import Status as AppServerStatus, AppServer
 from instance.models.openedx_appserver import OpenEdXAppServer, OPENEDX_APPSERVER_SECURITY_GROUP_RULES
 from instance.models.server import Server
@@ -70,7 +73,7 @@ class OpenEdXAppServerTestCase(TestCase):
         """
         Run provisioning sequence
         """
-        mocks.mock_run_ansible_playbooks.return_value = (['log'], 0)
+        mocks.mock_run_ansible_playbooks.return_value = (PlaybookLogCollector(), 0)
         mocks.mock_create_server.side_effect = [Mock(id='test-run-provisioning-server'), None]
         mocks.os_server_manager.add_fixture('test-run-provisioning-server', 'openstack/api_server_2_active.json')
         mock_reboot = mocks.os_server_manager.get_os_server('test-run-provisioning-server').reboot
@@ -109,8 +112,9 @@ class OpenEdXAppServerTestCase(TestCase):
         Run provisioning sequence failing the deployment on purpose to make sure
         server and instance statuses will be set accordingly.
         """
-        log_lines = ['log']
-        mocks.mock_run_ansible_playbooks.return_value = (log_lines, 1)
+        log = PlaybookLogCollector()
+        log.append('log')
+        mocks.mock_run_ansible_playbooks.return_value = (log, 1)
         appserver = make_test_appserver()
         self.assertEqual(appserver.status, AppServerStatus.New)
         self.assertEqual(appserver.server.status, Server.Status.Pending)
@@ -119,8 +123,11 @@ class OpenEdXAppServerTestCase(TestCase):
         self.assertEqual(appserver.status, AppServerStatus.ConfigurationFailed)
         self.assertEqual(appserver.server.status, Server.Status.Ready)
         mocks.mock_provision_failed_email.assert_called_once_with(
-            "AppServer deploy failed: Ansible play exited with non-zero exit code", log_lines
+            "AppServer deploy failed: Ansible play exited with non-zero exit code", log
         )
+        # The log is deleted once the email was sent
+        with self.assertRaises(ValueError):
+            log.append('log')
 
     @patch_services
     def test_provision_unhandled_exception(self, mocks):
@@ -215,7 +222,9 @@ class OpenEdXAppServerTestCase(TestCase):
         Test launching an appserver in a non-default region.
         """
         instance = OpenEdXInstanceFactory(openstack_region="elsewhere")
-        make_test_appserver(instance)
+        appserver = make_test_appserver(instance)
+        mock_get_nova_client.assert_not_called()
+        self.assertEqual(appserver.server.nova, mock_get_nova_client.return_value)
         mock_get_nova_client.assert_called_once_with("elsewhere")
 
     @data(
@@ -278,6 +287,87 @@ class OpenEdXAppServerTestCase(TestCase):
         self.assertNotIn('Vars Instance', appserver.configuration_settings)
         self.assertIn("EDXAPP_CONTACT_EMAIL: vars@example.com", appserver.configuration_settings)
 
+    def test_configuration_extra_variables(self):
+        """
+        The configuration settings are rendered from the dicts of variables, unless the field was changed since
+        """
+        instance = OpenEdXInstanceFactory()
+        appserver = make_test_appserver(instance)
+        appserver.set_configuration_extra_variables(
+            configuration_database_settings={'DATABASE_VAR': 'database'},
+            configuration_theme_settings={},
+        )
+        self.assertEqual(appserver.configuration_database_settings, 'DATABASE_VAR: database\n')
+        self.assertEqual(appserver.configuration_theme_settings, '')
+
+        with patch('instance.ansible.parse_yaml', wraps=ansible.parse_yaml) as mock_parse_yaml:
+            configuration_settings = yaml.load(appserver.create_configuration_settings())
+        self.assertEqual(configuration_settings['DATABASE_VAR'], 'database')
+        parsed_values = [call_args[0][0] for call_args in mock_parse_yaml.call_args_list]
+        self.assertNotIn(appserver.configuration_database_settings, parsed_values)
+
+        appserver.configuration_database_settings = 'DATABASE_VAR: changed'
+        configuration_settings = yaml.load(appserver.create_configuration_settings())
+        self.assertEqual(configuration_settings['DATABASE_VAR'], 'changed')
+
+    def test_configuration_settings_unchanged(self):
+        """
+        The configuration settings rendered from the dicts of variables are the same as the ones rendered
+        from the YAML fields
+        """
+        instance = OpenEdXInstanceFactory(configuration_extra_settings='EDXAPP_PLATFORM_NAME: "Overridden!"')
+        appserver = make_test_appserver(instance)
+        self.assertEqual(
+            yaml.load(appserver.configuration_settings),
+            yaml.load(OpenEdXAppServer.objects.get(pk=appserver.pk).create_configuration_settings()),
+        )
+
+    def test_configuration_fingerprint(self):
+        """
+        AppServers provisioned with the same settings and playbook commits have the same fingerprint
+        """
+        instance = OpenEdXInstanceFactory()
+        appserver = make_test_appserver(instance)
+        commits = {(playbook.source_repo, playbook.version): 'a' * 40 for playbook in appserver.get_playbooks()}
+        fingerprint = appserver.create_configuration_fingerprint(commits)
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(make_test_appserver(instance).create_configuration_fingerprint(commits), fingerprint)
+        self.assertEqual(appserver.create_configuration_fingerprint({}), '')
+
+        changed_commits = dict(commits)
+        changed_commits[(appserver.configuration_source_repo_url, appserver.configuration_version)] = 'b' * 40
+        self.assertNotEqual(appserver.create_configuration_fingerprint(changed_commits), fingerprint)
+
+        instance.configuration_extra_settings = 'EDXAPP_PLATFORM_NAME: Changed'
+        instance.save()
+        self.assertNotEqual(make_test_appserver(instance).create_configuration_fingerprint(commits), fingerprint)
+
+    @patch_services
+    def test_provision_configuration_fingerprint(self, mocks):
+        """
+        The fingerprint is set from the commits the playbooks ran from once they succeed
+        """
+        mocks.mock_create_server.side_effect = [Mock(id='test-run-provisioning-server'), None]
+        mocks.os_server_manager.add_fixture('test-run-provisioning-server', 'openstack/api_server_2_active.json')
+        appserver = make_test_appserver()
+        expected_commits = {
+            (playbook.source_repo, playbook.version): 'a' * 40 for playbook in appserver.get_playbooks()
+        }
+
+        def run_ansible_playbooks(commits=None):
+            """
+            Record the commit of each playbook
+            """
+            commits.update(expected_commits)
+            return PlaybookLogCollector(), 0
+
+        mocks.mock_run_ansible_playbooks.side_effect = run_ansible_playbooks
+        self.assertTrue(appserver.provision())
+        self.assertEqual(
+            OpenEdXAppServer.objects.get(pk=appserver.pk).configuration_fingerprint,
+            appserver.create_configuration_fingerprint(expected_commits),
+        )
+
     def test_lms_user_settings(self):
         """
         Test that lms_user_settings are initialised correctly for new AppServers.
@@ -759,6 +849,38 @@ class EmailMixinInstanceTestCase(TestCase):
         self.assertEqual(len(mail.attachments), 1)
         self.assertEqual(mail.attachments[0], ("provision.log", "\n".join(log_lines), "text/plain"))
 
+    @override_settings(ADMINS=(("admin1", "admin1@localhost"),))
+    def test_provision_failed_email_log_collector(self):
+        """
+        Tests that the last lines of a collected log are attached along with the compressed full log
+        """
+        appserver = make_test_appserver()
+        log_lines = ["log line{}".format(i) for i in range(5)]
+        with PlaybookLogCollector(max_lines=2) as log:
+            log.extend(log_lines)
+            appserver.provision_failed_email("something went wrong", log)
+
+        mail = django_mail.outbox[0]
+        self.assertEqual(len(mail.attachments), 2)
+        self.assertEqual(mail.attachments[0], ("provision.log", "log line3\nlog line4", "text/plain"))
+        name, content, mime_type = mail.attachments[1]
+        self.assertEqual(name, "provision-full.log.gz")
+        self.assertEqual(gzip.decompress(content).decode().splitlines(), log_lines)
+        self.assertEqual(mime_type, "application/gzip")
+
+    @override_settings(ADMINS=(("admin1", "admin1@localhost"),), ANSIBLE_LOG_ATTACHMENT_MAX_SIZE=10)
+    def test_provision_failed_email_log_too_large(self):
+        """
+        Tests that only the last lines of a collected log are attached when the full log is too large
+        """
+        appserver = make_test_appserver()
+        with PlaybookLogCollector(max_lines=2) as log:
+            log.extend(["log line{}".format(i) for i in range(5)])
+            appserver.provision_failed_email("something went wrong", log)
+
+        mail = django_mail.outbox[0]
+        self.assertEqual(mail.attachments, [("provision.log", "log line3\nlog line4", "text/plain")])
+
     @override_settings(ADMINS=(
         ("admin1", "admin1@localhost"),
         ("admin2", "admin2@localhost"),
@@ -23,7 +23,7 @@ OpenEdXInstance model - Tests
 # Imports #####################################################################
 import re
 from datetime import timedelta
-from unittest.mock import patch, Mock, PropertyMock
+from unittest.mock import patch, Mock
 
 import ddt
 from django.conf import settings
@@ -37,8 +37,9 @@ from freezegun import freeze_time
 import yaml
 
 from instance import gandi
+from instance.ansible import PlaybookLogCollector
 from instance.models.appserver import Status as AppServerStatus
-from instance.models.instance import InstanceReference
+from instance.models.instance import InstanceReference, InstanceTag
 from instance.models.load_balancer import LoadBalancingServer
 from instance.models.openedx_appserver import OpenEdXAppServer
 from instance.models.openedx_instance import OpenEdXInstance, OpenEdXAppConfiguration
@@ -52,7 +53,7 @@ from instance.tests.utils import patch_services, skip_unless_consul_running
 
 # Tests #######################################################################
 
-@ddt.ddt  # pylint: disable=too-many-lines
+@ddt.ddt  # pylint: disable=too-many-lines,too-many-public-methods
 class OpenEdXInstanceTestCase(TestCase):
     """
     Test cases for OpenEdXInstance models
@@ -244,6 +245,56 @@ class OpenEdXInstanceTestCase(TestCase):
         self.assertEqual(configuration_vars['EDXAPP_PLATFORM_NAME'], instance.name)
         self.assertEqual(configuration_vars['EDXAPP_CONTACT_EMAIL'], instance.email)
 
+    @patch_services
+    @patch('instance.models.openedx_instance.get_commit_sha', return_value='a' * 40)
+    def test_skip_unchanged_appserver(self, mocks, mock_get_commit_sha):
+        """
+        The spawn is skipped when the running active appserver has the fingerprint of a new one
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.skip')
+        active_appserver = make_test_appserver(instance, status=AppServerStatus.Running)
+        commits = {(playbook.source_repo, playbook.version): 'a' * 40 for playbook in active_appserver.get_playbooks()}
+        OpenEdXAppServer.objects.filter(pk=active_appserver.pk).update(
+            _is_active=True,
+            configuration_fingerprint=active_appserver.create_configuration_fingerprint(commits),
+        )
+        success_tag = InstanceTag.objects.create(name='test-success')
+        failure_tag = InstanceTag.objects.create(name='test-failure')
+        instance.tags.add(failure_tag)
+
+        self.assertEqual(
+            instance.skip_unchanged_appserver(success_tag=success_tag, failure_tag=failure_tag),
+            active_appserver.pk,
+        )
+        self.assertEqual(list(instance.tags.all()), [success_tag])
+        # Nothing was created or provisioned
+        self.assertEqual(instance.appserver_set.count(), 1)
+        self.assertEqual(mocks.mock_provision_mysql.call_count, 0)
+        self.assertEqual(mocks.mock_create_server.call_count, 0)
+
+        # The playbooks would run from a new commit
+        mock_get_commit_sha.return_value = 'b' * 40
+        self.assertIsNone(instance.skip_unchanged_appserver())
+
+    @patch_services
+    @patch('instance.models.openedx_instance.get_commit_sha', return_value='a' * 40)
+    def test_skip_unchanged_appserver_lms_users(self, mocks, mock_get_commit_sha):
+        """
+        The LMS users of the instance are part of the fingerprint of a new appserver
+        """
+        instance = OpenEdXInstanceFactory(sub_domain='test.skip')
+        instance.lms_users.add(get_user_model().objects.create_user(username='test', email='test@example.com'))
+        active_appserver = make_test_appserver(instance, status=AppServerStatus.Running)
+        commits = {(playbook.source_repo, playbook.version): 'a' * 40 for playbook in active_appserver.get_playbooks()}
+        OpenEdXAppServer.objects.filter(pk=active_appserver.pk).update(
+            _is_active=True,
+            configuration_fingerprint=active_appserver.create_configuration_fingerprint(commits),
+        )
+        self.assertEqual(instance.skip_unchanged_appserver(), active_appserver.pk)
+
+        instance.lms_users.clear()
+        self.assertIsNone(instance.skip_unchanged_appserver())
+
     @override_settings(NEWRELIC_LICENSE_KEY='newrelic-key')
     @patch_services
     @patch('instance.models.openedx_appserver.OpenEdXAppServer.provision', return_value=True)
@@ -367,7 +418,7 @@ class OpenEdXInstanceTestCase(TestCase):
         """
         Test what happens when unable to completely spawn an AppServer.
         """
-        mocks.mock_run_ansible_playbooks.return_value = (['log: provisioning failed'], 1)
+        mocks.mock_run_ansible_playbooks.return_value = (PlaybookLogCollector(), 1)
         mocks.mock_create_server.side_effect = [Mock(id='test-run-provisioning-server'), None]
         mocks.os_server_manager.add_fixture('test-run-provisioning-server', 'openstack/api_server_2_active.json')
 
@@ -449,23 +500,21 @@ class OpenEdXInstanceTestCase(TestCase):
         appserver_id = instance.spawn_appserver()
         appserver = instance.appserver_set.get(pk=appserver_id)
         appserver.make_active()
-        with patch('instance.models.server.OpenStackServer.public_ip', new_callable=PropertyMock) as mock_public_ip:
-            mock_public_ip.side_effect = [None, "1.1.1.1", "1.1.1.1", "1.1.1.1"]
+        OpenStackServer.objects.filter(pk=appserver.server.pk).update(_public_ip="1.1.1.1")
+        with patch('instance.openstack_utils.get_server_public_address') as mock_get_server_public_address:
             backend_map, config = instance.get_load_balancer_configuration()
-        self._check_load_balancer_configuration(
-            backend_map, config, domain_names, appserver.server.public_ip,
-        )
+        self._check_load_balancer_configuration(backend_map, config, domain_names, "1.1.1.1")
+        self.assertEqual(mock_get_server_public_address.call_count, 0)
 
         # Test configuration in case an active appserver doesn't have a public IP address anymore.
         # This might happen if the OpenStack server dies or gets modified from the outside, but it
         # is not expected to happen under normal circumstances.  In case the public IP address is not there,
-        # We log an Error, and call update_status(). In case the IP address is still not there, we stop further
-        # activity and raise an Exception.
-        with patch('instance.openstack_utils.get_server_public_address', return_value=None), \
+        # we log an error, and stop further activity by raising an exception, without calling the OpenStack API.
+        OpenStackServer.objects.filter(pk=appserver.server.pk).update(_public_ip=None)
+        with patch('instance.openstack_utils.get_server_public_address') as mock_get_server_public_address, \
                 self.assertLogs("instance.models.instance", "ERROR"):
-            appserver.server._public_ip = None
-            appserver.server.save()
             self.assertRaises(WrongStateException, instance.get_load_balancer_configuration)
+        self.assertEqual(mock_get_server_public_address.call_count, 0)
 
     def test_get_load_balancer_config_ext_domains(self):
         """
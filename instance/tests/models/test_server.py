@@ -24,17 +24,18 @@ OpenStackServer model - Tests
 
 import http.client
 import io
-from unittest.mock import Mock, call, patch
+from unittest.mock import ANY, Mock, call, patch
 
 from ddt import ddt, data, unpack
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.test import override_settings
 import novaclient
 import requests
 
 from instance.models.server import OpenStackServer, Status as ServerStatus
 from instance.models.utils import SteadyStateException, WrongStateException
-from instance.tests.base import AnyStringMatching, TestCase
+from instance.tests.base import AnyStringMatching, TestCase, add_fixture_to_object
 from instance.tests.models.factories.server import (
     OpenStackServerFactory,
     BootingOpenStackServerFactory,
@@ -58,7 +59,7 @@ class MockHTTPResponse(http.client.HTTPResponse):
 
 
 @ddt
-class OpenStackServerTestCase(TestCase):
+class OpenStackServerTestCase(TestCase): # pylint: disable=too-many-public-methods
     """
     Test cases for OpenStackServer models
     """
@@ -260,6 +261,41 @@ class OpenStackServerTestCase(TestCase):
             self.assertEqual(mock_sleep.call_count, 1)
             self.assertIn("Waited 0.01", timeout_error.exception)
 
+    @patch('instance.models.server.OpenStackServer.update_status')
+    @patch('instance.models.server.time.sleep')
+    def test_sleep_until_backoff(self, mock_sleep, mock_update_status):
+        """
+        The delay between two status checks grows while the status doesn't change
+        """
+        server = BuildingOpenStackServerFactory()
+
+        with self.assertRaises(TimeoutError):
+            server.sleep_until(lambda: server.status.accepts_ssh_commands, timeout=60)
+        delays = [delay for (delay,), dummy in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 9)
+        self.assertTrue(1 <= delays[0] <= 1.25)
+        self.assertTrue(1.5 <= delays[1] <= 1.875)
+        self.assertTrue(all(delay <= 15 * 1.25 for delay in delays))
+        self.assertAlmostEqual(sum(delays), 60)
+
+    @override_settings(OPENSTACK_SERVER_WATCHER=True)
+    @patch('instance.models.server.is_port_open', return_value=False)
+    @patch('instance.models.server.server_watcher')
+    def test_sleep_until_server_watcher(self, mock_server_watcher, mock_is_port_open):
+        """
+        While sleeping, the status of the VM is received from the server watcher
+        """
+        server = BuildingOpenStackServerFactory(os_server_fixture='openstack/api_server_1_building.json')
+        server._public_ip = '192.168.100.200'
+        os_server = add_fixture_to_object(Mock(), 'openstack/api_server_2_active.json')
+        mock_server_watcher.wait.return_value = os_server
+
+        server.sleep_until(lambda: server.status.vm_available, timeout=5)
+        self.assertEqual(server.status, ServerStatus.Booting)
+        mock_server_watcher.wait.assert_called_once_with('test-region', server.openstack_id, 'BUILD', ANY)
+        # The VM was only queried once, before waiting
+        self.assertEqual(server.nova.servers.get.call_count, 1)
+
     def test_sleep_until_invalid_timeout(self):
         """
         Check if sleep_until behaves correctly when passed an invalid timeout value.
@@ -417,6 +453,24 @@ class OpenStackServerTestCase(TestCase):
             AnyStringMatching('Unable to reach the OpenStack API due to'), exception
         )
 
+    def test_update_fields_validation(self):
+        """
+        Saves restricted to some fields only validate those fields
+        """
+        server = OpenStackServerFactory()
+        server.name_prefix = 'Not a slug!'
+        server._status = 'booting'
+        with self.assertNumQueries(1):
+            server.save(update_fields=['_status'])
+        with self.assertRaises(ValidationError) as context:
+            server.save()
+        self.assertEqual(list(context.exception.message_dict), ['name_prefix'])
+
+        server._status = 'bogus'
+        with self.assertRaises(ValidationError) as context:
+            server.save(update_fields=['_status'])
+        self.assertEqual(list(context.exception.message_dict), ['_status'])
+
     def test_public_ip_new_server(self):
         """
         A new server doesn't have a public IP
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+PlaybookTaskTiming model - Tests
+"""
+
+# Imports #####################################################################
+
+from datetime import timedelta
+
+import freezegun
+from django.utils import timezone
+
+from instance.models.task_timing import PlaybookTaskTiming, PlaybookTaskTimingRecorder
+from instance.tests.base import TestCase
+from instance.tests.models.factories.openedx_appserver import make_test_appserver
+
+
+# Tests #######################################################################
+
+class PlaybookTaskTimingTestCase(TestCase):
+    """
+    Test cases for PlaybookTaskTiming models
+    """
+    def record_run(self, appserver, durations):
+        """
+        Record a playbook run with the given task durations, and return its recorder
+        """
+        with PlaybookTaskTimingRecorder(appserver, 'playbooks/edx_sandbox.yml') as recorder:
+            for task, duration in durations:
+                recorder.record({'task': task, 'host': '1.2.3.4', 'status': 'ok', 'duration': duration})
+        return recorder
+
+    def test_recorder(self):
+        """
+        The task timings of a playbook run are saved at the end of the run, with the same run ID
+        """
+        appserver = make_test_appserver()
+        recorder = self.record_run(appserver, [('Install packages', 10.5), ('Restart services', 2.0)])
+        timings = PlaybookTaskTiming.objects.filter(run_id=recorder.run_id).order_by('id')
+        self.assertEqual([(timing.task, timing.duration) for timing in timings], [
+            ('Install packages', 10.5),
+            ('Restart services', 2.0),
+        ])
+        for timing in timings:
+            self.assertEqual(timing.content_object, appserver)
+            self.assertEqual(timing.playbook, 'playbooks/edx_sandbox.yml')
+            self.assertEqual(timing.host, '1.2.3.4')
+            self.assertEqual(timing.status, 'ok')
+
+    def test_slowest_tasks(self):
+        """
+        The slowest tasks across all the playbook runs can be listed
+        """
+        appserver = make_test_appserver()
+        self.record_run(appserver, [('Install packages', 10.0), ('Restart services', 2.0)])
+        self.record_run(appserver, [('Install packages', 20.0), ('Restart services', 4.0)])
+        self.assertEqual(list(PlaybookTaskTiming.objects.slowest_tasks()), [
+            {
+                'playbook': 'playbooks/edx_sandbox.yml',
+                'task': 'Install packages',
+                'runs': 2,
+                'average_duration': 15.0,
+                'max_duration': 20.0,
+            },
+            {
+                'playbook': 'playbooks/edx_sandbox.yml',
+                'task': 'Restart services',
+                'runs': 2,
+                'average_duration': 3.0,
+                'max_duration': 4.0,
+            },
+        ])
+
+    def test_delete_before(self):
+        """
+        Task timings recorded before a cutoff date can be deleted
+        """
+        appserver = make_test_appserver()
+        now = timezone.now()
+        with freezegun.freeze_time(now - timedelta(days=2)):
+            self.record_run(appserver, [('Install packages', 10.0)])
+        recorder = self.record_run(appserver, [('Restart services', 2.0)])
+        PlaybookTaskTiming.delete_before(now - timedelta(days=1))
+        self.assertEqual(list(PlaybookTaskTiming.objects.values_list('run_id', flat=True)), [recorder.run_id])
+
+    def test_delete_object(self):
+        """
+        The task timings of an object are deleted along with it
+        """
+        appserver = make_test_appserver()
+        other_appserver = make_test_appserver(appserver.instance)
+        self.record_run(appserver, [('Install packages', 10.0)])
+        recorder = self.record_run(other_appserver, [('Install packages', 12.0)])
+        appserver.delete()
+        self.assertEqual(list(PlaybookTaskTiming.objects.values_list('run_id', flat=True)), [recorder.run_id])
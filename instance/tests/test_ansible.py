@@ -22,12 +22,19 @@ Ansible - Tests
 
 # Imports #####################################################################
 
-import os.path
+import fcntl
+import gzip
+import os
+import signal
+import subprocess
 from unittest import mock
 from unittest.mock import patch
 
 import yaml
 
+from django.test import override_settings
+from django.utils.safestring import SafeText
+
 from instance import ansible
 from instance.tests.base import TestCase
 
@@ -92,35 +99,63 @@ class YAMLTestCase(TestCase):
         """
         self.assertEqual(ansible.yaml_merge(self.yaml_str1, None), self.yaml_str1)
 
+    def test_dict_diff(self):
+        """
+        The keys of changed, added and removed values are listed, with nested keys joined with dots
+        """
+        self.assertEqual(ansible.dict_diff(self.yaml_dict1, self.yaml_dict1), [])
+        self.assertEqual(ansible.dict_diff(self.yaml_dict1, self.yaml_dict2), [
+            'test_dict.bar', 'test_dict.foo', 'test_dict.other', 'test_dict.recursive.a', 'test_dict.recursive.b',
+            'testa', 'testb', 'testc',
+        ])
+        self.assertEqual(
+            ansible.dict_diff({'a': 1, 'b': {'c': 1, 'd': 1}, 'e': 1}, {'a': 1, 'b': {'c': 2, 'd': 1}, 'f': 1}),
+            ['b.c', 'e', 'f'],
+        )
+        self.assertEqual(ansible.dict_diff({'a': {'b': 1}}, {'a': [1]}), ['a'])
+
+    def test_dump_yaml(self):
+        """
+        Dumping YAML gives the same output as the default dumper, and handles subclasses of the basic types
+        """
+        self.assertEqual(ansible.dump_yaml(self.yaml_dict1), yaml.dump(self.yaml_dict1, default_flow_style=False))
+        self.assertEqual(
+            ansible.dump_yaml({'text': SafeText('safe'), 'tuple': (1, 2)}),
+            'text: safe\ntuple:\n- 1\n- 2\n',
+        )
+
+    def test_parse_yaml(self):
+        """
+        Parsing YAML gives an empty dict for empty strings
+        """
+        self.assertEqual(ansible.parse_yaml(self.yaml_str1), self.yaml_dict1)
+        self.assertEqual(ansible.parse_yaml(''), {})
+        self.assertEqual(ansible.parse_yaml('# Only a comment'), {})
+
 
 class AnsibleTestCase(TestCase):
     """
     Test cases for ansible helper functions & wrappers
     """
-    def test_run_playbook(self):
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    def test_prepare_playbook(self):
         """
-        Run the ansible-playbook command
+        Prepare the ansible-playbook command
         """
-
-        popen_result = object()
-
         with patch('instance.ansible.render_sandbox_creation_command', return_value="ANSIBLE CMD") as mock_render, \
                 patch('instance.ansible.create_temp_dir') as mock_create_temp, \
-                patch('instance.ansible.string_to_file_path', return_value='/tmp/string/file'), \
-                patch('subprocess.Popen', return_value=popen_result) as mock_popen:
+                patch('instance.ansible.string_to_file_path', return_value='/tmp/string/file'):
 
             mock_create_temp.return_value.__enter__.return_value = '/tmp/tempdir'
 
-            with ansible.run_playbook(
+            with ansible.prepare_playbook(
                 requirements_path="/tmp/requirements.txt",
                 inventory_str="INVENTORY: 'str'",
                 vars_str="VARS: 'str2'",
                 playbook_path='/play/book',
                 playbook_name='playbook_name'
-            ) as run_playbook_result:
-
-                # This checks if run_playbook returns a Process object (or more precisely: object returned from Popen)
-                self.assertEqual(run_playbook_result, popen_result)
+            ) as (cmd, subprocess_kwargs):
+                self.assertEqual(cmd, "ANSIBLE CMD")
 
             mock_render.assert_called_once_with(
                 inventory_path='/tmp/string/file',
@@ -128,15 +163,158 @@ class AnsibleTestCase(TestCase):
                 requirements_path='/tmp/requirements.txt',
                 playbook_name='playbook_name',
                 remote_username='root',
-                venv_path='/tmp/tempdir/venv'
+                venv_path='/tmp/tempdir/venv',
+                venv_lock_fd=None,
             )
 
-            mock_popen.assert_called_once_with(
-                "ANSIBLE CMD", bufsize=1, stdout=-1, stderr=-1, cwd='/play/book', shell=True, env=mock.ANY
+            self.assertEqual(subprocess_kwargs['cwd'], '/play/book')
+            self.assertEqual(subprocess_kwargs['pass_fds'], [])
+            self.assertEqual(subprocess_kwargs['env']['TMPDIR'], '/tmp/tempdir')
+            self.assertEqual(subprocess_kwargs['env']['ANSIBLE_SSH_CONTROL_PATH_DIR'], '/tmp/tempdir/cp')
+
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    @patch('instance.ansible.render_sandbox_creation_command')
+    def test_run_playbook(self, mock_render):
+        """
+        The playbook runs as a subprocess, which is killed if it's still running on exit
+        """
+        playbook_kwargs = {
+            'requirements_path': '/tmp/requirements.txt',
+            'inventory_str': "INVENTORY: 'str'",
+            'vars_str': "VARS: 'str2'",
+            'playbook_path': '/tmp',
+            'playbook_name': 'playbook_name',
+        }
+        mock_render.return_value = 'echo Done; exit 2'
+        with ansible.run_playbook(**playbook_kwargs) as process:
+            self.assertEqual(process.stdout.readline(), b'Done\n')
+            process.wait()
+        self.assertEqual(process.returncode, 2)
+
+        mock_render.return_value = 'echo Started; sleep 60'
+        with ansible.run_playbook(**playbook_kwargs) as process:
+            self.assertEqual(process.stdout.readline(), b'Started\n')
+        self.assertEqual(process.returncode, -signal.SIGKILL)
+
+    @override_settings(ANSIBLE_LOG_COLLECT_LINES=2)
+    @patch('instance.ansible.run_playbook')
+    def test_capture_playbook_output(self, mock_run_playbook):
+        """
+        Only the last lines of the playbook output are collected, but all lines are logged
+        """
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        with open(stdout_r, 'rb', buffering=0) as stdout, open(stderr_r, 'rb', buffering=0) as stderr:
+            process = mock_run_playbook.return_value.__enter__.return_value
+            process.stdout = stdout
+            process.stderr = stderr
+            process.returncode = 0
+            os.write(stdout_w, b'Line #1\nLine #2\nLine #3\n')
+            os.close(stdout_w)
+            os.close(stderr_w)
+            mock_logger = mock.Mock()
+
+            log, returncode = ansible.capture_playbook_output(
+                requirements_path='/tmp/requirements.txt',
+                inventory_str='INVENTORY',
+                vars_str='VARS',
+                playbook_path='/play/book/playbook_name.yml',
+                logger_=mock_logger,
+                collect_logs=True,
+            )
+
+        self.assertEqual(log, ['Line #2', 'Line #3'])
+        self.assertEqual(returncode, 0)
+        self.assertEqual(
+            mock_logger.info.mock_calls,
+            [mock.call('Line #1'), mock.call('Line #2'), mock.call('Line #3')],
+        )
+
+    @patch('instance.ansible.run_playbook')
+    def test_capture_playbook_output_task_events(self, mock_run_playbook):
+        """
+        The task events written by the callback plugin are passed to the task event handler
+        """
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        os.close(stdout_w)
+        os.close(stderr_w)
+
+        def run_playbook(task_events_fd, **kwargs):
+            """
+            Write the task events like the callback plugin would
+            """
+            os.write(task_events_fd, b'{"task": "Install packages", "host": "1.2.3.4", "status": "ok", '
+                                     b'"duration": 1.5}\nInvalid event\n')
+            return mock.DEFAULT
+
+        mock_run_playbook.side_effect = run_playbook
+        with open(stdout_r, 'rb', buffering=0) as stdout, open(stderr_r, 'rb', buffering=0) as stderr:
+            process = mock_run_playbook.return_value.__enter__.return_value
+            process.stdout = stdout
+            process.stderr = stderr
+            process.returncode = 0
+            task_events = []
+
+            returncode = ansible.capture_playbook_output(
+                requirements_path='/tmp/requirements.txt',
+                inventory_str='INVENTORY',
+                vars_str='VARS',
+                playbook_path='/play/book/playbook_name.yml',
+                task_event_handler=task_events.append,
             )
-            call_kwargs = mock_popen.mock_calls[0][2]
-            self.assertIn('env', call_kwargs)
-            self.assertEqual(call_kwargs['env']['TMPDIR'], '/tmp/tempdir')
+
+        self.assertEqual(returncode, 0)
+        self.assertEqual(task_events, [
+            {'task': 'Install packages', 'host': '1.2.3.4', 'status': 'ok', 'duration': 1.5},
+        ])
+
+    def test_log_collector(self):
+        """
+        Only the last lines are kept in memory, but all of them are compressed in a temporary file
+        """
+        with ansible.PlaybookLogCollector(max_lines=2) as log:
+            log.append('Line #1')
+            self.assertFalse(log.truncated)
+            log.extend(['Line #2', 'Line #3'])
+            self.assertTrue(log.truncated)
+            self.assertEqual(list(log), ['Line #2', 'Line #3'])
+            self.assertEqual(log.line_count, 3)
+            compressed_log = log.get_compressed_log()
+            self.assertEqual(log.get_compressed_size(), len(compressed_log))
+        self.assertEqual(gzip.decompress(compressed_log), b'Line #1\nLine #2\nLine #3\n')
+
+    @override_settings(ANSIBLE_LOG_COLLECT_LINES=10)
+    @patch('instance.ansible.run_playbook')
+    def test_capture_playbook_output_log_collector(self, mock_run_playbook):
+        """
+        The output of the playbook is collected in the given log collector
+        """
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        with open(stdout_r, 'rb', buffering=0) as stdout, open(stderr_r, 'rb', buffering=0) as stderr, \
+                ansible.PlaybookLogCollector() as log_collector:
+            process = mock_run_playbook.return_value.__enter__.return_value
+            process.stdout = stdout
+            process.stderr = stderr
+            process.returncode = 0
+            log_collector.append('Previous playbook')
+            os.write(stdout_w, b'Line #1\n')
+            os.close(stdout_w)
+            os.close(stderr_w)
+
+            log, returncode = ansible.capture_playbook_output(
+                requirements_path='/tmp/requirements.txt',
+                inventory_str='INVENTORY',
+                vars_str='VARS',
+                playbook_path='/play/book/playbook_name.yml',
+                collect_logs=True,
+                log_collector=log_collector,
+            )
+            self.assertEqual(list(log_collector), ['Previous playbook', 'Line #1'])
+
+        self.assertIs(log, log_collector)
+        self.assertEqual(returncode, 0)
 
     def test_render_command(self):
         """
@@ -160,6 +338,174 @@ class AnsibleTestCase(TestCase):
 
         self.assertEqual(expected, run_playbook_command)
 
+    def test_render_command_cached_venv(self):
+        """
+        Render the command running a playbook in a cached virtualenv
+        """
+        run_playbook_command = ansible.render_sandbox_creation_command(
+            requirements_path='/requirements/path.txt',
+            inventory_path="/tmp/inventory/path",
+            vars_path="/tmp/vars/path",
+            playbook_name='playbook_name',
+            remote_username="root",
+            venv_path='/cache/venv',
+            venv_lock_fd=7,
+        )
+        expected = (
+            "flock -s 7 && test /cache/venv.lock -ef /proc/self/fd/7 || "
+            "{ echo 'Unable to lock or build the virtualenv /cache/venv' >&2; exit 1; }; "
+            "while ! test -e /cache/venv/.complete; do "
+            "flock 7 && test /cache/venv.lock -ef /proc/self/fd/7 && "
+            "{ test -e /cache/venv/.complete || { rm -rf /cache/venv && "
+            "virtualenv -p /usr/bin/python /cache/venv && "
+            "/cache/venv/bin/python -u /cache/venv/bin/pip install -r /requirements/path.txt && "
+            "touch /cache/venv/.complete; }; } && "
+            "flock -s 7 && test /cache/venv.lock -ef /proc/self/fd/7 || "
+            "{ echo 'Unable to lock or build the virtualenv /cache/venv' >&2; exit 1; }; "
+            "done && "
+            "/cache/venv/bin/python -u /cache/venv/bin/ansible-playbook "
+            "-i /tmp/inventory/path -e @/tmp/vars/path -u root playbook_name"
+        )
+        self.assertEqual(expected, run_playbook_command)
+
+    @patch('instance.ansible.render_venv_creation_commands')
+    def test_cached_venv_build_command(self, mock_render_commands):
+        """
+        The cached virtualenv is built once, and the lock is held in shared mode once it's complete
+        """
+        with ansible.create_temp_dir() as cache_dir:
+            venv_path = os.path.join(cache_dir, 'venv')
+            venv_lock_path = ansible.get_venv_lock_path(venv_path)
+            mock_render_commands.return_value = ['mkdir {}'.format(venv_path), 'echo built']
+            with open(venv_lock_path, 'a') as lock_file:
+                cmd = ansible.render_cached_venv_build_command('/requirements.txt', venv_path, lock_file.fileno())
+                # The following commands hold a shared lock
+                cmd += ' && flock -n -s {0} true && ! flock -n {0} true && echo locked'.format(venv_lock_path)
+                for expected_output in (b'built\nlocked\n', b'locked\n'):
+                    process = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, pass_fds=(lock_file.fileno(),))
+                    self.assertEqual(process.returncode, 0)
+                    self.assertEqual(process.stdout, expected_output)
+
+                # The lock file was deleted along with the virtualenv
+                os.remove(venv_lock_path)
+                process = subprocess.run(cmd, shell=True, stderr=subprocess.PIPE, pass_fds=(lock_file.fileno(),))
+                self.assertEqual(process.returncode, 1)
+                self.assertIn(b'Unable to lock or build the virtualenv', process.stderr)
+
+    def test_prepare_playbook_cached_venv(self):
+        """
+        The virtualenv of a playbook run is cached, based on the requirements file
+        """
+        with ansible.create_temp_dir() as cache_dir, \
+                override_settings(ANSIBLE_VENV_CACHE_DIR=cache_dir), \
+                patch('instance.ansible.render_sandbox_creation_command', return_value="ANSIBLE CMD") as mock_render:
+            requirements_path = ansible.string_to_file_path('ansible==2.3.1.0\n', root_dir=cache_dir)
+            with ansible.prepare_playbook(
+                requirements_path=requirements_path,
+                inventory_str="INVENTORY: 'str'",
+                vars_str="VARS: 'str2'",
+                playbook_path='/play/book',
+                playbook_name='playbook_name'
+            ) as (dummy, subprocess_kwargs):
+                pass
+
+        venv_path = mock_render.call_args[1]['venv_path']
+        self.assertEqual(venv_path, ansible.get_venv_cache_path(requirements_path))
+        self.assertEqual(os.path.dirname(venv_path), cache_dir)
+        self.assertIsInstance(mock_render.call_args[1]['venv_lock_fd'], int)
+        self.assertEqual(subprocess_kwargs['pass_fds'], [mock_render.call_args[1]['venv_lock_fd']])
+
+    def test_get_venv_cache_path(self):
+        """
+        The cached virtualenv depends on the content of the requirements file and on the Python interpreter
+        """
+        with ansible.create_temp_dir() as temp_dir:
+            requirements_path = ansible.string_to_file_path('ansible==2.3.1.0\n', root_dir=temp_dir)
+            same_requirements_path = ansible.string_to_file_path('ansible==2.3.1.0\n', root_dir=temp_dir)
+            other_requirements_path = ansible.string_to_file_path('ansible==2.5.0\n', root_dir=temp_dir)
+            venv_path = ansible.get_venv_cache_path(requirements_path)
+            self.assertEqual(ansible.get_venv_cache_path(same_requirements_path), venv_path)
+            self.assertNotEqual(ansible.get_venv_cache_path(other_requirements_path), venv_path)
+            with override_settings(ANSIBLE_PYTHON_PATH='/usr/bin/python2.7'):
+                self.assertNotEqual(ansible.get_venv_cache_path(requirements_path), venv_path)
+
+    @override_settings(
+        ANSIBLE_PIPELINING=True,
+        ANSIBLE_SSH_ARGS='-o ControlMaster=auto -o ControlPersist=60s',
+        ANSIBLE_FORKS=5,
+        ANSIBLE_FACT_CACHE_DIR='',
+        ANSIBLE_CONFIG_OVERRIDES={'edx_sandbox.yml': {'ANSIBLE_FORKS': 10, 'ANSIBLE_PIPELINING': 'false'}},
+    )
+    def test_get_ansible_config_environment(self):
+        """
+        Ansible is configured through environment variables, which can be overridden for specific playbooks
+        """
+        self.assertEqual(ansible.get_ansible_config_environment('appserver.yml', '/tmp/tempdir'), {
+            'ANSIBLE_HOST_KEY_CHECKING': 'false',
+            'ANSIBLE_PIPELINING': 'true',
+            'ANSIBLE_SSH_ARGS': '-o ControlMaster=auto -o ControlPersist=60s',
+            'ANSIBLE_SSH_CONTROL_PATH_DIR': '/tmp/tempdir/cp',
+            'ANSIBLE_FORKS': '5',
+        })
+        env = ansible.get_ansible_config_environment('edx_sandbox.yml', '/tmp/tempdir')
+        self.assertEqual(env['ANSIBLE_FORKS'], '10')
+        self.assertEqual(env['ANSIBLE_PIPELINING'], 'false')
+
+    @override_settings(ANSIBLE_FACT_CACHE_DIR='/tmp/facts', ANSIBLE_FACT_CACHE_TIMEOUT=600)
+    def test_get_ansible_config_environment_fact_cache(self):
+        """
+        The facts gathered by Ansible can be cached in a local directory
+        """
+        env = ansible.get_ansible_config_environment('appserver.yml', '/tmp/tempdir')
+        self.assertEqual(env['ANSIBLE_GATHERING'], 'smart')
+        self.assertEqual(env['ANSIBLE_CACHE_PLUGIN'], 'jsonfile')
+        self.assertEqual(env['ANSIBLE_CACHE_PLUGIN_CONNECTION'], '/tmp/facts')
+        self.assertEqual(env['ANSIBLE_CACHE_PLUGIN_TIMEOUT'], '600')
+
+    def test_prepare_virtualenv(self):
+        """
+        The cached virtualenv of a requirements file can be built ahead of time
+        """
+        with ansible.create_temp_dir() as cache_dir, \
+                override_settings(ANSIBLE_VENV_CACHE_DIR=cache_dir), \
+                patch('subprocess.run') as mock_run:
+            requirements_path = ansible.string_to_file_path('ansible==2.3.1.0\n', root_dir=cache_dir)
+            venv_path = ansible.get_venv_cache_path(requirements_path)
+            mock_run.return_value.returncode = 0
+            self.assertTrue(ansible.prepare_virtualenv(requirements_path))
+            mock_run.return_value.returncode = 1
+            mock_run.return_value.stdout = b'Could not find a version'
+            self.assertFalse(ansible.prepare_virtualenv(requirements_path))
+
+        venv_lock_fd, = mock_run.call_args[1]['pass_fds']
+        self.assertEqual(
+            mock_run.call_args[0][0],
+            ansible.render_cached_venv_build_command(requirements_path, venv_path, venv_lock_fd),
+        )
+
+    @override_settings(ANSIBLE_VENV_CACHE_DIR='')
+    @patch('subprocess.run')
+    def test_prepare_virtualenv_no_cache(self, mock_run):
+        """
+        Virtualenvs can't be built ahead of time when they aren't cached
+        """
+        self.assertFalse(ansible.prepare_virtualenv('/tmp/requirements.txt'))
+        self.assertFalse(mock_run.called)
+
+    @override_settings(ANSIBLE_VENV_CACHE_SIZE=1)
+    def test_prune_venv_cache(self):
+        """
+        The least recently used virtualenvs are deleted, unless they're in use
+        """
+        with ansible.create_temp_dir() as cache_dir, override_settings(ANSIBLE_VENV_CACHE_DIR=cache_dir):
+            for mtime, name in enumerate(['oldest', 'in-use', 'newest']):
+                os.mkdir(os.path.join(cache_dir, name))
+                os.utime(os.path.join(cache_dir, name), (mtime, mtime))
+            with open(os.path.join(cache_dir, 'in-use.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                ansible.prune_venv_cache()
+            self.assertCountEqual(os.listdir(cache_dir), ['in-use', 'in-use.lock', 'newest'])
+
     def test_create_temp_dir_ok(self):
         """
         Check if create_temp_dir behaves correctly when no exception is
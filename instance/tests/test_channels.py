@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Websocket channels - Tests
+"""
+
+# Imports #####################################################################
+
+from unittest.mock import call, patch
+
+from django.test import override_settings
+from freezegun import freeze_time
+
+from instance.channels import (
+    NotificationCoalescer, get_event_channel, get_subscription_channels, make_subscription_token
+)
+from instance.routers import ObjectEventsRouter
+from instance.tests.base import TestCase
+
+
+# Tests #######################################################################
+
+class ChannelsTestCase(TestCase):
+    """
+    Test cases for the per-object websocket channels
+    """
+    def test_get_event_channel(self):
+        """
+        Events are published on the channel of the most specific object of their context
+        """
+        self.assertEqual(get_event_channel({'instance_id': 3, 'instance_type': 'OpenEdXInstance'}), 'instance.3')
+        self.assertEqual(get_event_channel({'instance_id': 3, 'appserver_id': 5}), 'appserver.5')
+        self.assertEqual(get_event_channel({'server_id': 7}), 'server.7')
+        self.assertIsNone(get_event_channel({'type': 'object_log_line'}))
+
+    def test_subscription_token(self):
+        """
+        Subscription tokens give access to the channels they were issued for
+        """
+        token = make_subscription_token('appserver.5', 'server.7')
+        self.assertEqual(get_subscription_channels(token), ['appserver.5', 'server.7'])
+
+    def test_invalid_subscription_token(self):
+        """
+        Tampered with or missing tokens don't give access to any channel
+        """
+        token = make_subscription_token('instance.3')
+        self.assertEqual(get_subscription_channels(token.replace('instance', 'appserver')), [])
+        self.assertEqual(get_subscription_channels(token + 'x'), [])
+        self.assertEqual(get_subscription_channels(None), [])
+
+    def test_expired_subscription_token(self):
+        """
+        Subscription tokens expire after a day
+        """
+        with freeze_time('2018-08-01 10:00:00'):
+            token = make_subscription_token('instance.3')
+        with freeze_time('2018-08-02 09:59:00'):
+            self.assertEqual(get_subscription_channels(token), ['instance.3'])
+        with freeze_time('2018-08-02 10:01:00'):
+            self.assertEqual(get_subscription_channels(token), [])
+
+    def test_object_events_router(self):
+        """
+        The router subscribes clients to the channels of the token they send
+        """
+        router = ObjectEventsRouter(connection=None)
+        token = make_subscription_token('instance.3')
+        self.assertEqual(router.get_subscription_channels(token=token), ['instance.3'])
+        self.assertEqual(router.get_subscription_channels(), [])
+
+
+@patch('instance.channels.publish_data')
+class NotificationCoalescerTestCase(TestCase):
+    """
+    Test cases for NotificationCoalescer
+    """
+    def setUp(self):
+        super().setUp()
+        self.coalescer = NotificationCoalescer(window=60)
+        self.addCleanup(self.coalescer.flush)
+
+    def test_coalesce(self, mock_publish_data):
+        """
+        Repeated notifications about an object are merged until the end of the window
+        """
+        with freeze_time('2018-08-01 10:00:00') as frozen_time:
+            for dummy in range(3):
+                self.coalescer.submit('server.1', {'type': 'server_update', 'server_pk': 1})
+                self.coalescer.submit('server.2', {'type': 'server_update', 'server_pk': 2})
+            self.assertEqual(mock_publish_data.mock_calls, [
+                call('server.1', {'type': 'server_update', 'server_pk': 1}),
+                call('server.2', {'type': 'server_update', 'server_pk': 2}),
+            ])
+
+            frozen_time.tick(60)
+            mock_publish_data.reset_mock()
+            self.coalescer.flush()
+            self.assertEqual(mock_publish_data.mock_calls, [
+                call('server.1', {'type': 'server_update', 'server_pk': 1}),
+                call('server.2', {'type': 'server_update', 'server_pk': 2}),
+            ])
+
+            # Once the window has passed, the next notification is published right away
+            frozen_time.tick(60)
+            mock_publish_data.reset_mock()
+            self.coalescer.submit('server.1', {'type': 'server_update', 'server_pk': 1})
+            mock_publish_data.assert_called_once_with('server.1', {'type': 'server_update', 'server_pk': 1})
+
+    def test_no_window(self, mock_publish_data):
+        """
+        Every notification is published when the window is 0
+        """
+        coalescer = NotificationCoalescer(window=0)
+        for dummy in range(3):
+            coalescer.submit('notification', {'type': 'instance_update', 'instance_id': 1})
+        self.assertEqual(mock_publish_data.call_count, 3)
+
+    def test_window_setting(self, mock_publish_data):
+        """
+        Without an explicit window, the current NOTIFICATION_COALESCE_WINDOW setting is used
+        """
+        coalescer = NotificationCoalescer()
+        self.addCleanup(coalescer.flush)
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=0):
+            for dummy in range(3):
+                coalescer.submit('notification', {'type': 'instance_update', 'instance_id': 1})
+        self.assertEqual(mock_publish_data.call_count, 3)
+        with override_settings(NOTIFICATION_COALESCE_WINDOW=60):
+            for dummy in range(3):
+                coalescer.submit('notification', {'type': 'instance_update', 'instance_id': 2})
+        self.assertEqual(mock_publish_data.call_count, 4)
+
+    def test_publish_on_commit(self, mock_publish_data):
+        """
+        Notifications aren't published before the transaction is committed
+        """
+        self.coalescer.publish('notification', {'type': 'instance_update', 'instance_id': 1})
+        mock_publish_data.assert_not_called()
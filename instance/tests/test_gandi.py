@@ -25,6 +25,9 @@ Gandi - Tests
 from unittest.mock import call, patch
 import xmlrpc.client
 
+from django.core.cache import cache
+from django.test import override_settings
+
 from instance import gandi
 from instance.tests.base import TestCase
 from instance.tests.fake_gandi_client import FakeGandiClient
@@ -39,12 +42,14 @@ class GandiTestCase(TestCase):
     def setUp(self):
         super().setUp()
         self.api = gandi.GandiAPI(client=FakeGandiClient())
+        self.api.clear_zone_id_cache()
+        self.addCleanup(self.api.clear_zone_id_cache)
 
     def populate_cache(self):
         """
-        Populate the zone ID cache of the Gandi API and reset the mocks.
+        Cache the zone ID of test.com and reset the mocks.
         """
-        self.api._populate_zone_id_cache()
+        self.api.get_zone_id('test.com')
         self.api.client.domain.reset_mock()
 
     def assert_set_dns_record_calls(self, attempts=1):
@@ -68,18 +73,31 @@ class GandiTestCase(TestCase):
             [delete_old_record_call, create_new_record_call, set_new_zone_version_call]
         )
 
-    def test_populate_zone_id_cache(self):
+    def test_zone_id_cache(self):
         """
-        Test that populating the zone ID cache results in the expected API calls.
+        Test that zone IDs are looked up once per domain, and shared with other processes.
         """
-        self.api.get_zone_id('test.com')  # Implicitly calls _populate_zone_id_cache()
-        self.assertEqual(len(self.api.client.domain.mock_calls), 4)
-        self.api.client.domain.assert_has_calls([
-            call.list('TEST_GANDI_API_KEY'),
-            call.info('TEST_GANDI_API_KEY', 'test.com'),
-            call.info('TEST_GANDI_API_KEY', 'example.com'),
-            call.info('TEST_GANDI_API_KEY', 'opencraft.co.uk'),
-        ], any_order=True)
+        self.assertEqual(self.api.get_zone_id('test.com'), 9900)
+        self.assertEqual(self.api.client.domain.mock_calls, [call.info('TEST_GANDI_API_KEY', 'test.com')])
+
+        other_process_api = gandi.GandiAPI(client=FakeGandiClient())
+        self.assertEqual(other_process_api.get_zone_id('test.com'), 9900)
+        self.assertEqual(other_process_api.split_domain_name('sub.domain.test.com'), ('sub.domain', 'test.com'))
+        self.assertEqual(other_process_api.client.domain.mock_calls, [])
+
+        self.api.clear_zone_id_cache()
+        self.assertEqual(other_process_api.get_zone_id('test.com'), 9900)
+        self.assertEqual(len(other_process_api.client.domain.mock_calls), 1)
+
+    @override_settings(GANDI_ZONE_ID_CACHE_TIMEOUT=60)
+    @patch('instance.gandi.cache')
+    def test_zone_id_cache_timeout(self, mock_cache):
+        """
+        Test that the zone ID cache expires.
+        """
+        mock_cache.get.return_value = {'example.com': 1234}
+        self.assertEqual(self.api.get_zone_id('test.com'), 9900)
+        mock_cache.set.assert_called_once_with(gandi.ZONE_ID_CACHE_KEY, {'example.com': 1234, 'test.com': 9900}, 60)
 
     def test_split_domain_name(self):
         """
@@ -88,6 +106,15 @@ class GandiTestCase(TestCase):
         self.assertEqual(self.api.split_domain_name('sub.domain.test.com'), ('sub.domain', 'test.com'))
         self.assertEqual(self.api.split_domain_name('sub.domain.opencraft.co.uk'), ('sub.domain', 'opencraft.co.uk'))
         self.assertEqual(self.api.split_domain_name('example.com'), ('@', 'example.com'))
+        # Only the suffixes of unknown domain names are looked up, starting with the shortest
+        self.assertEqual(self.api.client.domain.mock_calls, [
+            call.info('TEST_GANDI_API_KEY', 'test.com'),
+            call.info('TEST_GANDI_API_KEY', 'co.uk'),
+            call.info('TEST_GANDI_API_KEY', 'opencraft.co.uk'),
+            call.info('TEST_GANDI_API_KEY', 'example.com'),
+        ])
+        self.assertEqual(self.api.split_domain_name('other.sub.domain.test.com'), ('other.sub.domain', 'test.com'))
+        self.assertEqual(len(self.api.client.domain.mock_calls), 4)
         with self.assertRaises(ValueError) as error:
             self.api.split_domain_name('sub.domain.unknown.com')
         self.assertEqual(
@@ -95,10 +122,27 @@ class GandiTestCase(TestCase):
             'The given domain name "sub.domain.unknown.com" does not match any domain registered in the Gandi account.'
         )
 
+    def test_split_domain_name_cached_order(self):
+        """
+        Test that the cached suffixes are tried in the order the suffixes are looked up.
+        """
+        cache.set(gandi.ZONE_ID_CACHE_KEY, {'domain.test.com': 9901, 'test.com': 9900})
+        self.assertEqual(self.api.split_domain_name('sub.domain.test.com'), ('sub.domain', 'test.com'))
+        self.assertEqual(self.api.client.domain.mock_calls, [])
+
+    def test_split_domain_name_api_error(self):
+        """
+        Test that API errors other than unknown domains aren't taken as unregistered domains.
+        """
+        self.api.client.domain.info.side_effect = xmlrpc.client.Fault(500000, 'Internal error')
+        with self.assertRaises(xmlrpc.client.Fault):
+            self.api.split_domain_name('sub.domain.test.com')
+        self.assertEqual(self.api.client.domain.info.call_count, 1)
+
     def test_get_zone_id(self):
         """
         Gets zone_id for the requested FQDN.
-        The zone_id is cached in memory after retreived for the first time.
+        The zone_id is cached after retrieved for the first time.
         """
         self.populate_cache()
         zone_id = self.api.get_zone_id('test.com')
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+HAProxy runtime API - Tests
+"""
+
+# Imports #####################################################################
+
+import os.path
+import shlex
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import threading
+from unittest.mock import patch
+
+from instance import haproxy
+from instance.tests.base import TestCase
+
+
+# Classes #####################################################################
+
+class FakeRuntimeAPIServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A local stand-in for the haproxy admin socket, recording the commands it receives.
+
+    Like haproxy in non-interactive mode, it handles one command per connection.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, responses=None):
+        self.commands = []
+        self.responses = responses or {}
+        super().__init__(socket_path, FakeRuntimeAPIHandler)
+
+
+class FakeRuntimeAPIHandler(socketserver.StreamRequestHandler):
+    """
+    Reply to a command with the response configured for it, or with an empty response.
+    """
+    def handle(self):
+        command = self.rfile.readline().decode('utf-8').strip()
+        self.server.commands.append(command)
+        self.wfile.write(self.server.responses.get(command, '\n').encode('utf-8'))
+
+
+# Tests #######################################################################
+
+class RuntimeCommandsTestCase(TestCase):
+    """
+    Test cases for the computation of runtime API commands
+    """
+    @staticmethod
+    def make_backend_conf(*servers):
+        """
+        Return the configuration of a backend with the given server lines.
+        """
+        return "backend be-test\n    option httpchk /heartbeat\n{}\n".format(
+            "\n".join("    server {}".format(server) for server in servers)
+        )
+
+    def test_unchanged(self):
+        """
+        No commands are needed when the configuration didn't change.
+        """
+        backend_conf = self.make_backend_conf('appserver-1 1.1.1.1:80 cookie appserver-1')
+        self.assertEqual(haproxy.get_runtime_commands(backend_conf, backend_conf + '\n\n'), [])
+
+    def test_server_changes(self):
+        """
+        Servers are added before the removed ones are deleted.
+        """
+        self.assertEqual(
+            haproxy.get_runtime_commands(
+                self.make_backend_conf(
+                    'appserver-1 1.1.1.1:80 cookie appserver-1',
+                    'appserver-2 2.2.2.2:80 cookie appserver-2 check',
+                ),
+                self.make_backend_conf(
+                    'appserver-2 2.2.2.3:80 cookie appserver-2 check weight 50',
+                    'appserver-3 3.3.3.3:80 cookie appserver-3 check',
+                ),
+            ),
+            [
+                'set server be-test/appserver-2 addr 2.2.2.3 port 80',
+                'set weight be-test/appserver-2 50',
+                'add server be-test/appserver-3 3.3.3.3:80 check cookie appserver-3',
+                'enable server be-test/appserver-3',
+                'enable health be-test/appserver-3',
+                'set server be-test/appserver-1 state maint',
+                'shutdown sessions server be-test/appserver-1',
+                'del server be-test/appserver-1',
+            ]
+        )
+
+    def test_health_checks(self):
+        """
+        Health checks can be disabled at runtime, but not enabled on a server declared without them.
+        """
+        without_checks = self.make_backend_conf('appserver-1 1.1.1.1:80 cookie appserver-1')
+        with_checks = self.make_backend_conf('appserver-1 1.1.1.1:80 cookie appserver-1 check')
+        self.assertEqual(
+            haproxy.get_runtime_commands(with_checks, without_checks),
+            ['disable health be-test/appserver-1'],
+        )
+        self.assertIsNone(haproxy.get_runtime_commands(without_checks, with_checks))
+
+    def test_structural_changes(self):
+        """
+        Changes other than server changes can't be applied at runtime.
+        """
+        backend_conf = self.make_backend_conf('appserver-1 1.1.1.1:80 cookie appserver-1')
+        for new_backend_conf in [
+                backend_conf.replace('be-test', 'be-other'),
+                backend_conf + 'backend be-new\n',
+                backend_conf.replace('/heartbeat', '/status'),
+                backend_conf.replace('cookie appserver-1', 'cookie other'),
+        ]:
+            self.assertIsNone(haproxy.get_runtime_commands(backend_conf, new_backend_conf))
+
+
+class RunCommandsTestCase(TestCase):
+    """
+    Test cases for running commands through the runtime API
+    """
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.socket_path = os.path.join(tmp_dir, 'admin.sock')
+        self.server = FakeRuntimeAPIServer(self.socket_path, responses={
+            'add server be-test/appserver-2 2.2.2.2:80': 'New server registered.\n',
+            'del server be-test/unknown': 'No such server.\n',
+            'del server be-test/busy': 'Server still has connections attached to it, cannot remove it.\n',
+        })
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_local_socket(self):
+        """
+        Commands are sent to a local admin socket, one per connection.
+        """
+        commands = ['add server be-test/appserver-2 2.2.2.2:80', 'enable server be-test/appserver-2']
+        responses = haproxy.run_commands(commands, self.socket_path)
+        self.assertEqual(responses, ['New server registered.\n', '\n'])
+        self.assertEqual(self.server.commands, commands)
+
+    def test_local_socket_error(self):
+        """
+        Error responses raise RuntimeAPIError, and the following commands aren't sent.
+        """
+        commands = ['del server be-test/unknown', 'enable server be-test/appserver-2']
+        with self.assertRaisesRegex(haproxy.RuntimeAPIError, 'No such server'):
+            haproxy.run_commands(commands, self.socket_path)
+        self.assertEqual(self.server.commands, commands[:1])
+
+    @patch('instance.haproxy.time.sleep')
+    def test_local_socket_server_in_use(self, mock_sleep):
+        """
+        Deleting a server is retried while it still has connections.
+        """
+        with self.assertRaisesRegex(haproxy.RuntimeAPIError, 'still has connections'):
+            haproxy.run_commands(['del server be-test/busy'], self.socket_path)
+        self.assertEqual(self.server.commands, ['del server be-test/busy'] * (haproxy.DEL_SERVER_RETRIES + 1))
+        self.assertEqual(mock_sleep.call_count, haproxy.DEL_SERVER_RETRIES)
+
+    def test_local_socket_unreachable(self):
+        """
+        A missing admin socket raises RuntimeAPIError.
+        """
+        with self.assertRaises(haproxy.RuntimeAPIError):
+            haproxy.run_commands(['show info'], self.socket_path + '.missing')
+
+    def run_ssh_commands(self, commands, remote_script, timeout=5):
+        """
+        Run the given commands over SSH, with a local shell running `remote_script` instead of the SSH
+        command, and return their responses along with the Popen call arguments.
+        """
+        popen = subprocess.Popen
+        with patch('instance.haproxy.subprocess.Popen') as mock_popen:
+            mock_popen.side_effect = lambda args, **kwargs: popen(['sh', '-c', remote_script], **kwargs)
+            try:
+                responses = haproxy.run_commands(
+                    commands, '/run/haproxy/admin.sock', ssh_target='ubuntu@lb.example.com', timeout=timeout
+                )
+            finally:
+                args, dummy = mock_popen.call_args
+        self.assertEqual(args[0][:5], ['ssh', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout={}'.format(timeout)])
+        self.assertEqual(args[0][5], 'ubuntu@lb.example.com')
+        self.assertIn('UNIX-CONNECT:/run/haproxy/admin.sock', args[0][6])
+        return responses
+
+    def make_remote_script(self, commands_path):
+        """
+        Return a shell script standing in for the remote command, which records the commands it
+        receives in the given file, and replies like the haproxy admin socket.
+        """
+        return (
+            'while IFS= read -r command; do '
+            'echo "$command" >> {commands_path}; '
+            'case "$command" in '
+            '"add server"*) echo "New server registered.";; '
+            '"del server"*) echo "No such server.";; '
+            'esac; '
+            'echo; echo {marker}; '
+            'done'
+        ).format(commands_path=commands_path, marker=shlex.quote(haproxy.RESPONSE_END_MARKER))
+
+    def test_ssh(self):
+        """
+        Commands are sent to a remote admin socket over a single SSH connection, one at a time.
+        """
+        commands_path = os.path.join(os.path.dirname(self.socket_path), 'commands')
+        commands = ['add server be-test/appserver-2 2.2.2.2:80', 'enable server be-test/appserver-2']
+        responses = self.run_ssh_commands(commands, self.make_remote_script(commands_path))
+        self.assertEqual(responses, ['New server registered.\n\n', '\n'])
+        with open(commands_path) as commands_file:
+            self.assertEqual(commands_file.read().splitlines(), commands)
+
+    def test_ssh_error(self):
+        """
+        Error responses raise RuntimeAPIError, and the following commands aren't sent.
+        """
+        commands_path = os.path.join(os.path.dirname(self.socket_path), 'commands')
+        commands = ['del server be-test/unknown', 'enable server be-test/appserver-2']
+        with self.assertRaisesRegex(haproxy.RuntimeAPIError, 'No such server'):
+            self.run_ssh_commands(commands, self.make_remote_script(commands_path))
+        with open(commands_path) as commands_file:
+            self.assertEqual(commands_file.read().splitlines(), commands[:1])
+
+    def test_ssh_failure(self):
+        """
+        SSH failures raise RuntimeAPIError.
+        """
+        with self.assertRaisesRegex(haproxy.RuntimeAPIError, 'exit code 255.*Connection refused'):
+            self.run_ssh_commands(['show info'], 'echo "Connection refused" >&2; exit 255')
+
+    def test_ssh_timeout(self):
+        """
+        Responses which don't arrive in time raise RuntimeAPIError.
+        """
+        with self.assertRaisesRegex(haproxy.RuntimeAPIError, 'timed out'):
+            self.run_ssh_commands(['show info'], 'exec sleep 30', timeout=1)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Log tail streams - Tests
+"""
+
+# Imports #####################################################################
+
+import json
+from unittest.mock import patch
+
+from django.test import override_settings
+from redis.exceptions import RedisError
+
+from instance import log_tail
+from instance.tests.base import TestCase
+from instance.tests.models.factories.server import OpenStackServerFactory
+
+
+# Tests #######################################################################
+
+class LogTailTestCase(TestCase):
+    """
+    Test cases for the log tail streams
+    """
+    def setUp(self):
+        super().setUp()
+        self.server = OpenStackServerFactory(openstack_id='vm1_id')
+        self.other_server = OpenStackServerFactory(openstack_id='vm2_id')
+        self.keys = [log_tail.get_stream_key(self.server), log_tail.get_stream_key(self.other_server)]
+
+    def test_read_log_entries(self):
+        """
+        Log entries are read from the cursor, for the given objects only
+        """
+        cursor = log_tail.get_cursor(self.keys)
+        self.server.logger.info('Line #1')
+        self.other_server.logger.info('Line #2')
+        OpenStackServerFactory(openstack_id='vm3_id').logger.info('Unrelated line')
+
+        log_entries, cursor = log_tail.read_log_entries(self.keys, cursor, block=1)
+        self.assertEqual([log_entry['text'][-7:] for log_entry in log_entries], ['Line #1', 'Line #2'])
+        self.assertEqual(cursor, log_tail.get_cursor(self.keys))
+
+        self.server.logger.info('Line #3')
+        log_entries, cursor = log_tail.read_log_entries(self.keys, cursor, block=1)
+        self.assertEqual([log_entry['text'][-7:] for log_entry in log_entries], ['Line #3'])
+
+        log_entries, dummy = log_tail.read_log_entries(self.keys, cursor, block=0.01)
+        self.assertEqual(log_entries, [])
+
+    def test_invalid_cursor(self):
+        """
+        Cursors must have a stream ID for each stream
+        """
+        for cursor in ('1-0', '1-0,abc', '1-0,2-0,3-0'):
+            with self.assertRaises(ValueError):
+                log_tail.read_log_entries(self.keys, cursor, block=0.01)
+
+    def test_stream_events(self):
+        """
+        Batches of new log entries are sent as events identified by their cursor
+        """
+        cursor = log_tail.get_cursor(self.keys)
+        self.server.logger.info('Line #1')
+        events = log_tail.stream_events(self.keys, cursor, duration=1)
+        self.assertEqual(next(events), 'retry: 1000\n\n')
+
+        event_id, data = next(events).rstrip('\n').split('\n')
+        self.assertEqual(event_id, 'id: {}'.format(log_tail.get_cursor(self.keys)))
+        self.assertEqual([log_entry['text'][-7:] for log_entry in json.loads(data[6:])['log_entries']], ['Line #1'])
+        self.assertEqual(set(events), {': keep-alive\n\n'})
+        self.assertEqual(log_tail.open_streams.count, 0)
+
+    @patch('instance.log_tail.read_log_entries')
+    def test_stream_events_redis_error(self, mock_read_log_entries):
+        """
+        The stream ends cleanly when Redis becomes unavailable, so that the client reconnects
+        """
+        mock_read_log_entries.side_effect = RedisError('Connection refused')
+        events = log_tail.stream_events(self.keys, log_tail.get_cursor(self.keys), duration=1)
+        self.assertEqual(list(events), ['retry: 1000\n\n'])
+        self.assertEqual(log_tail.open_streams.count, 0)
+
+    @override_settings(LOG_TAIL_MAX_STREAMS=1)
+    def test_max_streams(self):
+        """
+        Log tail responses beyond LOG_TAIL_MAX_STREAMS end right away, asking the client to retry later
+        """
+        cursor = log_tail.get_cursor(self.keys)
+        events = log_tail.stream_events(self.keys, cursor, duration=1)
+        self.assertEqual(next(events), 'retry: 1000\n\n')
+        busy_events = log_tail.stream_events(self.keys, cursor, duration=1)
+        self.assertEqual(list(busy_events), ['retry: {}\n\n'.format(log_tail.BUSY_RETRY_INTERVAL)])
+
+        events.close()
+        self.assertEqual(log_tail.open_streams.count, 0)
+        events = log_tail.stream_events(self.keys, cursor, duration=1)
+        self.assertEqual(next(events), 'retry: 1000\n\n')
+        events.close()
+
+    @override_settings(LOG_TAIL_STREAM_LENGTH=0)
+    def test_disabled(self):
+        """
+        Log tail streams can be disabled
+        """
+        self.assertIsNone(log_tail.get_cursor(self.keys))
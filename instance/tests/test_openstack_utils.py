@@ -23,6 +23,7 @@ OpenStack Utilities - Tests
 # Imports #####################################################################
 
 from collections import namedtuple
+import os
 from unittest import mock
 from unittest.mock import Mock, call, patch, MagicMock
 
@@ -88,6 +89,43 @@ class OpenStackTestCase(TestCase):
         super().setUp()
 
         self.nova = Mock()
+        self.addCleanup(openstack_utils.clear_client_cache)
+
+    @patch('instance.openstack_utils.create_nova_client')
+    def test_get_nova_client_cached(self, mock_create_nova_client):
+        """
+        Nova clients are created once per region, and then shared
+        """
+        mock_create_nova_client.side_effect = lambda region_name, api_version: Mock(region_name=region_name)
+        nova = openstack_utils.get_nova_client('region1')
+        self.assertEqual(nova.region_name, 'region1')
+        self.assertIs(openstack_utils.get_nova_client('region1'), nova)
+        self.assertEqual(openstack_utils.get_nova_client('region2').region_name, 'region2')
+        self.assertEqual(mock_create_nova_client.mock_calls, [call('region1', 2), call('region2', 2)])
+
+        openstack_utils.clear_client_cache()
+        self.assertIsNot(openstack_utils.get_nova_client('region1'), nova)
+
+    @patch('instance.openstack_utils.create_nova_client')
+    def test_client_cache_fork(self, mock_create_nova_client):
+        """
+        Clients created by a parent process aren't reused by forked processes
+        """
+        mock_create_nova_client.side_effect = lambda region_name, api_version: Mock(region_name=region_name)
+        nova = openstack_utils.get_nova_client('region1')
+        with patch('os.getpid', return_value=os.getpid() + 1):
+            forked_nova = openstack_utils.get_nova_client('region1')
+            self.assertIsNot(forked_nova, nova)
+            self.assertIs(openstack_utils.get_nova_client('region1'), forked_nova)
+
+    @patch('instance.openstack_utils.create_openstack_connection')
+    def test_get_openstack_connection_cached(self, mock_create_connection):
+        """
+        OpenStack connections are created once per region, and then shared
+        """
+        connection = openstack_utils.get_openstack_connection('region1')
+        self.assertIs(openstack_utils.get_openstack_connection('region1'), connection)
+        mock_create_connection.assert_called_once_with('region1')
 
     def test_get_openstack_connection(self):
         """
@@ -23,8 +23,13 @@ Git repository - Tests
 # Imports #####################################################################
 
 import os.path
+import shutil
+import subprocess
+import tempfile
 from unittest.mock import call, patch
 
+from django.test import override_settings
+
 from instance import repo
 from instance.tests.base import TestCase
 
@@ -35,6 +40,7 @@ class RepoTestCase(TestCase):
     """
     Test cases for Git repository helper functions
     """
+    @override_settings(GIT_MIRROR_CACHE_DIR='')
     @patch('git.Git')
     @patch('git.repo.base.Repo.clone_from')
     def test_open_repository(self, mock_clone_from, mock_git_class):
@@ -48,3 +54,83 @@ class RepoTestCase(TestCase):
             self.assertTrue(os.path.isdir(tmp_dir_path))
             self.assertEqual(mock_repo.mock_calls, [call.checkout('test-branch')])
         self.assertFalse(os.path.isdir(tmp_dir_path))
+
+
+class RepoMirrorTestCase(TestCase):
+    """
+    Test cases for the local mirrors of Git repositories
+    """
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.mirror_dir = os.path.join(self.tmp_dir, 'mirrors')
+        self.source_dir = os.path.join(self.tmp_dir, 'source')
+        self.git('init', '-q', self.source_dir, cwd=self.tmp_dir)
+        self.git('symbolic-ref', 'HEAD', 'refs/heads/master')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'Test')
+        self.first_commit = self.commit('first.txt')
+        self.git('checkout', '-q', '-b', 'test-branch')
+        self.branch_commit = self.commit('branch.txt')
+        self.git('checkout', '-q', '-')
+
+    def git(self, *args, cwd=None):
+        """
+        Run a git command in the source repository, and return its output
+        """
+        return subprocess.check_output(('git',) + args, cwd=cwd or self.source_dir).decode().strip()
+
+    def commit(self, file_name):
+        """
+        Commit a new file to the source repository, and return the commit hash
+        """
+        with open(os.path.join(self.source_dir, file_name), 'w') as f:
+            f.write(file_name)
+        self.git('add', file_name)
+        self.git('commit', '-q', '-m', file_name)
+        return self.git('rev-parse', 'HEAD')
+
+    def test_open_repository(self):
+        """
+        The repository is cloned from a mirror, which is created on first use
+        """
+        with override_settings(GIT_MIRROR_CACHE_DIR=self.mirror_dir):
+            with repo.open_repository(self.source_dir, ref='test-branch') as git_repo:
+                self.assertEqual(git_repo.rev_parse('HEAD'), self.branch_commit)
+                self.assertEqual(git_repo.remote('get-url', 'origin'), self.source_dir)
+                working_dir = git_repo.working_dir
+                # The clone has its own objects, which fetching the mirror can't prune
+                self.assertFalse(os.path.exists(os.path.join(working_dir, '.git', 'objects', 'info', 'alternates')))
+            mirror_path = repo.get_mirror_path(self.source_dir)
+        self.assertFalse(os.path.isdir(working_dir))
+        self.assertTrue(os.path.isdir(mirror_path))
+        self.assertEqual(self.git('rev-parse', 'test-branch', cwd=mirror_path), self.branch_commit)
+
+    def test_fetch_mirror(self):
+        """
+        The mirror is fetched before cloning branches, but not commits which it already has
+        """
+        with override_settings(GIT_MIRROR_CACHE_DIR=self.mirror_dir):
+            with repo.open_repository(self.source_dir):
+                pass
+            new_commit = self.commit('second.txt')
+            mirror_path = repo.get_mirror_path(self.source_dir)
+            with repo.open_repository(self.source_dir, ref=self.first_commit) as git_repo:
+                self.assertEqual(git_repo.rev_parse('HEAD'), self.first_commit)
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.git('cat-file', '-e', new_commit, cwd=mirror_path)
+            with repo.open_repository(self.source_dir, ref='master') as git_repo:
+                self.assertEqual(git_repo.rev_parse('HEAD'), new_commit)
+
+    def test_get_commit_sha(self):
+        """
+        Branches and tags are resolved to the commit they point to, without cloning the repository
+        """
+        self.git('tag', '-a', 'test-tag', '-m', 'Annotated tag', self.first_commit)
+        self.assertEqual(repo.get_commit_sha(self.source_dir, 'master'), self.first_commit)
+        self.assertEqual(repo.get_commit_sha(self.source_dir, 'test-branch'), self.branch_commit)
+        self.assertEqual(repo.get_commit_sha(self.source_dir, 'test-tag'), self.first_commit)
+        self.assertEqual(repo.get_commit_sha(self.source_dir, self.branch_commit), self.branch_commit)
+        self.assertIsNone(repo.get_commit_sha(self.source_dir, 'unknown'))
+        self.assertIsNone(repo.get_commit_sha(os.path.join(self.tmp_dir, 'missing'), 'master'))
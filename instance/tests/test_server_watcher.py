@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2018 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+OpenStack server watcher - Tests
+"""
+
+# Imports #####################################################################
+
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from instance.server_watcher import ServerWatcher
+from instance.tests.base import TestCase
+
+
+# Tests #######################################################################
+
+@patch('instance.server_watcher.ServerWatcher._run')
+@patch('instance.server_watcher.openstack_utils.get_nova_client')
+class ServerWatcherTestCase(TestCase):
+    """
+    Test cases for ServerWatcher - the polling thread is replaced by explicit calls to poll()
+    """
+    def setUp(self):
+        super().setUp()
+        self.watcher = ServerWatcher(interval=5)
+        self.results = {}
+        self.wait_durations = {}
+
+    def start_waiting(self, openstack_id, known_status, timeout):
+        """
+        Wait for the status of the given server to change, in a separate thread
+        """
+        def wait():
+            """ Record the Nova server returned by the watcher, and how long it took """
+            start = time.monotonic()
+            self.results[openstack_id] = self.watcher.wait('region', openstack_id, known_status, timeout)
+            self.wait_durations[openstack_id] = time.monotonic() - start
+        thread = threading.Thread(target=wait)
+        thread.start()
+        return thread
+
+    def wait_for_waiters(self, count):
+        """
+        Wait until the given number of servers are being watched
+        """
+        for dummy in range(100):
+            with self.watcher.lock:
+                if len(self.watcher.waiters) == count:
+                    return
+            time.sleep(0.01)
+        self.fail('The servers are not being watched.')
+
+    def test_wake_on_status_change(self, mock_get_nova_client, mock_run):
+        """
+        A single list of the servers wakes up the waiters of the servers whose status changed
+        """
+        building_server = Mock(id='server1', status='BUILD')
+        active_server = Mock(id='server2', status='ACTIVE')
+        mock_get_nova_client.return_value.servers.list.return_value = [building_server, active_server]
+
+        unchanged_thread = self.start_waiting('server1', 'BUILD', timeout=1)
+        changed_thread = self.start_waiting('server2', 'BUILD', timeout=60)
+        self.wait_for_waiters(2)
+        self.assertTrue(self.watcher.poll())
+        mock_get_nova_client.assert_called_once_with('region')
+        mock_get_nova_client.return_value.servers.list.assert_called_once_with()
+
+        changed_thread.join(5)
+        self.assertFalse(changed_thread.is_alive())
+        self.assertEqual(self.results['server2'], active_server)
+
+        # The waiter of the unchanged server is only woken up by its timeout
+        unchanged_thread.join(5)
+        self.assertFalse(unchanged_thread.is_alive())
+        self.assertEqual(self.results['server1'], building_server)
+        self.assertGreaterEqual(self.wait_durations['server1'], 0.9)
+        self.assertEqual(self.watcher.waiters, {})
+        self.assertEqual(self.watcher.os_servers, {})
+        self.assertFalse(self.watcher.poll())
+
+    def test_server_not_listed(self, mock_get_nova_client, mock_run):
+        """
+        Waiters of servers which aren't listed anymore are woken up, and get no server
+        """
+        mock_get_nova_client.return_value.servers.list.return_value = []
+        thread = self.start_waiting('server1', 'ACTIVE', timeout=60)
+        self.wait_for_waiters(1)
+        self.watcher.poll()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.results['server1'])
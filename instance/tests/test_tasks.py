@@ -23,11 +23,15 @@ Worker tasks - Tests
 # Imports #####################################################################
 
 from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import call, patch, PropertyMock
 
 import ddt
 import freezegun
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import override_settings
 from django.utils import timezone
 
@@ -74,7 +78,7 @@ class SpawnAppServerTestCase(TestCase):
             instance,
             failure_tag=None,
             success_tag=None,
-            num_attempts=1
+            num_attempts=1,
         )
         # By default we don't mark_active_on_success:
         self.assertEqual(self.mock_make_appserver_active.call_count, 0)
@@ -97,6 +101,28 @@ class SpawnAppServerTestCase(TestCase):
         else:
             self.mock_make_appserver_active.assert_not_called()
 
+    @ddt.data(True, False)
+    @patch('instance.models.openedx_instance.OpenEdXInstance.skip_unchanged_appserver', autospec=True)
+    def test_skip_unchanged(self, unchanged, mock_skip_unchanged_appserver):
+        """
+        Test that when skip_unchanged=True, the spawn_appserver task returns the unchanged active AppServer
+        without spawning or activating a new one.
+        """
+        instance = OpenEdXInstanceFactory()
+        mock_skip_unchanged_appserver.return_value = 5 if unchanged else None
+        appserver = tasks.spawn_appserver(
+            instance.ref.pk, mark_active_on_success=True, skip_unchanged=True, success_tag='success'
+        )
+        mock_skip_unchanged_appserver.assert_called_once_with(instance, success_tag='success', failure_tag=None)
+        if unchanged:
+            self.assertEqual(appserver, 5)
+            self.mock_spawn_appserver.assert_not_called()
+            self.mock_make_appserver_active.assert_not_called()
+        else:
+            self.assertEqual(appserver, 10)
+            self.assertEqual(self.mock_spawn_appserver.call_count, 1)
+            self.mock_make_appserver_active.assert_called_once_with(10, active=True, deactivate_others=False)
+
     def test_not_mark_active_if_pending(self):
         """
         Test that we when mark_active_on_success=True, the spawn_appserver task will not mark the
@@ -424,6 +450,76 @@ class CleanUpTestCase(TestCase):
         mock_terminate_appservers.assert_called_once_with()
 
 
+class ReconfigureLoadBalancerTestCase(TestCase):
+    """
+    Test cases for the task running scheduled load balancer reconfigurations.
+    """
+    @patch('instance.models.load_balancer.LoadBalancingServer.clear_scheduled_reconfiguration')
+    @patch('instance.models.load_balancer.LoadBalancingServer.reconfigure')
+    def test_reconfigure_load_balancer(self, mock_reconfigure, mock_clear_scheduled):
+        """
+        `reconfigure_load_balancer` allows new reconfigurations to be scheduled, then waits for the lock
+        to reconfigure the load balancer.
+        """
+        load_balancer = LoadBalancingServerFactory()
+        mock_reconfigure.side_effect = lambda **kwargs: self.assertEqual(
+            mock_clear_scheduled.call_count, 1
+        )
+        tasks.reconfigure_load_balancer(load_balancer.pk)
+        mock_reconfigure.assert_called_once_with(mark_dirty=False, blocking=True)
+
+    @override_settings(LOAD_BALANCER_RECONFIGURATION_RETRY_DELAY=30)
+    @patch('instance.tasks.reconfigure_load_balancer.schedule')
+    @patch('instance.models.load_balancer.LoadBalancingServer.reconfigure')
+    def test_reconfigure_load_balancer_fails(self, mock_reconfigure, mock_schedule):
+        """
+        Failed reconfigurations are scheduled again, unless another one was scheduled in the meantime.
+        """
+        load_balancer = LoadBalancingServerFactory()
+        load_balancer.clear_scheduled_reconfiguration()
+        mock_reconfigure.side_effect = RuntimeError('reconfiguration failed')
+        with self.assertRaises(RuntimeError):
+            tasks.reconfigure_load_balancer(load_balancer.pk)
+        mock_schedule.assert_called_once_with(args=(load_balancer.pk,), delay=30)
+
+        def schedule_and_fail(**kwargs):
+            """
+            Schedule another reconfiguration while this one runs, then fail.
+            """
+            load_balancer.schedule_reconfiguration()
+            raise RuntimeError('reconfiguration failed')
+
+        mock_schedule.reset_mock()
+        mock_reconfigure.side_effect = schedule_and_fail
+        with self.assertRaises(RuntimeError):
+            tasks.reconfigure_load_balancer(load_balancer.pk)
+        mock_schedule.assert_called_once_with(
+            args=(load_balancer.pk,),
+            delay=settings.LOAD_BALANCER_RECONFIGURATION_DELAY,
+        )
+
+    @patch('instance.models.load_balancer.LoadBalancingServer.reconfigure')
+    def test_deleted_load_balancer(self, mock_reconfigure):
+        """
+        Reconfigurations scheduled for deleted load balancers are ignored.
+        """
+        tasks.reconfigure_load_balancer(0)
+        self.assertEqual(mock_reconfigure.call_count, 0)
+
+    @patch('instance.models.load_balancer.LoadBalancingServer.reconfigure')
+    def test_update_load_balancer_configuration_files(self, mock_reconfigure):
+        """
+        `update_load_balancer_configuration_files` runs the playbook instead of using the runtime API,
+        and ignores deleted load balancers.
+        """
+        load_balancer = LoadBalancingServerFactory()
+        tasks.update_load_balancer_configuration_files(load_balancer.pk)
+        mock_reconfigure.assert_called_once_with(mark_dirty=False, runtime_api=False, blocking=True)
+
+        tasks.update_load_balancer_configuration_files(0)
+        self.assertEqual(mock_reconfigure.call_count, 1)
+
+
 class ReconfigureDirtyLoadBalancersTestCase(TestCase):
     """
     Test cases for periodic task that reconfigures all dirty load balancers.
@@ -442,9 +538,27 @@ class ReconfigureDirtyLoadBalancersTestCase(TestCase):
         LoadBalancingServerFactory(configuration_version=1, deployed_configuration_version=10)
         # Clean load balancer.
         LoadBalancingServerFactory(configuration_version=2, deployed_configuration_version=2)
+        # Load balancer with configuration files to update after runtime changes.
+        LoadBalancingServerFactory(configuration_version=2, deployed_configuration_version=2,
+                                   runtime_changes_pending=True)
+
+        tasks.reconfigure_dirty_load_balancers()
+        self.assertEqual(mock_reconfigure.call_count, 4)
+        mock_reconfigure.assert_called_with(mark_dirty=False, runtime_api=False)
+
+    @patch('instance.models.load_balancer.LoadBalancingServer.has_outdated_fragments', autospec=True)
+    @patch('instance.models.load_balancer.LoadBalancingServer.reconfigure')
+    def test_reconfigure_outdated_load_balancers(self, mock_reconfigure, mock_has_outdated_fragments):
+        """
+        `reconfigure_dirty_load_balancers` also reconfigures the clean load balancers with outdated fragments.
+        """
+        outdated_load_balancer = LoadBalancingServerFactory(configuration_version=2, deployed_configuration_version=2)
+        LoadBalancingServerFactory(configuration_version=2, deployed_configuration_version=2)
+        mock_has_outdated_fragments.side_effect = lambda load_balancer: load_balancer == outdated_load_balancer
 
         tasks.reconfigure_dirty_load_balancers()
-        self.assertEqual(mock_reconfigure.call_count, 3)
+        self.assertEqual(mock_has_outdated_fragments.call_count, 2)
+        mock_reconfigure.assert_called_once_with(mark_dirty=False, runtime_api=False)
 
 
 class DeleteOldLogsTestCase(TestCase):
@@ -489,3 +603,52 @@ class DeleteOldLogsTestCase(TestCase):
         # Only the new log remains.
         self.assertFalse(remaining_logs.filter(text__contains='old log').exists())
         self.assertTrue(remaining_logs.filter(text__contains='new log').exists())
+
+    @override_settings(LOG_DELETION_DAYS=30, LOG_PARTITION_DAYS_AHEAD=7)
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    def test_delete_old_logs_partitioned(self):
+        """
+        When the log entries table is partitioned, old logs are deleted by dropping partitions.
+        """
+        with freezegun.freeze_time(self.now):
+            call_command('partition_log_entries', '--convert', stdout=StringIO())
+            instance = OpenEdXInstanceFactory()
+            instance.logger.info('legacy log')
+        with freezegun.freeze_time(self.now + timedelta(days=3)):
+            instance.logger.info('old log')
+        self.assertIn('instance_logentry_p20180804', [name for name, dummy in LogEntry.get_partitions()])
+
+        log_deletion = self.now + timedelta(days=35)
+        with freezegun.freeze_time(log_deletion):
+            tasks.create_log_partitions()
+            tasks.delete_old_logs()
+            instance.logger.info('new log')
+
+        partitions = [name for name, dummy in LogEntry.get_partitions()]
+        self.assertNotIn('instance_logentry_legacy', partitions)
+        self.assertNotIn('instance_logentry_p20180804', partitions)
+        self.assertEqual(partitions[0], 'instance_logentry_p20180806')
+        self.assertEqual(partitions[-1], 'instance_logentry_p20180912')
+        self.assertFalse(LogEntry.objects.filter(text__contains='legacy log').exists())
+        self.assertFalse(LogEntry.objects.filter(text__contains='old log').exists())
+        self.assertTrue(LogEntry.objects.filter(text__contains='new log').exists())
+
+    @override_settings(LOG_PARTITION_DAYS_AHEAD=7, LOG_PARTITION_MIN_DAYS_AHEAD=3)
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    @patch('instance.tasks.logger')
+    def test_create_log_partitions(self, mock_logger):
+        """
+        The partitions for the coming days are created, and an error is logged when they can't be.
+        """
+        with freezegun.freeze_time(self.now):
+            call_command('partition_log_entries', '--convert', '--days-ahead', '2', stdout=StringIO())
+            tasks.create_log_partitions()
+        self.assertEqual(LogEntry.get_partitions()[-1][0], 'instance_logentry_p20180808')
+        mock_logger.error.assert_not_called()
+
+        with freezegun.freeze_time(self.now + timedelta(days=5)), \
+                patch('instance.tasks.LogEntry.create_partitions', side_effect=Exception('Failed')):
+            tasks.create_log_partitions()
+        mock_logger.exception.assert_called_once_with('Failed to create the partitions of the log entries table.')
+        self.assertEqual(mock_logger.error.call_count, 1)
+        self.assertIn('Log entries created afterwards will fail to be written.', mock_logger.error.call_args[0][0])
@@ -28,6 +28,7 @@ import requests
 import responses
 import consul
 from instance import gandi
+from instance.ansible import PlaybookLogCollector
 from instance.tests.fake_gandi_client import FakeGandiClient
 from instance.tests.models.factories.server import OSServerMockManager
 
@@ -115,7 +116,7 @@ def patch_services(func):
                 mock_sleep=mock_sleep,
                 mock_run_ansible_playbooks=stack_patch(
                     'instance.models.mixins.ansible.AnsibleAppServerMixin.run_ansible_playbooks',
-                    return_value=([], 0),
+                    return_value=(PlaybookLogCollector(), 0),
                 ),
                 mock_provision_failed_email=stack_patch(
                     'instance.models.mixins.utilities.EmailMixin.provision_failed_email',
@@ -247,6 +247,8 @@ SWAMP_DRAGON_REDIS_PORT = REDIS_URL_OBJ.port
 SWAMP_DRAGON_CONNECTION = ('swampdragon.connections.sockjs_connection.DjangoSubscriberConnection', '/data')
 DRAGON_SERVER_ADDRESS_PORT = env('DRAGON_SERVER_ADDRESS_PORT', default='0.0.0.0:2001')
 DRAGON_URL = env('DRAGON_URL', default='http://localhost:2001/')
+# Time in seconds during which repeated notifications about the same object are merged into one
+NOTIFICATION_COALESCE_WINDOW = env.int('NOTIFICATION_COALESCE_WINDOW', default=1)
 
 
 # OpenStack ###################################################################
@@ -265,6 +267,11 @@ OPENSTACK_PRODUCTION_INSTANCE_FLAVOR = env.json(
     'OPENSTACK_PRODUCTION_INSTANCE_FLAVOR',
     default={"ram": 8192, "disk": 80}
 )
+# Watch the status of the VMs being waited for with a single `servers.list()` call per region and
+# interval, rather than querying each VM separately - see instance.server_watcher
+OPENSTACK_SERVER_WATCHER = env.bool('OPENSTACK_SERVER_WATCHER', default=True)
+# Time in seconds between two `servers.list()` calls of the server watcher
+OPENSTACK_SERVER_WATCHER_INTERVAL = env.int('OPENSTACK_SERVER_WATCHER_INTERVAL', default=5)
 
 # Separate credentials for Swift.  These credentials are currently passed on to each instance
 # when Swift is enabled.
@@ -318,6 +325,9 @@ BILLING_RATE = env('BILLING_RATE', default=3)
 # See https://www.gandi.net/admin/api_key
 GANDI_API_KEY = env('GANDI_API_KEY')
 
+# Number of seconds the zone IDs of the Gandi domains are cached
+GANDI_ZONE_ID_CACHE_TIMEOUT = env.int('GANDI_ZONE_ID_CACHE_TIMEOUT', default=24 * 60 * 60)
+
 
 # GitHub - Forks & organizations ##############################################
 
@@ -487,12 +497,57 @@ EDX_WORKERS_ENABLE_CELERY_HEARTBEATS = env.bool('EDX_WORKERS_ENABLE_CELERY_HEART
 # Ansible requires a Python 2 interpreter
 ANSIBLE_PYTHON_PATH = env('ANSIBLE_PYTHON_PATH', default='/usr/bin/python')
 
+# Directory where the virtualenvs used to run Ansible playbooks are cached, so that they're only built
+# once for each requirements file. Set to an empty string to build a new virtualenv for each playbook run.
+ANSIBLE_VENV_CACHE_DIR = env('ANSIBLE_VENV_CACHE_DIR', default=root('build/ansible_venvs'))
+
+# Number of cached virtualenvs to keep - the least recently used ones are deleted
+ANSIBLE_VENV_CACHE_SIZE = env.int('ANSIBLE_VENV_CACHE_SIZE', default=5)
+
+# Directory where local mirrors of the playbook repositories are kept, so that each playbook run clones
+# its repository from a local mirror. Set to an empty string to clone the repositories from their URL.
+GIT_MIRROR_CACHE_DIR = env('GIT_MIRROR_CACHE_DIR', default=root('build/git_mirrors'))
+
+# Whether Ansible runs its modules over the SSH connection instead of copying them to the servers first
+ANSIBLE_PIPELINING = env.bool('ANSIBLE_PIPELINING', default=True)
+
+# The SSH arguments used by Ansible - the SSH connections are kept open between tasks by ControlPersist
+ANSIBLE_SSH_ARGS = env(
+    'ANSIBLE_SSH_ARGS', default='-C -o ControlMaster=auto -o ControlPersist=60s -o ServerAliveInterval=30'
+)
+
+# Number of hosts Ansible configures in parallel
+ANSIBLE_FORKS = env.int('ANSIBLE_FORKS', default=5)
+
+# Directory where Ansible caches the facts gathered from the servers, so that the next playbooks run against
+# the same server don't gather them again. Disabled by default: since IP addresses are reused, the cached
+# facts of a deleted server could be used for a new one until they expire.
+ANSIBLE_FACT_CACHE_DIR = env('ANSIBLE_FACT_CACHE_DIR', default='')
+
+# Time in seconds after which the cached facts expire
+ANSIBLE_FACT_CACHE_TIMEOUT = env.int('ANSIBLE_FACT_CACHE_TIMEOUT', default=600)
+
+# Ansible environment variables to set for specific playbooks, by playbook file name, e.g.
+# {"edx_sandbox.yml": {"ANSIBLE_FORKS": 10}}. They take precedence over the settings above.
+ANSIBLE_CONFIG_OVERRIDES = env.json('ANSIBLE_CONFIG_OVERRIDES', default={})
+
+# Whether to record the duration of each task of the playbooks run against AppServers
+ANSIBLE_RECORD_TASK_TIMINGS = env.bool('ANSIBLE_RECORD_TASK_TIMINGS', default=True)
+
 # Time in seconds to wait for the next log line when running an Ansible playbook.
 ANSIBLE_LINE_TIMEOUT = env.int('ANSIBLE_LINE_TIMEOUT', default=1500)  # 25 minutes
 
 # Timeout in seconds for an entire Ansible playbook.
 ANSIBLE_GLOBAL_TIMEOUT = env.int('ANSIBLE_GLOBAL_TIMEOUT', default=9000)  # 2.5 hours
 
+# Maximum number of lines of playbook output kept in memory when collecting the logs of a playbook run
+# (e.g. for the provisioning failure emails). Only the last lines are kept.
+ANSIBLE_LOG_COLLECT_LINES = env.int('ANSIBLE_LOG_COLLECT_LINES', default=10000)
+
+# Maximum size in bytes of the gzip-compressed full playbook log attached to the provisioning failure emails.
+# The last ANSIBLE_LOG_COLLECT_LINES lines are always attached.
+ANSIBLE_LOG_ATTACHMENT_MAX_SIZE = env.int('ANSIBLE_LOG_ATTACHMENT_MAX_SIZE', default=5 * 1024 * 1024)
+
 # The repository to pull the default Ansible playbook from.
 ANSIBLE_APPSERVER_REPO = env('ANSIBLE_APPSERVER_REPO', default='https://github.com/open-craft/ansible-playbooks.git')
 
@@ -537,6 +592,23 @@ BASE_HANDLERS = env.json('BASE_HANDLERS', default=["file", "console", "mail_admi
 HANDLERS = BASE_HANDLERS + ['db']
 LOGGING_ROTATE_MAX_KBYTES = env.json('LOGGING_ROTATE_MAX_KBYTES', default=10 * 1024)
 LOGGING_ROTATE_MAX_FILES = env.json('LOGGING_ROTATE_MAX_FILES', default=60)
+# Queue log entries in memory and write them to the database in batches, rather than one at a time.
+# This is mostly useful for the workers, which log every line of output of long-running playbooks.
+LOG_DB_BUFFERED = env.bool('LOG_DB_BUFFERED', default=False)
+# Number of queued log entries that triggers a write to the database
+LOG_DB_BUFFER_CAPACITY = env.int('LOG_DB_BUFFER_CAPACITY', default=500)
+# Time in seconds after which queued log entries are written to the database
+LOG_DB_BUFFER_FLUSH_INTERVAL = env.int('LOG_DB_BUFFER_FLUSH_INTERVAL', default=2)
+# Approximate number of log entries kept for each object in its log tail stream in Redis, which
+# the log tail API endpoints read from. Set to 0 to disable the log tail streams.
+LOG_TAIL_STREAM_LENGTH = env.int('LOG_TAIL_STREAM_LENGTH', default=1000)
+# Time in seconds after which the log tail stream of an object without new log entries expires
+LOG_TAIL_STREAM_TTL = env.int('LOG_TAIL_STREAM_TTL', default=24 * 60 * 60)
+# Time in seconds during which a log tail response streams new log entries, before the client reconnects
+LOG_TAIL_RESPONSE_DURATION = env.int('LOG_TAIL_RESPONSE_DURATION', default=30)
+# Maximum number of log tail responses streamed at once by each web process. Each of them holds a
+# web server thread for up to LOG_TAIL_RESPONSE_DURATION seconds, so keep it below the number of threads.
+LOG_TAIL_MAX_STREAMS = env.int('LOG_TAIL_MAX_STREAMS', default=4)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -607,6 +679,13 @@ if 'file' in HANDLERS:
         'formatter': 'verbose'
     }
 
+if LOG_DB_BUFFERED:
+    LOGGING['handlers']['db'].update({
+        'class': 'instance.logging.BufferedDBHandler',
+        'capacity': LOG_DB_BUFFER_CAPACITY,
+        'flush_interval': LOG_DB_BUFFER_FLUSH_INTERVAL,
+    })
+
 
 # Instances ###################################################################
 
@@ -629,6 +708,14 @@ LOG_LIMIT = env.int('LOG_LIMIT', default=10000)
 # How old a log entry needs to be before it's deleted.
 LOG_DELETION_DAYS = env.int('LOG_DELETION_DAYS', default=60)
 
+# Number of days for which partitions of the log entries table are created in advance,
+# when the table is partitioned (see the `partition_log_entries` management command).
+LOG_PARTITION_DAYS_AHEAD = env.int('LOG_PARTITION_DAYS_AHEAD', default=30)
+
+# Number of days left before the last partition of the log entries table ends, below which an error
+# is logged. Log entries can't be written at all once the last partition has ended.
+LOG_PARTITION_MIN_DAYS_AHEAD = env.int('LOG_PARTITION_MIN_DAYS_AHEAD', default=7)
+
 # When configured, email sent from instances is relayed via external SMTP provider.
 INSTANCE_SMTP_RELAY_HOST = env('INSTANCE_SMTP_RELAY_HOST', default=None)
 INSTANCE_SMTP_RELAY_PORT = env.int('INSTANCE_SMTP_RELAY_PORT', default=587)
@@ -678,6 +765,20 @@ DEFAULT_LOAD_BALANCING_SERVER = env('DEFAULT_LOAD_BALANCING_SERVER', default=Non
 LOAD_BALANCER_FRAGMENT_NAME_PREFIX = env('LOAD_BALANCER_FRAGMENT_NAME_PREFIX', default='opencraft-')
 PRELIMINARY_PAGE_SERVER_IP = env('PRELIMINARY_PAGE_SERVER_IP', default=None)
 
+# Path of the haproxy admin socket on the load-balancing servers. When set, backend server changes are
+# applied through the haproxy runtime API over SSH, instead of waiting for a playbook run.
+LOAD_BALANCER_RUNTIME_API_SOCKET = env('LOAD_BALANCER_RUNTIME_API_SOCKET', default='')
+
+# Number of seconds a load balancer reconfiguration is delayed, to deploy the changes made meanwhile together
+LOAD_BALANCER_RECONFIGURATION_DELAY = env.int('LOAD_BALANCER_RECONFIGURATION_DELAY', default=5)
+
+# Number of seconds before a failed scheduled load balancer reconfiguration is retried
+LOAD_BALANCER_RECONFIGURATION_RETRY_DELAY = env.int('LOAD_BALANCER_RECONFIGURATION_RETRY_DELAY', default=60)
+
+# Number of seconds after backend changes were applied through the haproxy runtime API, before the playbook
+# writes them to the configuration files of the load balancer
+LOAD_BALANCER_CONFIGURATION_FILES_DELAY = env.int('LOAD_BALANCER_CONFIGURATION_FILES_DELAY', default=60)
+
 # AWS #########################################################################
 
 # Must be set if `INSTANCE_STORAGE_TYPE = 's3'`.
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# OpenCraft -- tools to aid developing and hosting free software projects
+# Copyright (C) 2015-2019 OpenCraft <contact@opencraft.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Ansible callback plugin - Task timing events
+
+Writes a JSON object per line for each task result - with the task name, host, status and duration
+in seconds - to the file descriptor given by the OPENCRAFT_TASK_EVENTS_FD environment variable.
+
+This runs inside the Ansible virtualenv, so it must stay compatible with Python 2.
+"""
+# pylint: skip-file
+
+# Imports #####################################################################
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+
+# Classes #####################################################################
+
+class CallbackModule(CallbackBase):
+    """
+    Emit the timing of each task result as JSON lines
+    """
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'opencraft_task_timing'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.task_start_times = {}
+        events_fd = os.environ.get('OPENCRAFT_TASK_EVENTS_FD')
+        self.events_file = os.fdopen(int(events_fd), 'w') if events_fd else None
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_start_times[task._uuid] = time.time()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.task_start_times[task._uuid] = time.time()
+
+    def emit(self, result, status):
+        """
+        Write the event of the given task result
+        """
+        if self.events_file is None:
+            return
+        task = result._task
+        start_time = self.task_start_times.get(task._uuid)
+        event = {
+            'task': task.get_name(),
+            'host': result._host.get_name(),
+            'status': status,
+            'duration': round(time.time() - start_time, 3) if start_time is not None else None,
+        }
+        self.events_file.write(json.dumps(event) + '\n')
+        self.events_file.flush()
+
+    def v2_runner_on_ok(self, result):
+        self.emit(result, 'changed' if result._result.get('changed') else 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.emit(result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self.emit(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self.emit(result, 'unreachable')